@@ -0,0 +1,191 @@
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENDPOINTS = ["/world", "/maze", "/npc_quiz", "/npc_quiz_result", "/end_game"]
+
+
+# 사용 예 (네트워크 없이, 가짜 LLM/이미지로 서버를 직접 띄움):
+#   python benchmarks/bench_game.py --workers 2 --levels 1 8 32 128 --games 2 --time-scale 0.05
+# 이미 떠 있는 서버(LLM_PROVIDER=mock 권장)를 측정하려면 --url http://127.0.0.1:8000
+def start_server(args, tmp: str) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({
+        "LLM_PROVIDER": "mock",
+        "MOCK_TIME_SCALE": str(args.time_scale),
+        "MOCK_MALFORMED_RATE": str(args.malformed_rate),
+        "MOCK_ERROR_RATE": str(args.error_rate),
+        "MOCK_SEED": str(args.seed),
+        "GOVERNOR_WORKERS": str(args.workers),
+        "SESSION_DB_PATH": os.path.join(tmp, "sessions.db"),
+        "WORLD_POOL_DB_PATH": os.path.join(tmp, "world_pool.db"),
+        "WORLD_POOL_SETTINGS": "",
+        "CACHE_BACKEND": "memory",
+    })
+    if not args.keep_limits:
+        # 가짜 백엔드는 분당 한도가 없으므로 거버너가 병목이 되지 않게 한다
+        env.update({"LLM_RPM": "1000000000", "LLM_TPM": "1000000000", "IMAGE_RPM": "1000000000",
+                    "LLM_QUEUE_LIMIT": "1000000"})
+    return subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-w", str(args.workers), "-k", "uvicorn.workers.UvicornWorker",
+         "-b", f"127.0.0.1:{args.port}", "--chdir", ROOT, "main:app"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+async def wait_ready(client: httpx.AsyncClient, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/cache/stats")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("서버가 시작되지 않았습니다")
+
+
+def worker_rss(master_pid: int) -> dict:
+    # ps는 Linux/macOS 모두에 있으므로 별도 의존성 없이 워커별 RSS(MB)를 읽는다
+    out = subprocess.run(["ps", "-A", "-o", "pid=,ppid=,rss="], capture_output=True, text=True).stdout
+    rss = {}
+    for line in out.splitlines():
+        pid, ppid, kb = (int(v) for v in line.split())
+        if ppid == master_pid:
+            rss[pid] = kb / 1024
+    return rss
+
+
+async def sample_memory(master_pid: int, peak: dict, stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        for pid, mb in worker_rss(master_pid).items():
+            peak[pid] = max(peak.get(pid, 0.0), mb)
+        try:
+            await asyncio.wait_for(stop.wait(), 0.5)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def timed(client, latencies, errors, endpoint, method, **kwargs):
+    start = time.perf_counter()
+    try:
+        response = await client.request(method, endpoint, **kwargs)
+    except httpx.HTTPError as e:
+        errors[endpoint].append(repr(e))
+        return None
+    latencies[endpoint].append((time.perf_counter() - start) * 1000)
+    if response.status_code != 200:
+        errors[endpoint].append(f"{response.status_code} {response.text[:80]}")
+        return None
+    return response.json()
+
+
+async def play(client, player: int, games: int, rng: random.Random, latencies, errors) -> int:
+    # /world → /maze → NPC 수만큼 (/npc_quiz + /npc_quiz_result) → /end_game
+    finished = 0
+    for game in range(games):
+        world = await timed(client, latencies, errors, "/world", "POST", json={
+            "name": f"플레이어{player}", "location": f"장소{player}-{game}-{rng.randrange(10**6)}",
+            "mood": rng.choice(["밝은", "으스스한", "신비로운"]),
+        })
+        if world is None:
+            continue
+        headers = {"X-Session-Id": world["sessionId"]}
+        maze = await timed(client, latencies, errors, "/maze", "POST", headers=headers)
+        if maze is None:
+            continue
+        ok = True
+        for _ in range(maze["npcCnt"]):
+            if await timed(client, latencies, errors, "/npc_quiz", "GET", headers=headers) is None:
+                ok = False
+                break
+            if await timed(client, latencies, errors, "/npc_quiz_result", "POST", headers=headers,
+                           json={"answer": str(rng.randint(1, 3))}) is None:
+                ok = False
+                break
+        if ok and await timed(client, latencies, errors, "/end_game", "GET", headers=headers) is not None:
+            finished += 1
+    return finished
+
+
+def pick(values, q):
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+async def run_level(client, level: int, args, master_pid) -> None:
+    latencies, errors = defaultdict(list), defaultdict(list)
+    peak = {}
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_memory(master_pid, peak, stop)) if master_pid else None
+
+    start = time.perf_counter()
+    done = await asyncio.gather(*(
+        play(client, i, args.games, random.Random(f"{args.seed}:{level}:{i}"), latencies, errors)
+        for i in range(level)
+    ))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    if sampler is not None:
+        await sampler
+
+    requests = sum(len(v) for v in latencies.values())
+    error_count = sum(len(v) for v in errors.values())
+    print(f"\n== concurrency {level}: {sum(done)}/{level * args.games} games in {elapsed:.1f}s"
+          f"  {sum(done) / elapsed:.2f} games/s  {requests / elapsed:.1f} req/s  errors {error_count}")
+    print(f"{'endpoint':<18} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for endpoint in ENDPOINTS:
+        values = sorted(latencies[endpoint])
+        print(f"{endpoint:<18} {len(values):>6} {pick(values, 0.5):>9.1f} {pick(values, 0.95):>9.1f}"
+              f" {pick(values, 0.99):>9.1f}")
+    if peak:
+        print("worker peak RSS MB: " + "  ".join(f"{pid}={mb:.0f}" for pid, mb in sorted(peak.items())))
+    for endpoint, items in errors.items():
+        print(f"  {endpoint} first error: {items[0]}")
+
+
+async def run(args):
+    server = None
+    url = args.url
+    with tempfile.TemporaryDirectory() as tmp:
+        if url is None:
+            server = start_server(args, tmp)
+            url = f"http://127.0.0.1:{args.port}"
+        limits = httpx.Limits(max_connections=max(args.levels), max_keepalive_connections=max(args.levels))
+        try:
+            async with httpx.AsyncClient(base_url=url, limits=limits, timeout=args.timeout) as client:
+                await wait_ready(client)
+                for level in args.levels:
+                    await run_level(client, level, args, server.pid if server else None)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="게임 전체 흐름 부하 테스트 (가짜 LLM/이미지 백엔드)")
+    parser.add_argument("--url", default=None, help="이미 실행 중인 서버 주소 (없으면 직접 띄움)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--games", type=int, default=2, help="동시 플레이어 한 명당 게임 수")
+    parser.add_argument("--time-scale", type=float, default=0.05, help="가짜 LLM 지연 배율")
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--keep-limits", action="store_true", help="거버너의 분당 한도를 그대로 사용")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from maze_engine import DIRECTIONS, MazeEngine, visible_cells
+from maze_generator import ALGORITHMS, WALL, bfs_distances, generate_maze
+
+
+def bench_view(maze, radius: int, steps: int) -> tuple:
+    # 무작위로 걸으면서 이동마다 시야 계산 + 처음 보는 칸 고르기에 걸린 시간 (µs: 평균, p99, 최대)
+    engine = MazeEngine(maze)
+    seen = bytearray(engine.height * engine.width)
+    rng = random.Random(0)
+    pos = maze.user_pos
+    times = []
+    for _ in range(steps):
+        moves = [(pos[0] + dr, pos[1] + dc) for dr, dc in DIRECTIONS if engine.is_open((pos[0] + dr, pos[1] + dc))]
+        pos = rng.choice(moves)
+        start = time.perf_counter()
+        revealed = [i for i in visible_cells(engine.walls, engine.height, engine.width, pos, radius) if not seen[i]]
+        for i in revealed:
+            seen[i] = 1
+        times.append((time.perf_counter() - start) * 1e6)
+    times.sort()
+    return statistics.fmean(times), times[int(len(times) * 0.99)], times[-1]
+
+
+# 사용 예: python benchmarks/bench_maze.py --sizes 11 51 101 201 --repeat 20
+#         python benchmarks/bench_maze.py --sizes 201 --view-radius 7   (시야 계산 비용도 함께)
+def main():
+    parser = argparse.ArgumentParser(description="미로 생성 알고리즘별 처리량 측정")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[11, 51, 101, 201])
+    parser.add_argument("--algorithms", nargs="+", default=list(ALGORITHMS))
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--npc", type=int, default=3)
+    parser.add_argument("--view-radius", type=int, default=0, help="0보다 크면 이동당 시야 계산 시간도 측정")
+    parser.add_argument("--steps", type=int, default=5000)
+    args = parser.parse_args()
+
+    print(f"{'algorithm':<12} {'size':>9} {'mean ms':>9} {'p95 ms':>9} {'mazes/s':>9}  solvable")
+    for algorithm in args.algorithms:
+        for size in args.sizes:
+            times = []
+            for seed in range(args.repeat):
+                start = time.perf_counter()
+                maze = generate_maze(size, size, args.npc, seed, algorithm)
+                times.append((time.perf_counter() - start) * 1000)
+
+            # 마지막 미로로 모든 통로가 연결되어 있는지 확인
+            open_mask = maze.grid != WALL
+            dist = bfs_distances(open_mask, maze.user_pos)
+            solvable = bool((dist[open_mask] >= 0).all()) and dist[maze.exit_pos] == maze.path_length
+
+            times.sort()
+            mean = statistics.fmean(times)
+            p95 = times[min(len(times) - 1, int(len(times) * 0.95))]
+            print(f"{algorithm:<12} {f'{size}x{size}':>9} {mean:>9.2f} {p95:>9.2f} {1000 / mean:>9.1f}  {solvable}")
+            if args.view_radius > 0:
+                view_mean, view_p99, view_max = bench_view(maze, args.view_radius, args.steps)
+                print(f"{'':<12} {'view':>9} mean {view_mean:.1f} µs, p99 {view_p99:.1f} µs, max {view_max:.1f} µs"
+                      f" per move (radius {args.view_radius})")
+
+
+if __name__ == "__main__":
+    main()
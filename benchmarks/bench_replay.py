@@ -0,0 +1,119 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sqlite3
+import sys
+import time
+import zlib
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_game import ENDPOINTS, pick, timed
+
+
+# 기록 (운영 서버 또는 가짜 백엔드):
+#   LLM_RECORD_PATH=/tmp/trace.db python benchmarks/bench_game.py --levels 8 --games 5
+# 재생 (네트워크/서버 프로세스 없이 앱을 직접 호출):
+#   python benchmarks/bench_replay.py /tmp/trace.db --concurrency 64 --repeat 20 --time-scale 0
+def recorded_worlds(path: str) -> list:
+    # 세계관 호출의 입력(장소/분위기/이름)이 곧 기록된 게임 하나
+    conn = sqlite3.connect(path)
+    try:
+        rows = conn.execute("SELECT body FROM calls WHERE kind = 'story' AND body IS NOT NULL ORDER BY id").fetchall()
+    finally:
+        conn.close()
+    worlds = []
+    for (body,) in rows:
+        text = json.loads(zlib.decompress(body))["input"]
+        fields = dict(re.findall(r"^(장소|분위기|플레이어 이름): (.*)$", text, re.M))
+        if "장소" in fields:
+            worlds.append({"name": fields.get("플레이어 이름", "플레이어"), "location": fields["장소"],
+                           "mood": fields.get("분위기", "")})
+    return worlds
+
+
+async def play(client, world: dict, rng: random.Random, latencies, errors) -> bool:
+    data = await timed(client, latencies, errors, "/world", "POST", json=world)
+    if data is None:
+        return False
+    headers = {"X-Session-Id": data["sessionId"]}
+    maze = await timed(client, latencies, errors, "/maze", "POST", headers=headers)
+    if maze is None:
+        return False
+    for _ in range(maze["npcCnt"]):
+        if await timed(client, latencies, errors, "/npc_quiz", "GET", headers=headers) is None:
+            return False
+        if await timed(client, latencies, errors, "/npc_quiz_result", "POST", headers=headers,
+                       json={"answer": str(rng.randint(1, 3))}) is None:
+            return False
+    return await timed(client, latencies, errors, "/end_game", "GET", headers=headers) is not None
+
+
+async def run(args):
+    import httpx
+    import main
+    from llm_trace import replay_trace
+
+    worlds = recorded_worlds(args.trace)
+    if not worlds:
+        raise SystemExit("트레이스에 기록된 게임(세계관 호출)이 없습니다")
+    games = [worlds[i % len(worlds)] for i in range(len(worlds) * args.repeat)]
+    latencies, errors = defaultdict(list), defaultdict(list)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one(i, world):
+        async with semaphore:
+            return await play(client, world, random.Random(f"{args.seed}:{i}"), latencies, errors)
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://replay", timeout=args.timeout) as client:
+        start = time.perf_counter()
+        done = await asyncio.gather(*(one(i, world) for i, world in enumerate(games)))
+        elapsed = time.perf_counter() - start
+
+    print(f"{sum(done)}/{len(games)} games ({len(worlds)} recorded x {args.repeat}) in {elapsed:.1f}s"
+          f"  {sum(done) / elapsed * 60:.0f} games/min  concurrency {args.concurrency}"
+          f"  time scale {args.time_scale}")
+    print(f"{'endpoint':<18} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for endpoint in ENDPOINTS:
+        values = sorted(latencies[endpoint])
+        print(f"{endpoint:<18} {len(values):>6} {pick(values, 0.5):>9.1f} {pick(values, 0.95):>9.1f}"
+              f" {pick(values, 0.99):>9.1f}")
+    print("trace:", replay_trace().stats())
+    for endpoint, items in errors.items():
+        print(f"  {endpoint} errors {len(items)}, first: {items[0]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="기록한 LLM/이미지 응답으로 게임 전체 흐름 재생")
+    parser.add_argument("trace", help="LLM_RECORD_PATH로 기록한 트레이스 파일")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--repeat", type=int, default=1, help="기록된 게임을 몇 번씩 재생할지")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="기록된 지연 배율 (0 = 기다리지 않음)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    args = parser.parse_args()
+
+    # 앱을 불러오기 전에 재생 백엔드와 측정용 설정을 고정한다
+    os.environ.update({
+        "LLM_PROVIDER": "replay",
+        "LLM_REPLAY_PATH": os.path.abspath(args.trace),
+        "REPLAY_TIME_SCALE": str(args.time_scale),
+        "SESSION_BACKEND": os.getenv("SESSION_BACKEND", "memory"),
+        "CACHE_BACKEND": "off",
+        "WORLD_POOL_SETTINGS": "",
+        "LLM_RPM": "1000000000", "LLM_TPM": "1000000000", "IMAGE_RPM": "1000000000",
+        "LLM_QUEUE_LIMIT": "1000000",
+    })
+    os.environ.pop("LLM_RECORD_PATH", None)
+    os.chdir(ROOT)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
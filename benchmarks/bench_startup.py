@@ -0,0 +1,85 @@
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 워커 시작 비용 측정: 새 인터프리터에서 `import main`에 걸리는 시간 (워커 재시작/증설 때마다 낸다)
+#   python benchmarks/bench_startup.py --runs 5 --budget 1.5
+# 예산을 넘으면 종료 코드 1 (CI에서 import 시간이 슬금슬금 늘어나는 것을 막는다)
+# --provider openai로 실제 설정과 같은 경로를 재되, 네트워크는 쓰지 않는다 (클라이언트는 처음 호출할 때 만든다)
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+\d+ \| *(\S+)$")
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import main
+print("IMPORT_SECONDS", time.perf_counter() - start)
+print("LOADED", *sorted(m for m in ("openai", "openai_clients", "langchain_community", "PIL") if m in sys.modules))
+"""
+
+
+def probe(env: dict, importtime: bool) -> tuple:
+    cmd = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", PROBE]
+    result = subprocess.run(cmd, cwd=ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr[-2000:])
+    seconds = float(re.search(r"IMPORT_SECONDS (\S+)", result.stdout).group(1))
+    loaded = re.search(r"LOADED ?(.*)", result.stdout).group(1).split()
+    return seconds, loaded, result.stderr
+
+
+def top_modules(stderr: str, limit: int) -> list:
+    # 최상위 패키지별로 자체 import 시간을 합친다
+    packages = defaultdict(int)
+    for line in stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match is None:
+            continue
+        self_us, name = match.groups()
+        packages[name.split(".")[0]] += int(self_us)
+    return sorted(packages.items(), key=lambda item: -item[1])[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="워커 import 시간 측정 및 예산 검사")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=float(os.getenv("IMPORT_TIME_BUDGET", "1.5")),
+                        help="import main 중앙값 상한 (초)")
+    parser.add_argument("--provider", default="openai", help="LLM_PROVIDER (openai/mock/replay)")
+    parser.add_argument("--top", type=int, default=12, help="오래 걸린 패키지 몇 개를 보여줄지")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.update({"LLM_PROVIDER": args.provider, "OPENAI_API_KEY": env.get("OPENAI_API_KEY", "sk-startup-probe"),
+                "PYTHONDONTWRITEBYTECODE": "1"})
+    env.pop("LLM_RECORD_PATH", None)
+
+    # 첫 실행은 .pyc 생성/디스크 캐시 때문에 느리므로 버린다
+    probe(env, importtime=False)
+    samples, loaded = [], []
+    for _ in range(args.runs):
+        seconds, loaded, _ = probe(env, importtime=False)
+        samples.append(seconds)
+    median = statistics.median(samples)
+    print(f"import main ({args.provider}): median {median * 1000:.0f} ms, min {min(samples) * 1000:.0f} ms,"
+          f" max {max(samples) * 1000:.0f} ms over {args.runs} runs, budget {args.budget * 1000:.0f} ms")
+    # 처음 쓸 때 불러와야 하는 무거운 모듈이 import 시점에 올라오면 알린다
+    print("eagerly loaded:", ", ".join(loaded) or "-")
+
+    _, _, stderr = probe(env, importtime=True)
+    print(f"{'package':<24} {'self ms':>9}")
+    for name, micros in top_modules(stderr, args.top):
+        print(f"{name:<24} {micros / 1000:>9.1f}")
+
+    if median > args.budget:
+        print("import 시간이 예산을 넘었습니다")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
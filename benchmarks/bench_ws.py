@@ -0,0 +1,56 @@
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import websockets
+
+
+# 사용 예 (서버 실행 후): python benchmarks/bench_ws.py --url ws://127.0.0.1:8000/ws/game --connections 5000
+async def hold(url: str, rounds: int, opened: asyncio.Event, latencies: list, errors: list):
+    try:
+        async with websockets.connect(url, open_timeout=60) as ws:
+            await opened.wait()
+            for _ in range(rounds):
+                start = time.perf_counter()
+                await ws.send(json.dumps({"type": "ping"}))
+                await ws.recv()
+                latencies.append((time.perf_counter() - start) * 1000)
+    except Exception as e:
+        errors.append(repr(e))
+
+
+async def run(args):
+    opened = asyncio.Event()
+    latencies, errors = [], []
+    start = time.perf_counter()
+    tasks = []
+    for i in range(args.connections):
+        tasks.append(asyncio.create_task(hold(args.url, args.rounds, opened, latencies, errors)))
+        if i % 200 == 199:
+            await asyncio.sleep(0.05)   # 접속 폭주로 backlog가 넘치지 않게 조금씩 연다
+    await asyncio.sleep(args.settle)
+    print(f"opened {args.connections} connections in {time.perf_counter() - start:.1f}s")
+    opened.set()
+    await asyncio.gather(*tasks)
+
+    latencies.sort()
+    if latencies:
+        pick = lambda q: latencies[min(len(latencies) - 1, int(len(latencies) * q))]
+        print(f"round trips {len(latencies)}  mean {statistics.fmean(latencies):.2f} ms"
+              f"  p50 {pick(0.5):.2f}  p95 {pick(0.95):.2f}  p99 {pick(0.99):.2f}")
+    print(f"errors {len(errors)}" + (f"  first: {errors[0]}" if errors else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/ws/game 동시 접속 측정")
+    parser.add_argument("--url", default="ws://127.0.0.1:8000/ws/game")
+    parser.add_argument("--connections", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--settle", type=float, default=2.0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
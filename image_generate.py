@@ -1,23 +1,47 @@
 import os
-from openai import OpenAI
-from dotenv import load_dotenv
-load_dotenv()
 
-client = OpenAI()
+from image_store import store_image
+from llm_governor import GovernorOverloaded, image_governor
+from metrics import Histogram, timed
+from providers import image_provider
+from response_cache import cache_key, response_cache
 
-def generate_image(prompt: str, n: int = 1, size: str = "1024x1024") -> str:
+# DALL·E 이미지 URL은 약 1시간 뒤 만료되므로 캐시 TTL을 짧게 유지
+IMAGE_CACHE_TTL = float(os.getenv("IMAGE_CACHE_TTL", "3000"))
+# 로컬에 저장한 이미지는 만료되지 않으므로 오래 재사용
+IMAGE_STORED_CACHE_TTL = float(os.getenv("IMAGE_STORED_CACHE_TTL", str(7 * 86400)))
+
+IMAGE_LATENCY = Histogram("image_call_duration_seconds", "이미지 생성 호출 시간 (거버너 대기 제외)", ("outcome",))
+
+def build_image_prompt(location: str, mood: str) -> str:
+    return (
+        f"The location is {location} and the mood is {mood}. Create a pixel-style image related to this location and mood."
+    )
+
+async def generate_image(prompt: str, n: int = 1, size: str = "1024x1024") -> str:
+    key = cache_key("image", prompt, size)
+    cached_url = response_cache.get(key)
+    if cached_url is not None:
+        return cached_url
     try:
-        # 이미지 생성 요청
-        response = client.images.generate(
-            model = "dall-e-3",
-            prompt = prompt,
-            n=n,
-            size=size
-        )
-        # 응답에서 첫 번째 이미지의 URL 추출
-        image_url = response.data[0].url
-        #image_url = response['data'][0]['url']
+        # 이미지 생성 요청 (분당 이미지 한도를 넘지 않도록 거버너를 거친다)
+        await image_governor.acquire()
+        image_governor.in_flight += 1
+        try:
+            with timed(IMAGE_LATENCY):
+                image_url = await image_provider.generate(prompt, n=n, size=size)
+        finally:
+            image_governor.in_flight -= 1
+        # 임시 URL을 한 번 내려받아 로컬에 저장 (실패하면 제공자 URL을 그대로 사용)
+        stored_url = await store_image(image_url)
+        if stored_url is not None:
+            response_cache.put(key, stored_url, ttl=IMAGE_STORED_CACHE_TTL)
+            return stored_url
+        response_cache.put(key, image_url, ttl=IMAGE_CACHE_TTL)
         return image_url
+    except GovernorOverloaded:
+        # 이미지 한도 초과는 다른 엔드포인트와 같은 503 경로로 보낸다 (빈 이미지로 삼키지 않음)
+        raise
     except Exception as e:
         print("이미지 생성 중 오류 발생:", e)
-        return ""
\ No newline at end of file
+        return ""
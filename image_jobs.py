@@ -0,0 +1,57 @@
+import asyncio
+import json
+import os
+from typing import Dict, Optional
+
+from image_generate import generate_image
+from llm_governor import GovernorOverloaded
+from session_store import SessionStore, new_session_id
+
+# 결과는 세션 저장소에 기록되므로 다른 워커에서도 조회 가능
+IMAGE_JOB_TTL = float(os.getenv("IMAGE_JOB_TTL", "3600"))
+
+# 실행 중인 작업이 GC 되지 않도록 참조 유지 (작업 ID → 태스크, 취소할 때도 사용)
+_running: Dict[str, asyncio.Task] = {}
+
+
+def _job_key(job_id: str) -> str:
+    return f"image_job:{job_id}"
+
+
+def _write(store: SessionStore, job_id: str, status: str, image: str = "", retry_after: float = 0.0) -> None:
+    data = json.dumps({"status": status, "image": image, "retryAfter": retry_after}).encode("utf-8")
+    store.save_raw(_job_key(job_id), data, ttl=IMAGE_JOB_TTL)
+
+
+async def _run(store: SessionStore, job_id: str, prompt: str, size: str) -> None:
+    try:
+        image_url = await generate_image(prompt, size=size)
+    except GovernorOverloaded as e:
+        # 조회할 때 다른 엔드포인트와 같은 503(Retry-After)으로 돌려준다
+        _write(store, job_id, "overloaded", retry_after=e.retry_after)
+        return
+    _write(store, job_id, "done" if image_url else "failed", image_url)
+
+
+def start_image_job(store: SessionStore, prompt: str, size: str = "1024x1024") -> str:
+    job_id = new_session_id()
+    _write(store, job_id, "pending")
+    task = asyncio.create_task(_run(store, job_id, prompt, size))
+    _running[job_id] = task
+    task.add_done_callback(lambda _: _running.pop(job_id, None))
+    return job_id
+
+
+def cancel_image_job(store: SessionStore, job_id: str) -> None:
+    # 세계관 생성이 실패해 세션이 없으면 아무도 조회하지 않으므로 이미지 생성(과금)을 멈추고 기록도 지운다
+    task = _running.pop(job_id, None)
+    if task is not None:
+        task.cancel()
+    store.delete(_job_key(job_id))
+
+
+def get_image_job(store: SessionStore, job_id: str) -> Optional[dict]:
+    data = store.load_raw(_job_key(job_id))
+    if data is None:
+        return None
+    return json.loads(data)
@@ -0,0 +1,227 @@
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+import httpx
+from PIL import Image
+
+from metrics import Histogram, timed
+
+# -------------------------
+# 1) 설정
+# -------------------------
+# 제공자가 준 임시 URL(DALL·E는 약 1시간 뒤 만료)을 한 번만 받아 내용 해시 이름으로 로컬 디스크에 저장하고,
+# 작은 WebP 변형을 만들어 /images/{digest}/{variant}로 직접 제공한다 (같은 이미지는 한 번만 저장)
+IMAGE_STORE_DIR = os.getenv("IMAGE_STORE_DIR", "images")
+# off면 저장하지 않고 제공자 URL을 그대로 돌려준다
+IMAGE_STORE = os.getenv("IMAGE_STORE", "on") == "on"
+# 클라이언트에 돌려줄 주소 앞부분 (예: https://api.example.com, CDN을 앞에 두면 그 주소)
+# 비워 두면 "/images/..."로 저장해 두고 응답할 때 요청이 들어온 주소(request.base_url)를 붙인다
+# (프록시 뒤라면 uvicorn/gunicorn의 --forwarded-allow-ips로 X-Forwarded-Proto/Host를 믿게 해야 한다)
+IMAGE_PUBLIC_BASE_URL = os.getenv("IMAGE_PUBLIC_BASE_URL", "").rstrip("/")
+if IMAGE_PUBLIC_BASE_URL and urlsplit(IMAGE_PUBLIC_BASE_URL).scheme not in ("http", "https"):
+    raise ValueError(f"IMAGE_PUBLIC_BASE_URL은 http(s)://로 시작하는 절대 주소여야 합니다: {IMAGE_PUBLIC_BASE_URL}")
+IMAGE_DOWNLOAD_TIMEOUT = float(os.getenv("IMAGE_DOWNLOAD_TIMEOUT", "30"))
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(20 * 1024 * 1024)))
+# 변형 생성용 프로세스 수 (리사이즈/인코딩은 CPU 작업이라 이벤트 루프 밖에서)
+IMAGE_POOL_WORKERS = int(os.getenv("IMAGE_POOL_WORKERS", "2"))
+IMAGE_WEBP_QUALITY = int(os.getenv("IMAGE_WEBP_QUALITY", "80"))
+
+# 변형 이름 → 긴 변 최대 픽셀 (None = 원본 크기 그대로 WebP로)
+IMAGE_VARIANTS: Dict[str, Optional[int]] = {
+    "full": None,
+    "medium": 512,
+    "thumb": 128,
+}
+# 클라이언트에 기본으로 돌려줄 변형 (없으면 원본)
+IMAGE_DEFAULT_VARIANT = os.getenv("IMAGE_DEFAULT_VARIANT", "full")
+
+# 파일 내용이 이름(해시)으로 고정되므로 한 번 받은 것은 다시 확인할 필요가 없다
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+LOCAL_IMAGE_RE = re.compile(r"/images/([0-9a-f]{64})/[a-z]+$")
+
+IMAGE_STORE_LATENCY = Histogram("image_store_duration_seconds", "이미지 내려받기/변형 생성 시간",
+                                ("step", "outcome"))
+
+
+def image_dir(digest: str) -> str:
+    # 한 디렉터리에 파일이 너무 많아지지 않게 앞 두 글자로 나눈다
+    return os.path.join(IMAGE_STORE_DIR, digest[:2])
+
+
+def image_file(digest: str, variant: str) -> str:
+    if variant == "original":
+        return os.path.join(image_dir(digest), f"{digest}.orig")
+    return os.path.join(image_dir(digest), f"{digest}.{variant}.webp")
+
+
+def image_url(digest: str, variant: str) -> str:
+    return f"{IMAGE_PUBLIC_BASE_URL}/images/{digest}/{variant}"
+
+
+def is_local_image(url: str) -> bool:
+    return url.startswith(f"{IMAGE_PUBLIC_BASE_URL}/images/")
+
+
+def public_image_url(url: str, base_url: str) -> str:
+    # 상대 경로로 저장된 로컬 이미지에 요청 주소를 붙인다 (다른 출처의 클라이언트도 바로 쓸 수 있게)
+    if not url.startswith("/images/"):
+        return url
+    parts = urlsplit(base_url)
+    # WebSocket 요청의 base_url은 ws(s)://
+    scheme = {"ws": "http", "wss": "https"}.get(parts.scheme, parts.scheme)
+    return f"{scheme}://{parts.netloc}{parts.path.rstrip('/')}{url}"
+
+
+def public_image_variants(url: str, base_url: str) -> Dict[str, str]:
+    # 로컬에 저장된 이미지면 만들어 둔 변형(full/medium/thumb)의 주소를 모두 돌려준다 (제공자 URL이면 빈 dict)
+    match = LOCAL_IMAGE_RE.search(url) if url.startswith("/images/") or is_local_image(url) else None
+    if not match:
+        return {}
+    digest = match.group(1)
+    return {
+        variant: public_image_url(url[:match.start()] + f"/images/{digest}/{variant}", base_url)
+        for variant in IMAGE_VARIANTS
+        if stored_image_path(digest, variant)
+    }
+
+
+@lru_cache(maxsize=4096)
+def sniff_media_type(path: str) -> str:
+    with open(path, "rb") as f:
+        head = f.read(12)
+    if head.startswith(b"\x89PNG"):
+        return "image/png"
+    if head.startswith(b"\xff\xd8"):
+        return "image/jpeg"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    # 다른 워커가 같은 이미지를 동시에 저장해도 반쯤 쓴 파일이 보이지 않게 한다
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+# -------------------------
+# 2) 변형 생성 (프로세스 풀에서 실행)
+# -------------------------
+def build_variants(digest: str) -> List[str]:
+    built = []
+    with Image.open(image_file(digest, "original")) as source:
+        source.load()
+        image = source.convert("RGBA" if "A" in source.getbands() else "RGB")
+    for variant, max_side in IMAGE_VARIANTS.items():
+        path = image_file(digest, variant)
+        if not os.path.exists(path):
+            resized = image
+            if max_side is not None and max(image.size) > max_side:
+                resized = image.copy()
+                resized.thumbnail((max_side, max_side), Image.LANCZOS)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            resized.save(tmp, "WEBP", quality=IMAGE_WEBP_QUALITY, method=4)
+            os.replace(tmp, path)
+        built.append(variant)
+    return built
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def variant_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # 이벤트 루프/스레드가 도는 워커를 fork하지 않도록 spawn으로 띄운다
+        _pool = ProcessPoolExecutor(max_workers=IMAGE_POOL_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+# -------------------------
+# 3) 내려받기 + 저장
+# -------------------------
+_client: Optional[httpx.AsyncClient] = None
+
+
+def download_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(timeout=httpx.Timeout(IMAGE_DOWNLOAD_TIMEOUT, connect=10.0),
+                                    follow_redirects=True)
+    return _client
+
+
+def storable(url: str) -> bool:
+    # .invalid는 절대 존재하지 않는 예약 도메인 (가짜 백엔드의 이미지 URL)
+    parts = urlsplit(url)
+    return parts.scheme in ("http", "https") and not (parts.hostname or "").endswith(".invalid")
+
+
+async def download(url: str) -> bytes:
+    chunks, size = [], 0
+    async with download_client().stream("GET", url) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_bytes():
+            size += len(chunk)
+            if size > IMAGE_MAX_BYTES:
+                raise ValueError(f"이미지가 너무 큽니다 ({size} bytes 초과)")
+            chunks.append(chunk)
+    return b"".join(chunks)
+
+
+async def store_image(url: str) -> Optional[str]:
+    # 로컬 URL을 돌려주고, 저장할 수 없으면 None (호출한 쪽은 제공자 URL을 그대로 쓴다)
+    if not IMAGE_STORE or not url or not storable(url):
+        return None
+    try:
+        with timed(IMAGE_STORE_LATENCY, ("download",)):
+            data = await download(url)
+    except Exception as e:
+        print("이미지 내려받기 중 오류 발생:", e)
+        return None
+
+    digest = hashlib.sha256(data).hexdigest()
+    original = image_file(digest, "original")
+    if not os.path.exists(original):
+        await asyncio.to_thread(_write_atomic, original, data)
+
+    variant = "original"
+    if IMAGE_DEFAULT_VARIANT in IMAGE_VARIANTS:
+        try:
+            with timed(IMAGE_STORE_LATENCY, ("variants",)):
+                built = await asyncio.get_running_loop().run_in_executor(variant_pool(), build_variants, digest)
+            if IMAGE_DEFAULT_VARIANT in built:
+                variant = IMAGE_DEFAULT_VARIANT
+        except Exception as e:
+            print("이미지 변형 생성 중 오류 발생:", e)
+    return image_url(digest, variant)
+
+
+def stored_image_path(digest: str, variant: str) -> Optional[str]:
+    # 경로 조작을 막기 위해 해시/변형 이름을 검사한 뒤 실제 파일이 있을 때만 돌려준다
+    if not DIGEST_RE.match(digest) or (variant != "original" and variant not in IMAGE_VARIANTS):
+        return None
+    path = image_file(digest, variant)
+    return path if os.path.exists(path) else None
+
+
+async def close_image_store() -> None:
+    global _client, _pool
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
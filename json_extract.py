@@ -0,0 +1,270 @@
+import json
+from collections import defaultdict
+from typing import Any, Optional, Type, TypeVar
+
+from pydantic import BaseModel, ValidationError
+
+# -------------------------
+# LLM 응답에서 JSON 꺼내기
+# -------------------------
+# 1) 앞뒤 설명문/코드 블록을 잘라낸 뒤 json.loads (대부분 여기서 끝)
+# 2) 실패하면 한 번만 훑으면서 흔한 결함을 고친 뒤 다시 json.loads
+#    - 빠진 쉼표 (줄바꿈 뒤 또는 같은 줄의 "x" "b": …), 끝에 남은 쉼표, // 주석
+#    - 문자열 안의 줄바꿈/탭, 이스케이프 안 된 따옴표
+#    - 따옴표 없는 키 / 여는 따옴표가 빠진 값 ("background": 스토리의…")
+#    - True/False/None, 잘린 응답(열린 문자열/괄호 닫기)
+# 실패하면 json.JSONDecodeError를 그대로 올리므로 기존 예외 처리와 호환된다.
+
+_counters = defaultdict(lambda: {"ok": 0, "repaired": 0, "failed": 0, "invalid": 0})
+
+_LITERALS = {"true": "true", "false": "false", "null": "null",
+             "True": "true", "False": "false", "None": "null"}
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def _slice(text: str) -> Optional[str]:
+    start = -1
+    for i, ch in enumerate(text):
+        if ch == "{" or ch == "[":
+            start = i
+            break
+    if start < 0:
+        return None
+    end = max(text.rfind("}"), text.rfind("]"))
+    return text[start:end + 1] if end > start else text[start:]
+
+
+def _skip_spaces(text: str, j: int) -> int:
+    while j < len(text) and text[j] in " \t\r\n":
+        j += 1
+    return j
+
+
+def _closes_string(text: str, i: int) -> bool:
+    # i 위치의 따옴표가 문자열의 끝인지: 뒤에 , : } ] 또는 줄바꿈 후 다음 키가 오면 끝으로 본다
+    n = len(text)
+    j = _skip_spaces(text, i + 1)
+    if j >= n:
+        return True
+    nxt = text[j]
+    if nxt in ",:}]" or text.startswith("//", j):
+        return True
+    if nxt != '"':
+        return False
+    if "\n" in text[i + 1:j]:
+        return True
+    # 같은 줄의 "x" "b": … → 뒤따르는 문자열이 키나 항목으로 온전히 끝나면 쉼표가 빠진 것
+    k = j + 1
+    while k < n and text[k] != '"' and text[k] != "\n":
+        k += 2 if text[k] == "\\" else 1
+    if k >= n or text[k] != '"':
+        return False
+    k = _skip_spaces(text, k + 1)
+    return k >= n or text[k] in ",:}]"
+
+
+def _next_is_key(text: str, i: int) -> bool:
+    # 따옴표 없는 값 안의 쉼표: 뒤에 다음 키(따옴표)나 줄바꿈이 오면 값의 끝
+    j = i + 1
+    while j < len(text) and text[j] in " \t":
+        j += 1
+    return j >= len(text) or text[j] in '"\r\n'
+
+
+def repair_json(text: str) -> str:
+    out = []
+    stack = []
+    # 컨테이너 안에서 기대하는 것: key / colon / value / comma
+    expect = "value"
+    pending_comma = False
+    starts = [p for p in (text.find("{"), text.find("[")) if p >= 0]
+    i = min(starts) if starts else -1
+    if i < 0:
+        raise json.JSONDecodeError("JSON 시작 괄호가 없습니다", text, 0)
+    n = len(text)
+
+    def begin_item():
+        nonlocal pending_comma
+        if pending_comma:
+            out.append(",")
+            pending_comma = False
+
+    def after_value():
+        nonlocal expect
+        expect = "comma" if stack else "done"
+
+    while i < n and expect != "done":
+        ch = text[i]
+
+        if ch in " \t\r\n":
+            i += 1
+            continue
+        if text.startswith("//", i):
+            nl = text.find("\n", i)
+            i = n if nl < 0 else nl + 1
+            continue
+        if text.startswith("/*", i):
+            close = text.find("*/", i + 2)
+            i = n if close < 0 else close + 2
+            continue
+
+        if ch in "}]":
+            pending_comma = False           # 끝에 남은 쉼표 제거
+            if expect == "colon":
+                out.append(":null")
+            elif expect == "value" and out and out[-1] == ":":
+                out.append("null")
+            if stack:
+                out.append(_CLOSERS[stack.pop()])
+            i += 1
+            after_value()
+            continue
+
+        if ch == ",":
+            if expect == "comma":
+                pending_comma = True
+                expect = "key" if stack[-1] == "{" else "value"
+            i += 1
+            continue
+
+        if expect == "comma":
+            # 쉼표가 빠진 경우
+            pending_comma = True
+            expect = "key" if stack[-1] == "{" else "value"
+
+        if expect == "key":
+            begin_item()
+            if ch == '"':
+                i = _copy_string(text, i + 1, out, quoted=True)
+            else:
+                # 따옴표 없는 키
+                j = i
+                while j < n and text[j] not in ':"\n{}[],':
+                    j += 1
+                out.append(json.dumps(text[i:j].strip(), ensure_ascii=False))
+                i = j
+            expect = "colon"
+            continue
+
+        if expect == "colon":
+            if ch == ":":
+                out.append(":")
+                i += 1
+            else:
+                out.append(":")            # 콜론이 빠진 경우
+            expect = "value"
+            continue
+
+        # expect == "value"
+        begin_item()
+        if ch in "{[":
+            stack.append(ch)
+            out.append(ch)
+            expect = "key" if ch == "{" else "value"
+            i += 1
+        elif ch == '"':
+            i = _copy_string(text, i + 1, out, quoted=True)
+            after_value()
+        elif ch == "-" or ch.isdigit():
+            j = i + 1
+            while j < n and (text[j].isdigit() or text[j] in ".eE+-"):
+                j += 1
+            out.append(text[i:j])
+            i = j
+            after_value()
+        else:
+            for word, value in _LITERALS.items():
+                if text.startswith(word, i) and not (i + len(word) < n and text[i + len(word)].isalnum()):
+                    out.append(value)
+                    i += len(word)
+                    break
+            else:
+                # 여는 따옴표가 빠진 문자열 값
+                i = _copy_string(text, i, out, quoted=False)
+            after_value()
+
+    if expect == "colon":
+        out.append(":null")
+    elif expect == "value" and out and out[-1] == ":":
+        out.append("null")
+    while stack:
+        out.append(_CLOSERS[stack.pop()])
+    return "".join(out)
+
+
+def _copy_string(text: str, i: int, out: list, quoted: bool) -> int:
+    # 문자열 본문을 복사하며 제어 문자/따옴표를 이스케이프. 다음 위치를 돌려준다
+    n = len(text)
+    buf = ['"']
+    while i < n:
+        ch = text[i]
+        if ch == "\\" and i + 1 < n:
+            buf.append(text[i:i + 2])
+            i += 2
+            continue
+        if ch == '"':
+            if _closes_string(text, i):
+                i += 1
+                break
+            buf.append('\\"')
+        elif ch == "\n":
+            if not quoted:
+                break                       # 따옴표 없는 값은 줄 끝에서 끝난다
+            buf.append("\\n")
+        elif ch == "\r":
+            pass
+        elif ch == "\t":
+            buf.append("\\t")
+        elif not quoted and (ch in "}]" or (ch == "," and _next_is_key(text, i))):
+            break
+        else:
+            buf.append(ch)
+        i += 1
+    if not quoted:
+        buf[1:] = ["".join(buf[1:]).rstrip()]
+    buf.append('"')
+    out.append("".join(buf))
+    return i
+
+
+def extract_json(text: str, kind: str = "llm") -> Any:
+    counter = _counters[kind]
+    body = _slice(text or "")
+    if body is not None:
+        try:
+            value = json.loads(body)
+            counter["ok"] += 1
+            return value
+        except json.JSONDecodeError:
+            pass
+    try:
+        value = json.loads(repair_json(text or ""))
+    except json.JSONDecodeError:
+        counter["failed"] += 1
+        raise
+    counter["repaired"] += 1
+    return value
+
+
+def try_extract(text: str, kind: str = "llm") -> Optional[Any]:
+    try:
+        return extract_json(text, kind)
+    except json.JSONDecodeError:
+        return None
+
+
+M = TypeVar("M", bound=BaseModel)
+
+
+def parse_model(text: str, model: Type[M], kind: str) -> M:
+    # 스키마 검증까지 실패하면 JSONDecodeError로 통일 (호출하는 쪽의 실패 처리 재사용)
+    data = extract_json(text, kind)
+    try:
+        return model.model_validate(data)
+    except ValidationError as e:
+        _counters[kind]["invalid"] += 1
+        raise json.JSONDecodeError(f"스키마 불일치: {e.error_count()}개 오류", str(text), 0)
+
+
+def parse_stats() -> dict:
+    return {kind: dict(counter) for kind, counter in _counters.items()}
@@ -0,0 +1,66 @@
+import json
+from typing import Dict, Iterable, List, Tuple
+
+
+def _decode(raw: str) -> str:
+    try:
+        return json.loads('"' + raw + '"')
+    except json.JSONDecodeError:
+        return raw
+
+
+# -------------------------
+# 스트리밍 JSON에서 특정 문자열 필드만 먼저 꺼내기
+# -------------------------
+# 토큰이 들어올 때마다 feed()를 호출하면, 값이 완성된 필드를 (키, 값)으로 돌려준다.
+# 깊이와 상관없이 "키": "문자열" 형태만 인식하며, 이미 본 글자는 다시 스캔하지 않는다.
+class IncrementalFieldParser:
+    def __init__(self, fields: Iterable[str]):
+        self.fields = set(fields)
+        self.emitted: Dict[str, str] = {}
+        self.buf = ""
+        self.pos = 0
+        self.in_string = False
+        self.escape = False
+        self.start = 0
+        self.last_string = None   # 방금 끝난 문자열 (키 후보)
+        self.pending_key = None   # ':' 뒤 값을 기다리는 키
+
+    def feed(self, chunk: str) -> List[Tuple[str, str]]:
+        self.buf += chunk
+        out = []
+        buf = self.buf
+        for pos in range(self.pos, len(buf)):
+            ch = buf[pos]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    raw = buf[self.start:pos]
+                    if self.pending_key is not None:
+                        key = self.pending_key
+                        self.pending_key = None
+                        if key in self.fields and key not in self.emitted:
+                            value = _decode(raw)
+                            self.emitted[key] = value
+                            out.append((key, value))
+                    else:
+                        self.last_string = raw
+            elif ch == '"':
+                self.in_string = True
+                self.start = pos + 1
+            elif ch == ":" and self.last_string is not None:
+                self.pending_key = _decode(self.last_string)
+                self.last_string = None
+            elif ch in ",{}[]":
+                self.pending_key = None
+                self.last_string = None
+        self.pos = len(buf)
+        return out
+
+    @property
+    def text(self) -> str:
+        return self.buf
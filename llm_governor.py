@@ -0,0 +1,260 @@
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Optional
+
+from llm_hedge import CallRejected, clear_deadline, note_admitted, note_queued
+from metrics import Histogram, timed
+from token_budget import UsageCallback, message_text, record_usage
+
+# -------------------------
+# 1) 설정
+# -------------------------
+# OpenAI 계정 한도(분당 요청/토큰)를 워커 수로 나눠서 각 워커가 나눠 쓴다
+GOVERNOR_WORKERS = max(1, int(os.getenv("GOVERNOR_WORKERS", "1")))
+LLM_RPM = float(os.getenv("LLM_RPM", "500"))
+LLM_TPM = float(os.getenv("LLM_TPM", "30000"))
+IMAGE_RPM = float(os.getenv("IMAGE_RPM", "50"))
+# 우선순위별 대기열 길이 한도 / 대기열에서 기다리는 최대 시간 (초)
+LLM_QUEUE_LIMIT = int(os.getenv("LLM_QUEUE_LIMIT", "100"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+# 토큰 수 추정용: 응답 길이 예상치
+LLM_EXPECTED_OUTPUT_TOKENS = int(os.getenv("LLM_EXPECTED_OUTPUT_TOKENS", "600"))
+
+# 우선순위 (작을수록 먼저 처리)
+PRIORITY_QUIZ = 0       # NPC 퀴즈/채점: 플레이어가 화면 앞에서 기다림
+PRIORITY_WORLD = 1      # 세계관/이미지 생성
+PRIORITY_ENDING = 2     # 결말
+PRIORITY_PREFETCH = 3   # 퀴즈 사전 생성, 세계관 풀 채우기
+PRIORITY_NAMES = ["quiz", "world", "ending", "prefetch"]
+
+_priority: ContextVar[int] = ContextVar("llm_priority", default=PRIORITY_WORLD)
+
+LLM_LATENCY = Histogram("llm_call_duration_seconds", "LLM 호출 시간 (거버너 대기 제외)", ("kind", "outcome"))
+GOVERNOR_WAIT = Histogram("llm_governor_wait_seconds", "거버너 대기열에서 기다린 시간", ("governor", "priority"))
+
+
+def set_llm_priority(priority: int) -> None:
+    # 요청/작업마다 컨텍스트가 따로 있으므로 되돌릴 필요 없음 (create_task는 컨텍스트를 복사)
+    _priority.set(priority)
+
+
+async def _with_priority(priority: int, coro):
+    set_llm_priority(priority)
+    # 요청이 끝난 뒤에도 이어지는 작업이므로 시작한 요청의 응답 시간 예산을 물려받지 않는다
+    clear_deadline()
+    return await coro
+
+
+def run_with_priority(priority: int, coro) -> "asyncio.Task":
+    # 현재 요청의 우선순위/마감을 건드리지 않고 다른 우선순위의 백그라운드 작업으로 실행
+    return asyncio.create_task(_with_priority(priority, coro))
+
+
+class GovernorOverloaded(CallRejected):
+    def __init__(self, retry_after: float):
+        super().__init__(f"LLM 대기열이 가득 찼습니다 (retry after {retry_after:.0f}s)")
+        self.retry_after = retry_after
+
+
+# -------------------------
+# 2) 토큰 버킷
+# -------------------------
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float) -> float:
+        # amount만큼 쌓일 때까지 남은 시간 (한 번에 버킷보다 큰 요청은 가득 찰 때까지)
+        missing = min(amount, self.capacity) - self.tokens
+        return 0.0 if missing <= 0 else missing / self.rate
+
+
+# -------------------------
+# 3) 거버너: 우선순위 대기열 + 요청/토큰 버킷
+# -------------------------
+class Governor:
+    def __init__(self, name: str, rpm: float, tpm: float = 0.0,
+                 queue_limit: int = LLM_QUEUE_LIMIT, queue_timeout: float = LLM_QUEUE_TIMEOUT):
+        self.name = name
+        self.requests = TokenBucket(rpm / GOVERNOR_WORKERS)
+        self.tokens = TokenBucket(tpm / GOVERNOR_WORKERS) if tpm > 0 else None
+        self.queue_limit = queue_limit
+        self.queue_timeout = queue_timeout
+        self._heap = []
+        self._seq = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+
+        levels = len(PRIORITY_NAMES)
+        self.depth = [0] * levels
+        self.granted = [0] * levels
+        self.rejected = [0] * levels
+        self.waits = [deque(maxlen=512) for _ in range(levels)]
+        self.in_flight = 0
+
+    def _delay(self, amount: float) -> float:
+        now = time.monotonic()
+        self.requests.refill(now)
+        delay = self.requests.delay(1)
+        if self.tokens is not None:
+            self.tokens.refill(now)
+            delay = max(delay, self.tokens.delay(amount))
+        return delay
+
+    def _take(self, amount: float) -> None:
+        self.requests.tokens -= 1
+        if self.tokens is not None:
+            self.tokens.tokens -= min(amount, self.tokens.capacity)
+
+    def settle(self, estimated: float, actual: Optional[float]) -> None:
+        # 실제 사용 토큰을 알게 되면 추정치와의 차이를 반영 (음수 잔고 허용)
+        if self.tokens is not None and actual is not None:
+            self.tokens.tokens -= actual - min(estimated, self.tokens.capacity)
+
+    def retry_after(self, priority: int) -> float:
+        ahead = sum(self.depth[: priority + 1]) + 1
+        return max(1.0, math.ceil(ahead / self.requests.rate))
+
+    async def acquire(self, amount: float = 0.0) -> None:
+        priority = _priority.get()
+        start = time.monotonic()
+        # 기다리는 요청이 없고 여유가 있으면 바로 통과
+        if not self._heap and self._delay(amount) <= 0:
+            self._take(amount)
+            self._granted(priority, start)
+            return
+
+        if self.depth[priority] >= self.queue_limit:
+            self.rejected[priority] += 1
+            raise GovernorOverloaded(self.retry_after(priority))
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (priority, next(self._seq), amount, future))
+        self.depth[priority] += 1
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected[priority] += 1
+            raise GovernorOverloaded(self.retry_after(priority))
+        finally:
+            self.depth[priority] -= 1
+        self._granted(priority, start)
+
+    def _granted(self, priority: int, start: float) -> None:
+        wait = time.monotonic() - start
+        self.granted[priority] += 1
+        self.waits[priority].append(wait)
+        GOVERNOR_WAIT.observe(wait, (self.name, PRIORITY_NAMES[priority]))
+
+    async def _dispatch(self) -> None:
+        # 가장 높은 우선순위(같으면 먼저 온) 요청부터 버킷이 허락하는 대로 깨운다
+        while self._heap:
+            priority, _, amount, future = self._heap[0]
+            if future.done():   # 시간 초과 / 취소된 대기자
+                heapq.heappop(self._heap)
+                continue
+            delay = self._delay(amount)
+            if delay <= 0:
+                heapq.heappop(self._heap)
+                self._take(amount)
+                future.set_result(None)
+            else:
+                await asyncio.sleep(min(delay, 1.0))
+
+    def stats(self) -> dict:
+        def wait_stats(samples):
+            if not samples:
+                return {"count": 0, "mean_ms": 0.0, "p95_ms": 0.0}
+            ordered = sorted(samples)
+            return {
+                "count": len(ordered),
+                "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+                "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2),
+            }
+
+        self._delay(0)
+        return {
+            "in_flight": self.in_flight,
+            "requests_available": round(self.requests.tokens, 2),
+            "tokens_available": round(self.tokens.tokens, 1) if self.tokens is not None else None,
+            "queues": {
+                name: {
+                    "depth": self.depth[i],
+                    "granted": self.granted[i],
+                    "rejected": self.rejected[i],
+                    "wait": wait_stats(self.waits[i]),
+                }
+                for i, name in enumerate(PRIORITY_NAMES)
+            },
+        }
+
+
+llm_governor = Governor("llm", LLM_RPM, LLM_TPM)
+image_governor = Governor("image", IMAGE_RPM)
+
+
+# -------------------------
+# 4) LLM 래퍼
+# -------------------------
+def estimate_tokens(prompt) -> int:
+    # 한국어 위주 프롬프트는 대략 2글자당 1토큰으로 계산
+    return len(message_text(prompt)) // 2 + LLM_EXPECTED_OUTPUT_TOKENS
+
+
+class GovernedLLM:
+    # ainvoke / astream 호출 전에 거버너의 허락을 받고, 끝나면 토큰 사용량을 기록한다
+    # kind: 토큰 집계용 호출 종류 (story, quiz, followup, ending ...)
+    def __init__(self, llm, governor: Governor = llm_governor):
+        self.llm = llm
+        self.governor = governor
+
+    async def ainvoke(self, prompt, *args, kind: str = "llm", **kwargs):
+        estimated = estimate_tokens(prompt)
+        # 헤지 호출의 지연 시간 표본과 헤지 시점은 거버너를 통과한 뒤부터 잰다
+        note_queued()
+        await self.governor.acquire(estimated)
+        note_admitted()
+        self.governor.in_flight += 1
+        usage = UsageCallback()
+        config = dict(kwargs.pop("config", None) or {})
+        config["callbacks"] = list(config.get("callbacks") or []) + [usage]
+        try:
+            with timed(LLM_LATENCY, (kind,)):
+                result = await self.llm.ainvoke(prompt, *args, config=config, **kwargs)
+        finally:
+            self.governor.in_flight -= 1
+        actual = record_usage(kind, usage.usage, prompt, str(result.content))
+        self.governor.settle(estimated, actual if usage.usage else None)
+        return result
+
+    async def astream(self, prompt, *args, kind: str = "llm", **kwargs):
+        # 스트리밍 응답에는 사용량이 없으므로 받은 글자 수로 추정
+        estimated = estimate_tokens(prompt)
+        await self.governor.acquire(estimated)
+        self.governor.in_flight += 1
+        parts = []
+        try:
+            with timed(LLM_LATENCY, (kind,)):
+                async for chunk in self.llm.astream(prompt, *args, **kwargs):
+                    parts.append(str(chunk.content))
+                    yield chunk
+        finally:
+            self.governor.in_flight -= 1
+            record_usage(kind, None, prompt, "".join(parts))
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
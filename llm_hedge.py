@@ -0,0 +1,209 @@
+import asyncio
+import os
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional
+
+# -------------------------
+# 1) 설정
+# -------------------------
+# 엔드포인트별 응답 시간 예산 (초). 예산을 넘기면 LLM 대신 템플릿 응답으로 대체
+LLM_BUDGETS = {
+    "quiz": float(os.getenv("LLM_BUDGET_QUIZ", "10")),
+    "followup": float(os.getenv("LLM_BUDGET_FOLLOWUP", "6")),
+    "world": float(os.getenv("LLM_BUDGET_WORLD", "40")),
+    "ending": float(os.getenv("LLM_BUDGET_ENDING", "20")),
+}
+# 첫 요청이 최근 지연 시간의 p90을 넘기면 같은 요청을 하나 더 보낸다
+HEDGE_QUANTILE = float(os.getenv("HEDGE_QUANTILE", "0.9"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "1.0"))
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "6.0"))   # 표본이 적을 때
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+# 헤지/재시도를 포함한 최대 요청 수
+HEDGE_MAX_ATTEMPTS = int(os.getenv("HEDGE_MAX_ATTEMPTS", "2"))
+# 첫 요청이 아직 거버너 대기열에 있을 때 통과했는지 다시 확인하는 간격 (초)
+HEDGE_POLL = 0.05
+
+_deadline: ContextVar[Optional[float]] = ContextVar("llm_deadline", default=None)
+# 호출마다 [거버너를 통과한 시각]을 담는 칸 (대기 중이면 None). GovernedLLM이 채운다
+_admission: ContextVar[Optional[list]] = ContextVar("llm_admission", default=None)
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class CallRejected(Exception):
+    # 다시 보내 봐야 같은 결과인 실패 (예: 거버너 과부하) → 헤지/재시도하지 않고 그대로 올린다
+    pass
+
+
+def set_deadline(endpoint: str) -> None:
+    # 요청마다 컨텍스트가 따로 있으므로 되돌릴 필요 없음. 백그라운드 작업은 마감 없음
+    _deadline.set(time.monotonic() + LLM_BUDGETS[endpoint])
+
+
+def clear_deadline() -> None:
+    # create_task는 시작한 요청의 컨텍스트(마감 포함)를 복사하므로 백그라운드 작업 안에서 지운다
+    _deadline.set(None)
+
+
+def remaining() -> Optional[float]:
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def note_queued() -> None:
+    admission = _admission.get()
+    if admission is not None:
+        admission[0] = None
+
+
+def note_admitted() -> None:
+    admission = _admission.get()
+    if admission is not None:
+        admission[0] = time.monotonic()
+
+
+# -------------------------
+# 2) 지연 시간 추적
+# -------------------------
+class LatencyTracker:
+    def __init__(self):
+        self.samples = deque(maxlen=256)
+        self._delay = HEDGE_DEFAULT_DELAY
+        self._dirty = 0
+
+    def record(self, seconds: float) -> None:
+        self.samples.append(seconds)
+        self._dirty += 1
+
+    def hedge_delay(self) -> float:
+        if len(self.samples) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        # 정렬은 16개 표본마다 한 번만
+        if self._dirty >= 16 or self._delay == HEDGE_DEFAULT_DELAY:
+            ordered = sorted(self.samples)
+            self._delay = max(HEDGE_MIN_DELAY, ordered[int(len(ordered) * HEDGE_QUANTILE)])
+            self._dirty = 0
+        return self._delay
+
+
+_trackers: Dict[str, LatencyTracker] = {}
+_counters = {"calls": 0, "hedges": 0, "hedge_wins": 0, "retries": 0, "deadline_exceeded": 0, "fallbacks": 0}
+
+
+def tracker_for(kind: str) -> LatencyTracker:
+    tracker = _trackers.get(kind)
+    if tracker is None:
+        tracker = _trackers[kind] = LatencyTracker()
+    return tracker
+
+
+def count_fallback() -> None:
+    _counters["fallbacks"] += 1
+
+
+def hedge_stats() -> dict:
+    return {
+        **_counters,
+        "hedge_delay_s": {kind: round(t.hedge_delay(), 3) for kind, t in _trackers.items()},
+        "budgets_s": LLM_BUDGETS,
+    }
+
+
+# -------------------------
+# 3) 헤지 호출
+# -------------------------
+async def hedged_invoke(llm, prompt, kind: str, validate: Optional[Callable[[str], bool]] = None) -> str:
+    # 마감이 없으면(백그라운드) 한 번만 호출. 마감이 있으면 p90을 넘길 때 한 번 더 보내고,
+    # 먼저 도착한 정상 응답을 사용한다. 잘못된 응답/오류는 남은 시간 안에서 바로 재시도
+    # 거버너 과부하(CallRejected)는 헤지/재시도 없이 바로 올린다
+    tracker = tracker_for(kind)
+    _counters["calls"] += 1
+    deadline = _deadline.get()
+
+    async def timed_call(admission: list):
+        # 거버너 대기 시간은 빼고 통과한 뒤의 모델 응답 시간만 기록 (거버너가 없으면 호출 시작부터)
+        admission[0] = time.monotonic()
+        token = _admission.set(admission)
+        try:
+            content = (await llm.ainvoke(prompt, kind=kind)).content
+        finally:
+            _admission.reset(token)
+        tracker.record(time.monotonic() - admission[0])
+        return content
+
+    if deadline is None:
+        return await timed_call([None])
+
+    tasks = []
+    hedges = set()
+    pending = set()
+    admissions = {}
+    last_content = None
+    last_error = None
+
+    def launch(hedge: bool = False):
+        admission = [None]
+        task = asyncio.create_task(timed_call(admission))
+        tasks.append(task)
+        pending.add(task)
+        admissions[task] = admission
+        if hedge:
+            hedges.add(task)
+
+    launch()
+    try:
+        while pending:
+            now = time.monotonic()
+            left = deadline - now
+            if left <= 0:
+                break
+            timeout = left
+            hedge_at = None
+            if len(tasks) < HEDGE_MAX_ATTEMPTS and len(pending) == 1:
+                admitted = admissions[next(iter(pending))][0]
+                if admitted is None:
+                    # 아직 거버너 대기열에 있으면 밀린 대기열에 같은 요청을 더 넣지 않는다
+                    timeout = min(left, HEDGE_POLL)
+                else:
+                    hedge_at = admitted + tracker.hedge_delay()
+                    timeout = min(left, max(0.0, hedge_at - now))
+            done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                now = time.monotonic()
+                if hedge_at is not None and hedge_at <= now < deadline:
+                    _counters["hedges"] += 1
+                    launch(hedge=True)
+                continue
+
+            for task in done:
+                pending.discard(task)
+                if task.exception() is not None:
+                    last_error = task.exception()
+                    if isinstance(last_error, CallRejected):
+                        raise last_error
+                    continue
+                content = task.result()
+                if validate is None or validate(content):
+                    if task in hedges:
+                        _counters["hedge_wins"] += 1
+                    return content
+                last_content = content
+            # 모두 실패했으면 남은 시간 안에서 재시도
+            if not pending and len(tasks) < HEDGE_MAX_ATTEMPTS:
+                _counters["retries"] += 1
+                launch()
+    finally:
+        for task in pending:
+            task.cancel()
+
+    if last_content is not None:
+        # 잘못된 응답이라도 돌려주고 호출한 쪽의 파싱 실패 처리에 맡긴다
+        return last_content
+    if pending or last_error is None:
+        _counters["deadline_exceeded"] += 1
+        raise DeadlineExceeded(f"{kind}: {LLM_BUDGETS.get(kind, 0):.0f}초 예산 초과")
+    raise last_error
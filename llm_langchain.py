@@ -1,400 +1,707 @@
-from dotenv import load_dotenv
-load_dotenv()
-
+import asyncio
+import hashlib
 import json
-import re
-from typing import List, Optional
-
-# (Deprecation 경고를 없애려면):
-# from langchain_community.chat_models import ChatOpenAI
-# from langchain_community.memory import ConversationBufferMemory
-from langchain.chat_models import ChatOpenAI
-from langchain.memory import ConversationBufferMemory
-
-from langgraph.graph import StateGraph
+import os
+from collections import deque
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Deque, List, Optional, Tuple, TypedDict
+
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import END, START, StateGraph
+
+from json_extract import parse_model
+from json_stream import IncrementalFieldParser
+from llm_governor import GovernedLLM, GovernorOverloaded
+from llm_hedge import DeadlineExceeded, count_fallback, hedged_invoke, remaining
+from metrics import Histogram, timed
+from providers import chat_model
+from prompts import (ending_messages, followup_messages, question_messages, quiz_set_messages,
+                     story_messages)
+from response_cache import PLAYER_PLACEHOLDER, cache_key, personalize, response_cache
+from token_budget import Ledger, merge, use_ledger
 
 # pydantic (2.x 기준)
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, field_validator
 
 # -------------------------
-# 1) Pydantic 모델 정의
+# 1) 게임 상태 / Pydantic 모델 정의
 # -------------------------
-class MazeState(BaseModel):
-    name : str
+# 세션에 남기는 대화 기록 줄 수 / 한 줄 최대 길이
+HISTORY_LIMIT = int(os.getenv("HISTORY_LIMIT", "8"))
+HISTORY_LINE_CHARS = int(os.getenv("HISTORY_LINE_CHARS", "200"))
+
+
+def new_history(lines=()) -> Deque[str]:
+    # 오래된 줄은 저절로 밀려나는 고정 크기 버퍼
+    return deque(lines, maxlen=HISTORY_LIMIT)
+
+
+@dataclass(slots=True)
+class MazeState:
+    # 세션마다 매 단계 저장/복원하므로 검증 없는 가벼운 객체로 둔다 (직렬화: session_store.dump_state)
+    name: str
     setting: str
     atmosphere: str
 
-    quiz : str
-    option1 : str
-    option2 : str
-    option3 : str
+    quiz: str = ""
+    option1: str = ""
+    option2: str = ""
+    option3: str = ""
 
-    num: str
+    # 마지막 채점 결과: 0 정답, 1 오답
+    num: int = 0
 
     step: str = "start"
     message: str = ""
 
-    inventory: List[str] = Field(default_factory=list)
-    history: List[str] = Field(default_factory=list)
+    # 최근 대화만 HISTORY_LIMIT 줄까지 보관 (remember 참고)
+    history: Deque[str] = field(default_factory=new_history)
+    # 게임 중 바뀌지 않는 세계관/NPC. 세션에는 story_key(내용 해시)만 저장하고
+    # 본문은 같은 세계관을 쓰는 세션끼리 한 벌만 저장/캐시한다 (session_store 참고)
     story_data: Optional[dict] = None
+    story_key: str = ""
 
     # NPC 질문 시 플레이어의 최신 선택
     player_answer: str = ""
 
+    # 지금 만나는 NPC 번호와 전체 NPC 수 (미로의 npcPos 개수와 같음)
+    npc_index: int = 0
+    npc_count: int = 3
+
+    # 퀴즈 생성 시 함께 받은 정답 번호(1~3, 0은 모름)와 NPC 반응 → 로컬 채점용
+    quiz_answer: int = 0
+    correct_reaction: str = ""
+    wrong_reaction: str = ""
+
+    # 이 게임에서 쓴 토큰: 호출 종류별 [호출 수, 입력, 출력, 캐시된 입력]
+    token_usage: Ledger = field(default_factory=dict)
+
+
+def remember(state: MazeState, line: str) -> None:
+    state.history.append(line[:HISTORY_LINE_CHARS])
+
+
+def story_digest(story_data: dict) -> str:
+    raw = json.dumps(story_data, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+
+# LLM 응답 스키마 (구조화 출력 + 파싱 후 검증에 함께 사용)
+class LLMSchema(BaseModel):
+    model_config = ConfigDict(coerce_numbers_to_str=True)
+
+
+class NpcSchema(LLMSchema):
+    name: str
+    role: str = ""
+    personality: str = ""
+
+
+class StoryDetailsSchema(LLMSchema):
+    background: str = ""
+    intro: str = ""
+    middle: str = ""
+    final: str = ""
+    result: str = ""
+
+
+class StorySchema(LLMSchema):
+    # 스트리밍 시 objective / background가 먼저 완성되도록 필드 순서를 둔다
+    objective: str = ""
+    story_details: StoryDetailsSchema = Field(default_factory=StoryDetailsSchema)
+    npcs: List[NpcSchema]
+    world_description: str = ""
+
+
+class QuizSchema(LLMSchema):
+    quiz: str
+    option1: str
+    option2: str
+    option3: str
+    answer: int = 0
+    correct_reaction: str = ""
+    wrong_reaction: str = ""
+
+    @field_validator("answer", mode="before")
+    @classmethod
+    def parse_answer(cls, value):
+        # "2", "2번", 2 → 2 / 알 수 없으면 0 (로컬 채점 생략)
+        digits = "".join(ch for ch in str(value) if ch.isdigit())
+        return int(digits) if digits in ("1", "2", "3") else 0
+
+
+class QuizSetSchema(LLMSchema):
+    quizzes: List[QuizSchema]
+
+
+class FollowupSchema(LLMSchema):
+    message: str
+    answer: str = "0"
+
+    @field_validator("answer", mode="before")
+    @classmethod
+    def parse_answer(cls, value):
+        return "1" if str(value).strip() in ("1", "false", "False") else "0"
+
+
 # -------------------------
 # 2) GPT 모델 설정
 # -------------------------
-llm = ChatOpenAI(
-    model="gpt-4o",   
-    temperature=0.7
-)
-memory = ConversationBufferMemory(return_messages=True)
+# LLM_PROVIDER=mock이면 네트워크 없이 동작하는 가짜 모델 (providers.py)
+# 실제 모델은 처음 호출할 때(또는 워커 예열 때) 만든다
+# 모든 호출은 거버너(분당 요청/토큰 한도 + 우선순위 대기열)를 거친다
+llm = GovernedLLM(chat_model)
+
+# JSON 응답을 받는 호출의 출력 형식
+#  schema: 스키마에 맞는 JSON만 생성 (structured outputs)
+#  json:   문법적으로 올바른 JSON만 생성 (JSON mode)
+#  off:    프롬프트 지시만 사용
+LLM_STRUCTURED = os.getenv("LLM_STRUCTURED", "schema")
+
+
+def strict_json_schema(model) -> dict:
+    # structured outputs 제약: 모든 객체는 필드 전부 required + additionalProperties false, default 없음
+    schema = model.model_json_schema()
+
+    def fix(node):
+        if isinstance(node, dict):
+            node.pop("default", None)
+            if node.get("type") == "object":
+                node["additionalProperties"] = False
+                node["required"] = list(node.get("properties", {}))
+            for value in node.values():
+                fix(value)
+        elif isinstance(node, list):
+            for value in node:
+                fix(value)
+
+    fix(schema)
+    return schema
+
+
+_structured_llms = {}
+
+
+def structured_llm(model):
+    # 스키마별로 response_format을 묶은 LLM (한 번 만들어 재사용)
+    if LLM_STRUCTURED == "off":
+        return llm
+    bound = _structured_llms.get(model)
+    if bound is None:
+        if LLM_STRUCTURED == "json":
+            response_format = {"type": "json_object"}
+        else:
+            response_format = {"type": "json_schema", "json_schema": {
+                "name": model.__name__, "schema": strict_json_schema(model), "strict": True,
+            }}
+        bound = _structured_llms[model] = GovernedLLM(chat_model.bind(response_format=response_format))
+    return bound
+
+
+def warm_up_llm() -> None:
+    # 호출 종류별 출력 형식(JSON 스키마 변환 포함)을 워커 시작 때 미리 만들어 둔다
+    for model in (StorySchema, QuizSchema, QuizSetSchema, FollowupSchema):
+        structured_llm(model)
 
 # -------------------------
 # 3) 함수들
 # -------------------------
 
-def clean_response(text: str) -> str:
-    # 코드 블록 제거
-    text = re.sub(r"^```(?:json)?\s*", "", text)
-    text = re.sub(r"\s*```$", "", text)
-    return text.strip()
+def matches(model, kind: str):
+    # 헤지 호출에서 정상 응답인지 판단 (고칠 수 없는 JSON이면 남은 시간 안에 다시 요청)
+    def validate(text: str) -> bool:
+        try:
+            parse_model(text, model, kind)
+            return True
+        except json.JSONDecodeError:
+            return False
+    return validate
+
+
+def build_story_prompt(state: MazeState) -> list:
+    # 이름 자리에 자리표시자를 넣어 생성 → 이름이 들어간 곳만 정확히 표시된 익명 스토리
+    return story_messages(PLAYER_PLACEHOLDER, state.setting, state.atmosphere, state.npc_count)
+
+
+def story_cache_key(state: MazeState) -> str:
+    # NPC 수가 기본값(3)이면 이전 캐시 키를 그대로 사용
+    if state.npc_count == 3:
+        return cache_key("story", state.setting, state.atmosphere)
+    return cache_key("story", state.setting, state.atmosphere, str(state.npc_count))
 
 
-def generate_story(state: MazeState, name:str, setting:str, atmosphere:str) -> MazeState:
+async def generate_story(state: MazeState, name:str, setting:str, atmosphere:str) -> MazeState:
     state.setting = setting
     state.atmosphere = atmosphere
     state.name = name
 
-    prompt = f"""
-    게임 개요: 사용자가 설정한 장소와 분위기 기반으로 AI가 세계관과 스토리를 생성하며, NPC와의 상호작용이 중요한 요소입니다.
-    플레이어가 미로의 장소로 '{state.setting}', 분위기로 '{state.atmosphere}'를 입력했습니다.
-    플레이어의 이름은 {state.name} 입니다.
-
-    무조건 위 게임 개요와 사용자가 입력한 설정을 바탕으로 방탈출게임 느낌의 스토리와 세계관, 목표를 만들어줘. 그리고 npc 3명 만들어줘.
-    아래 예시와 똑같이 JSON으로 출력해야 해. 그리고 삼중 백틱(```)이나 다른 코드 블록 문법은 절대 사용하지 마.
-    예시 :
-    {{
-        "world_description": "너가 생성한 세계관 및 스토리 전체 내용",
-        "objective": "미로탈출 게임의 세계관 기반 궁극적 목표를 사용자에게 존댓말로 설명",
-        "story_details": {{
-            "background": 스토리의 시작을 사용자에게 이야기해주듯이 존댓말로 설명",
-            "intro": "스토리 초반부 진행 상황 설명을 사용자에게 이야기해주듯이 존댓말로 설명",
-            "middle": "스토리 중반부 진행 상황 설명을 사용자에게 이야기해주듯이 존댓말로 설명",
-            "final": "스토리 후반부 진행 상황 설명을 사용자에게 이야기해주듯이 존댓말로 설명",
-            "result": "스토리 최종결말을 사용자에게 이야기하듯이 존댓말로 작성"
-        }},
-        "npcs": [
-            {{"name": "NPC 이름", "role": "NPC 직업", "personality": "직업에 따른 특징 및 말투"}}
-            // 추가 NPC 정보(3명)
-        ]
-    }}
-
-    위 예시를 무조건 지켜. 부탁할게
-    """
-    response = llm.invoke(prompt).content
-    cleaned_response = clean_response(response)
-    try:
-        story_data = json.loads(cleaned_response)
-    except json.JSONDecodeError:
-        state.message = "생성에 실패했습니다."
-        raise ValueError("Invalid JSON from LLM response")
-
+    prompt = build_story_prompt(state)
+    # 같은 장소/분위기는 캐시된 스토리를 재사용 (이름은 보여줄 때 채움)
+    story_key = story_cache_key(state)
+    story_data = response_cache.get(story_key)
+    if story_data is None:
+        response = await hedged_invoke(structured_llm(StorySchema), prompt, "world",
+                                       validate=matches(StorySchema, "story"))
+        try:
+            story_data = parse_model(response, StorySchema, "story").model_dump()
+        except json.JSONDecodeError:
+            state.message = "생성에 실패했습니다."
+            raise ValueError("Invalid JSON from LLM response")
+        response_cache.put(story_key, story_data)
+
+    return apply_story(state, story_data)
+
+
+def story_fields(state: MazeState) -> dict:
+    # 첫 장면으로 보여줄 필드 (익명 스토리에 플레이어 이름을 채워서)
+    return personalize({
+        "background": state.story_data.get("story_details", {}).get("background", ""),
+        "objective": state.story_data.get("objective", ""),
+    }, state.name)
+
+
+# state.story_data는 자리표시자가 남은 익명 스토리 그대로 둔다 (캐시/풀/세션 저장에 공유)
+def apply_story(state: MazeState, story_data: dict) -> MazeState:
     state.story_data = story_data
-    state.step = "first_encounter_question"
+    state.story_key = story_digest(story_data)
+    state.npc_index = 0
+    state.step = "encounter_question" if state.npc_count > 0 else "end_game"
 
     # 첫 장면 안내
-    background = story_data.get("story_details", {}).get("background", "")
-    obj = story_data.get("objective", "")
-    state.message = background + "\n" + obj + "\n" + "행운을 빕니다!\n"
+    fields = story_fields(state)
+    state.message = fields["background"] + "\n" + fields["objective"] + "\n" + "행운을 빕니다!\n"
     return state
 
 
-# ---------- [ 첫 번째 NPC: Question 노드 / Followup 노드 ] ----------
-
-def first_encounter_question(state: MazeState) -> MazeState:
-    npc = state.story_data["npcs"][0]
-    intro_story = state.story_data.get("story_details", {}).get("intro", "")
-
-    prompt_q = f"""
-    당신은 이 미로 속에서 플레이어가 만나는 첫 NPC '{npc['name']}' (직업: {npc['role']}) 입니다.
-    당신의 말투는 : {npc.get('personality')} 입니다.
-    처음에는 '{intro_story}'를 얘기하시고, 그 내용에 기반한 객관적으로 정답이 확실한 3지선다 퀴즈를 1개 내주세요
-    틀리면 패널티가 있다는 말을 추가해주세요
-
-    필수 조건 : 
-    - **위 내용을 반드시 아래 내용과 동일한 순수한 JSON 형식으로만 출력하세요**
-    - 그리고 삼중 백틱(```)이나 다른 코드 블록 문법은 절대 사용하지 마.
-    내용:
-    {{
-        "quiz": "{intro_story}와 퀴즈 질문을 여기에 적어주세요",
-        "option1":  "1번 선택지"
-        "option2":  "2번 선택지"
-        "option3":  "3번 선택지"
-    }} 
-
-    """
-    question_text = llm.invoke(prompt_q).content
-    cleaned_response = clean_response(question_text)
+# 스트리밍 버전: background / objective 필드가 완성되는 즉시 (필드, 값)을 내보낸다
+STREAM_STORY_FIELDS = ("background", "objective")
+
+async def stream_story(state: MazeState) -> AsyncIterator[Tuple[str, str]]:
+    story_key = story_cache_key(state)
+    story_data = response_cache.get(story_key)
+    emitted = {}
+    if story_data is None:
+        parser = IncrementalFieldParser(STREAM_STORY_FIELDS)
+        use_ledger(state.token_usage)
+        async for chunk in structured_llm(StorySchema).astream(build_story_prompt(state), kind="world"):
+            for key, value in parser.feed(chunk.content):
+                yield key, personalize(value, state.name)
+        emitted = parser.emitted
+        try:
+            story_data = parse_model(parser.text, StorySchema, "story").model_dump()
+        except json.JSONDecodeError:
+            state.message = "생성에 실패했습니다."
+            raise ValueError("Invalid JSON from LLM response")
+        response_cache.put(story_key, story_data)
+
+    apply_story(state, story_data)
+    fields = story_fields(state)
+    for key in STREAM_STORY_FIELDS:
+        if key not in emitted:
+            yield key, fields[key]
+
+
+# ---------- [ NPC 퀴즈 프롬프트 / 생성 ] ----------
+
+# NPC 순서별 호칭 (마지막 NPC는 항상 "마지막")
+QUIZ_ORDINALS = ["첫", "두번째", "세번째", "네번째", "다섯번째", "여섯번째", "일곱번째", "여덟번째", "아홉번째", "열번째"]
+
+
+def encounter_spec(index: int, count: int) -> Tuple[str, str]:
+    # NPC 순서 → (들려줄 스토리 구간, 호칭). 처음은 intro, 마지막은 final, 나머지는 middle
+    if index == 0:
+        story_key = "intro"
+    elif index == count - 1:
+        story_key = "final"
+    else:
+        story_key = "middle"
+    if index == count - 1 and count > 1:
+        ordinal = "마지막"
+    elif index < len(QUIZ_ORDINALS):
+        ordinal = QUIZ_ORDINALS[index]
+    else:
+        ordinal = f"{index + 1}번째"
+    return story_key, ordinal
+
+
+def npc_for(story_data: dict, index: int) -> dict:
+    # 스토리의 NPC가 미로의 NPC보다 적으면 돌아가며 재사용
+    npcs = story_data["npcs"]
+    return npcs[index % len(npcs)]
+
+
+def quiz_count(story_data: dict, count: Optional[int] = None) -> int:
+    return len(story_data.get("npcs", [])) if count is None else count
+
+
+def build_question_prompt(npc: dict, story_part: str, ordinal: str) -> list:
+    return question_messages(npc, story_part, ordinal)
+
+
+def quiz_cache_key(kind: str, story_data: dict) -> str:
+    return cache_key(kind, json.dumps(story_data, ensure_ascii=False, sort_keys=True))
+
+
+async def generate_npc_quiz(story_data: dict, index: int, name: str = "",
+                           count: Optional[int] = None) -> dict:
+    # NPC 한 명의 퀴즈만 생성 (prefetch 모드 / 만날 때 생성)
+    count = quiz_count(story_data, count)
+    kind = f"quiz{index}" if count == 3 else f"quiz{index}/{count}"
+    key = quiz_cache_key(kind, story_data)
+    quiz = response_cache.get(key)
+    if quiz is not None:
+        return personalize(quiz, name)
+
+    story_key, ordinal = encounter_spec(index, count)
+    story_part = story_data.get("story_details", {}).get(story_key, "")
+    prompt_q = build_question_prompt(npc_for(story_data, index), story_part, ordinal)
+    question_text = await hedged_invoke(structured_llm(QuizSchema), prompt_q, "quiz",
+                                        validate=matches(QuizSchema, "quiz"))
+    # 익명 스토리로 만든 퀴즈에는 자리표시자만 있으므로 그대로 캐시하고 이름을 채워 돌려준다
+    quiz = parse_model(question_text, QuizSchema, "quiz").model_dump()
+    response_cache.put(key, quiz)
+    return personalize(quiz, name)
+
+
+async def generate_quiz_set(story_data: dict, name: str = "", count: Optional[int] = None) -> List[dict]:
+    count = quiz_count(story_data, count)
+    key = quiz_cache_key("quizset" if count == 3 else f"quizset/{count}", story_data)
+    quizzes = response_cache.get(key)
+    if quizzes is not None:
+        return personalize(quizzes, name)
+
+    # 모든 NPC의 퀴즈를 한 번의 호출로 생성 (batch 모드)
+    details = story_data.get("story_details", {})
+    entries = []
+    for i in range(count):
+        story_key, ordinal = encounter_spec(i, count)
+        entries.append((ordinal, npc_for(story_data, i), details.get(story_key, "")))
+    prompt = quiz_set_messages(story_data.get("world_description", ""), entries)
+    text = (await structured_llm(QuizSetSchema).ainvoke(prompt, kind="quizset")).content
+    quizzes = [quiz.model_dump() for quiz in parse_model(text, QuizSetSchema, "quizset").quizzes]
+    response_cache.put(key, quizzes)
+    return personalize(quizzes, name)
+
+
+# ---------- [ 템플릿 응답 (LLM 예산 초과 / 과부하 시) ] ----------
+FALLBACK_ROLES = ["상인", "기사", "마법사", "사서", "요리사", "탐험가"]
+
+
+def fallback_quiz(story_data: dict, index: int, count: int) -> dict:
+    # story_data만으로 만드는 퀴즈: NPC 자신의 직업 맞히기 (정답 번호 포함 → 로컬 채점 가능)
+    npc = npc_for(story_data, index)
+    story_key, _ = encounter_spec(index, count)
+    story_part = story_data.get("story_details", {}).get(story_key, "")
+    correct = npc.get("role") or "안내자"
+    decoys = []
+    for role in [n.get("role") for n in story_data.get("npcs", [])] + FALLBACK_ROLES:
+        if role and role != correct and role not in decoys:
+            decoys.append(role)
+    options = [correct] + decoys[:2]
+    # 정답 위치는 NPC 순서대로 돌아가며 배치
+    shift = index % 3
+    options = options[3 - shift:] + options[:3 - shift]
+    return {
+        "quiz": f"{story_part}\n저는 {npc['name']}입니다. 틀리면 패널티가 있어요! 제 직업은 무엇일까요?".strip(),
+        "option1": options[0],
+        "option2": options[1],
+        "option3": options[2],
+        "answer": options.index(correct) + 1,
+        "correct_reaction": f"정답입니다! 저는 {correct}랍니다. 남은 길도 조심해서 가세요.",
+        "wrong_reaction": f"아쉽지만 틀렸어요. 저는 {correct}랍니다. 다음 만남에서는 꼭 맞혀 주세요.",
+    }
+
+
+def fallback_followup(state: MazeState) -> str:
+    # 정답을 알 수 없을 때는 플레이어에게 유리하게 정답 처리
+    npc = npc_for(state.story_data, state.npc_index)
+    return json.dumps({
+        "message": f"{npc['name']}: '{state.player_answer}'라고요? 잘 들었습니다. 행운을 빌어요!",
+        "answer": "0",
+    }, ensure_ascii=False)
+
+
+def fallback_ending(state: MazeState) -> str:
+    result_story = personalize(state.story_data.get("story_details", {}).get("result", ""), state.name)
+    return "미로의 마지막 장소에 도착했습니다.\n" + (result_story or "무사히 미로를 빠져나왔습니다. 축하합니다!")
+
+
+# ---------- [ 로컬 채점 ] ----------
+
+def store_answer_key(state: MazeState, data: dict) -> None:
     try:
-        data = json.loads(cleaned_response)
-        state.quiz = data["quiz"]
-        state.option1 = data["option1"]
-        state.option2 = data["option2"]
-        state.option3 = data["option3"]
-    except json.JSONDecodeError:
-        state.story = "퀴즈 생성에 실패했습니다. 다시 시도해주세요"
+        answer = int(str(data.get("answer", 0)).strip())
+    except ValueError:
+        answer = 0
+    state.quiz_answer = answer if 1 <= answer <= 3 else 0
+    state.correct_reaction = str(data.get("correct_reaction") or "")
+    state.wrong_reaction = str(data.get("wrong_reaction") or "")
+
+
+def parse_choice(state: MazeState, player_answer: str) -> Optional[int]:
+    # "2", "2번", 선택지 문장 그대로 등을 선택지 번호로 변환
+    text = player_answer.strip()
+    digits = text.rstrip("번. )").strip()
+    if digits in ("1", "2", "3"):
+        return int(digits)
+    normalized = " ".join(text.split())
+    for i, option in enumerate([state.option1, state.option2, state.option3], start=1):
+        if option and normalized == " ".join(option.split()):
+            return i
+    return None
+
+
+def grade_answer(state: MazeState, player_answer: str) -> Optional[str]:
+    # 정답 정보가 있으면 LLM 호출 없이 followup 응답(JSON)을 만든다
+    if not (state.quiz_answer and state.correct_reaction and state.wrong_reaction):
+        return None
+    choice = parse_choice(state, player_answer)
+    if choice is None:
+        return None
+    correct = choice == state.quiz_answer
+    return json.dumps({
+        "message": state.correct_reaction if correct else state.wrong_reaction,
+        "answer": "0" if correct else "1",
+    }, ensure_ascii=False)
+
+
+# ---------- [ NPC 만남: Question 노드 / Followup 노드 ] ----------
+# NPC 수와 상관없이 state.npc_index 번째 NPC를 처리한다
+
+async def encounter_question(state: MazeState, prefetched: Optional[dict] = None) -> MazeState:
+    index = state.npc_index
+    npc = npc_for(state.story_data, index)
+
+    # 미리 생성된 퀴즈가 없으면 지금 생성 (캐시를 거치므로 병렬로 만들어 둔 퀴즈도 재사용)
+    if prefetched is None:
+        try:
+            prefetched = await generate_npc_quiz(state.story_data, index, state.name, state.npc_count)
+        except (json.JSONDecodeError, KeyError, IndexError, DeadlineExceeded, GovernorOverloaded):
+            # 예산 초과/과부하/잘못된 응답이면 스토리 데이터로 만든 템플릿 퀴즈
+            count_fallback()
+            prefetched = fallback_quiz(state.story_data, index, state.npc_count)
+    else:
+        # 백그라운드에서 미리 만들 때 쓴 토큰도 이 게임에 합산
+        prefetched = dict(prefetched)
+        merge(state.token_usage, prefetched.pop("_tokens", None))
 
-    state.history.append(f"{npc['name']}: {question_text}")
-    state.step = "first_encounter_followup"
+    # 이전 퀴즈의 정답 정보는 초기화
+    state.quiz_answer = 0
+    try:
+        # 캐시/풀에 저장돼 있던 퀴즈도 같은 스키마로 검증
+        data = QuizSchema.model_validate(prefetched).model_dump()
+    except ValidationError:
+        count_fallback()
+        data = fallback_quiz(state.story_data, index, state.npc_count)
+    # 템플릿 퀴즈는 익명 스토리 구간을 그대로 쓰므로 여기서 이름을 채운다
+    data = personalize(data, state.name)
+    state.quiz = data["quiz"]
+    state.option1 = data["option1"]
+    state.option2 = data["option2"]
+    state.option3 = data["option3"]
+    store_answer_key(state, data)
+
+    state.step = "encounter_followup"
+    remember(state, f"{npc['name']}: {state.quiz}")
+    # 퀴즈 JSON 전체 대신 질문 문장만 보관 (응답은 quiz/option 필드로 나간다)
+    state.message = state.quiz
     return state
 
-def first_encounter_followup(state: MazeState, player_input:str) -> MazeState:
-    state.player_answer = player_input.strip()
-
-    npc = state.story_data["npcs"][0]
-    player_answer = state.player_answer
-    message = state.message.replace("{", "{{").replace("}", "}}")
-
-    prompt_follow = f"""
-    당신은 NPC '{npc['name']}' 입니다. 당신의 말투는 : {npc.get('personality')} 입니다.
-    플레이어가 '{player_answer}' 라고 답했습니다.
-    이전 대화와 퀴즈 내용은 '{message}' 에 존재합니다.
-
-    필수 조건 : 
-    - **위 내용을 반드시 아래 내용과 동일한 순수한 JSON 형식으로만 출력하세요**
-    - 그리고 삼중 백틱(```)이나 다른 코드 블록 문법은 절대 사용하지 마.
 
+async def encounter_followup(state: MazeState, player_input: str) -> MazeState:
+    state.player_answer = (player_input or "").strip()
 
-    내용:
-    {{
-        "message": "플레이어 대답이 맞다면 정답이라는 식으로 한 마디 말하고, 자연스러운 대화를 추가로 한 마디 하고 대화를 끝내세요.
-                   틀렸다면 틀렸다고 한 마디 말하고, 자연스러운 대화를 추가로 한 마디 하고 대화를 끝내세요",
-        "answer":  "퀴즈를 맞으면 0, 틀리면 1을 문자열로 출력"
-    }}    
-    """
-    follow_text = llm.invoke(prompt_follow).content
-    cleaned_response = clean_response(follow_text)
+    index = state.npc_index
+    npc = personalize(npc_for(state.story_data, index), state.name)
+    _, ordinal = encounter_spec(index, state.npc_count)
+    player_answer = state.player_answer
 
+    # 정답 번호를 알고 있으면 로컬에서 채점
+    follow_text = grade_answer(state, player_answer)
+    if follow_text is None:
+        prompt_follow = followup_messages(npc, ordinal, state.quiz,
+                                          [state.option1, state.option2, state.option3], player_answer)
+        try:
+            follow_text = await hedged_invoke(structured_llm(FollowupSchema), prompt_follow, "followup",
+                                              validate=matches(FollowupSchema, "followup"))
+        except (DeadlineExceeded, GovernorOverloaded):
+            count_fallback()
+            follow_text = fallback_followup(state)
     try:
-        data = json.loads(cleaned_response)
-        state.message = data["message"]
-        state.num = data["answer"]
+        data = parse_model(follow_text, FollowupSchema, "followup")
     except json.JSONDecodeError:
-        state.message = "결과 로드에 실패했습니다. 다시 시도해주세요"
-    # history 추가
-    state.history.append(f"플레이어: {player_answer}")
-    state.history.append(f"{npc['name']}: {follow_text}")
-    state.step = "second_encounter_question"
+        count_fallback()
+        data = parse_model(fallback_followup(state), FollowupSchema, "followup")
+    state.message = data.message
+    state.num = int(data.answer)
+    remember(state, f"플레이어: {player_answer}")
+    remember(state, f"{npc['name']}: {data.message}")
+
+    state.npc_index = index + 1
+    state.step = "encounter_question" if state.npc_index < state.npc_count else "end_game"
     return state
 
 
-# ---------- [ 두 번째 NPC: Question / Followup ] ----------
-
-def second_encounter_question(state: MazeState) -> MazeState:
-    npc = state.story_data["npcs"][1]
-    middle_story = state.story_data.get("story_details", {}).get("middle", "")
-
-    prompt_q = f"""
-    당신은 이 미로 속에서 플레이어가 만나는 두번째 NPC '{npc['name']}' (직업: {npc['role']}) 입니다.
-    당신의 말투는 : {npc.get('personality')} 입니다.
-    처음에는 '{middle_story}'를 얘기하시고, 그 내용에 기반한 객관적으로 정답이 확실한 3지선다 퀴즈를 1개 내주세요
-    틀리면 패널티가 있다는 말을 추가해주세요
-
-    필수 조건 : 
-    - **위 내용을 반드시 아래 내용과 동일한 순수한 JSON 형식으로만 출력하세요**
-    - 그리고 삼중 백틱(```)이나 다른 코드 블록 문법은 절대 사용하지 마.
-    내용:
-    {{
-        "quiz": "{middle_story}와 퀴즈 질문을 여기에 적어주세요",
-        "option1":  "1번 선택지"
-        "option2":  "2번 선택지"
-        "option3":  "3번 선택지"
-    }} 
-
-    """
-    question_text = llm.invoke(prompt_q).content
-    cleaned_response = clean_response(question_text)
-    try:
-        data = json.loads(cleaned_response)
-        state.quiz = data["quiz"]
-        state.option1 = data["option1"]
-        state.option2 = data["option2"]
-        state.option3 = data["option3"]
-    except json.JSONDecodeError:
-        state.story = "퀴즈 생성에 실패했습니다. 다시 시도해주세요"
-
-    state.step = "second_encounter_followup"
-    state.history.append(f"{npc['name']}: {question_text}")
-
-    state.message = question_text
-    return state
+# ---------- [ 결말 ] ----------
+def build_ending_prompt(state: MazeState) -> list:
+    return ending_messages(personalize(state.story_data.get("story_details", {}).get("result", ""), state.name))
 
-def second_encounter_followup(state: MazeState, player_input:str) -> MazeState:
-    state.player_answer = player_input.strip()
 
-    npc = state.story_data["npcs"][1]
-    player_answer = state.player_answer
-    message = state.message.replace("{", "{{").replace("}", "}}")
-
-    prompt_follow = f"""
-    당신은 두 번째 NPC '{npc['name']}' 입니다. 당신의 말투는 : {npc.get('personality')} 입니다.
-    플레이어가 '{player_answer}' 라고 답했습니다.
-    이전 대화와 퀴즈 내용은 '{message}' 에 존재합니다.
-
-    필수 조건 : 
-    - **위 내용을 반드시 아래 내용과 동일한 순수한 JSON 형식으로만 출력하세요**
-    - 그리고 삼중 백틱(```)이나 다른 코드 블록 문법은 절대 사용하지 마.
-
-    내용:
-    {{
-        "message": "플레이어 대답이 맞다면 정답이라는 식으로 한 마디 말하고, 자연스러운 대화를 추가로 한 마디 하고 대화를 끝내세요.
-                   틀렸다면 틀렸다고 한 마디 말하고, 자연스러운 대화를 추가로 한 마디 하고 대화를 끝내세요",
-        "answer":  "퀴즈를 맞으면 0, 틀리면 1을 문자열로 출력"
-    }}  
-    """
-    follow_text = llm.invoke(prompt_follow).content
-    cleaned_response = clean_response(follow_text)
+async def end_game(state: MazeState) -> MazeState:
+    prompt = build_ending_prompt(state)
     try:
-        data = json.loads(cleaned_response)
-        state.message = data["message"]
-        state.num = data["answer"]
-    except json.JSONDecodeError:
-        state.message = "결과 로드에 실패했습니다. 다시 시도해주세요"
-
-    state.history.append(f"플레이어: {player_answer}")
-    state.history.append(f"{npc['name']}: {follow_text}")
-    state.step = "third_encounter_question"
+        result_text = await hedged_invoke(llm, prompt, "ending")
+    except (DeadlineExceeded, GovernorOverloaded):
+        count_fallback()
+        result_text = fallback_ending(state)
+    state.message = result_text
     return state
 
 
-# ---------- [ 세 번째 NPC: Question / Followup ] ----------
-
-def third_encounter_question(state: MazeState) -> MazeState:
-    npc = state.story_data["npcs"][2]
-    final_story = state.story_data.get("story_details", {}).get("final", "")
-
-    prompt_q = f"""
-    당신은 이 미로 속에서 플레이어가 만나는 마지막 NPC '{npc['name']}' (직업: {npc['role']}) 입니다.
-    당신의 말투는 : {npc.get('personality')} 입니다.
-    처음에는 '{final_story}'를 얘기하시고, 그 내용에 기반한 객관적으로 정답이 확실한 3지선다 퀴즈를 1개 내주세요
-    틀리면 패널티가 있다는 말을 추가해주세요
-
-    필수 조건 : 
-    - **위 내용을 반드시 아래 내용과 동일한 순수한 JSON 형식으로만 출력하세요**
-    - 그리고 삼중 백틱(```)이나 다른 코드 블록 문법은 절대 사용하지 마.
-    내용:
-    {{
-        "quiz": "{final_story}와 퀴즈 질문을 여기에 적어주세요",
-        "option1":  "1번 선택지"
-        "option2":  "2번 선택지"
-        "option3":  "3번 선택지"
-    }} 
-
-    """
-    question_text = llm.invoke(prompt_q).content
-    cleaned_response = clean_response(question_text)
-    try:
-        data = json.loads(cleaned_response)
-        state.quiz = data["quiz"]
-        state.option1 = data["option1"]
-        state.option2 = data["option2"]
-        state.option3 = data["option3"]
-    except json.JSONDecodeError:
-        state.story = "퀴즈 생성에 실패했습니다. 다시 시도해주세요"
-
-    state.step = "third_encounter_followup"
-    state.history.append(f"{npc['name']}: {question_text}")
-    state.message = question_text
-    return state
+# 스트리밍 버전: 토큰을 받는 대로 내보내고, 끝나면 state.message에 전체 결말을 저장
+# 청크마다 남은 예산 안에서만 기다리고, 도중에 예산 초과/과부하/제공자 오류가 나면
+# 받은 데까지에 마무리 문장을 붙이고 (하나도 못 받았으면 템플릿 결말) 정상적으로 끝낸다
+ENDING_CUT_TAIL = "\n…그렇게 긴 여정이 끝났습니다. 무사히 미로를 빠져나왔습니다. 축하합니다!"
 
-def third_encounter_followup(state: MazeState, player_input:str) -> MazeState:
-    state.player_answer = player_input.strip()
 
-    npc = state.story_data["npcs"][2]
-    player_answer = state.player_answer
-    message = state.message.replace("{", "{{").replace("}", "}}")
-
-    prompt_follow = f"""
-    당신은 마지막 NPC '{npc['name']}' 입니다. 당신의 말투는 : {npc.get('personality')} 입니다.
-    플레이어가 '{player_answer}' 라고 답했습니다.
-    이전 대화와 퀴즈 내용은 '{message}' 에 존재합니다.
-
-    필수 조건 : 
-    - **위 내용을 반드시 아래 내용과 동일한 순수한 JSON 형식으로만 출력하세요**
-    - 그리고 삼중 백틱(```)이나 다른 코드 블록 문법은 절대 사용하지 마.
-
-    내용:
-    {{
-        "message": "플레이어 대답이 맞다면 정답이라는 식으로 한 마디 말하고, 자연스러운 대화를 추가로 한 마디 하고 대화를 끝내세요.
-                   틀렸다면 틀렸다고 한 마디 말하고, 자연스러운 대화를 추가로 한 마디 하고 대화를 끝내세요",
-        "answer":  "퀴즈를 맞으면 0, 틀리면 1을 문자열로 출력"
-    }}
-    """
-    follow_text = llm.invoke(prompt_follow).content
-    cleaned_response = clean_response(follow_text)
+async def stream_end_game(state: MazeState) -> AsyncIterator[str]:
+    parts = []
+    use_ledger(state.token_usage)
+    stream = llm.astream(build_ending_prompt(state), kind="ending")
     try:
-        data = json.loads(cleaned_response)
-        state.message = data["message"]
-        state.num = data["answer"]
-    except json.JSONDecodeError:
-        state.message = "결과 로드에 실패했습니다. 다시 시도해주세요"
-    # history 추가
-    state.history.append(f"플레이어: {player_answer}")
-    state.history.append(f"{npc['name']}: {follow_text}")
-    state.step = "end_game"
-    return state
+        while True:
+            left = remaining()
+            try:
+                chunk = await (asyncio.wait_for(stream.__anext__(), max(0.0, left)) if left is not None
+                               else stream.__anext__())
+            except StopAsyncIteration:
+                break
+            if chunk.content:
+                parts.append(chunk.content)
+                yield chunk.content
+    except Exception as e:
+        if not isinstance(e, (asyncio.TimeoutError, GovernorOverloaded)):
+            print("결말 스트리밍 중 오류 발생:", e)
+        count_fallback()
+        tail = ENDING_CUT_TAIL if parts else fallback_ending(state)
+        parts.append(tail)
+        yield tail
+    finally:
+        # 시간 초과로 끊었거나 클라이언트가 떠났어도 제공자 스트림(HTTP 응답)을 닫는다
+        await stream.aclose()
+    state.message = "".join(parts)
 
 
-# ---------- [ 결말 ] ----------
-def end_game(state: MazeState) -> MazeState:
-    result_story = state.story_data.get("story_details", {}).get("result", "")
-
-    prompt = f"""
-    미로의 마지막 장소에 도착했습니다.
-    스토리의 최종 결말인 {result_story}를 플레이어에게 자세하게 설명해주세요.
-    """
-    result_text = llm.invoke(prompt).content
-    state.message = result_text
+# -------------------------
+# 4) 진행 그래프 (LangGraph)
+# -------------------------
+# 요청 한 번에 한 단계씩 진행한다: START → (단계별 분기) → 노드 → END
+# 다음 NPC 퀴즈의 사전 생성은 그래프 밖(quiz_prefetch)에서 세션 단위로 관리한다
+# "memory"면 워커 메모리에 단계별 체크포인트를 남긴다 (디버깅용, 워커 간 공유 상태는 세션 저장소)
+ENCOUNTER_CHECKPOINT = os.getenv("ENCOUNTER_CHECKPOINT", "off")
+
+# 이전 버전에서 저장된 세션의 단계 이름 → (새 단계, NPC 번호)
+LEGACY_STEPS = {
+    "first_encounter_question": ("encounter_question", 0),
+    "first_encounter_followup": ("encounter_followup", 0),
+    "second_encounter_question": ("encounter_question", 1),
+    "second_encounter_followup": ("encounter_followup", 1),
+    "third_encounter_question": ("encounter_question", 2),
+    "third_encounter_followup": ("encounter_followup", 2),
+}
+
+
+def normalize_step(state: MazeState) -> MazeState:
+    if state.step in LEGACY_STEPS:
+        state.step, state.npc_index = LEGACY_STEPS[state.step]
     return state
 
 
-# -------------------------
-# 4) advance_game 함수
-# -------------------------
-def advance_game(state: MazeState, player_answer:Optional[str]=None) -> MazeState:
-    step = state.step
+class EncounterInput(TypedDict, total=False):
+    game: MazeState
+    answer: Optional[str]
+    prefetched: Optional[dict]
 
-    if step == "start":
-        state = generate_story(state, state.name, state.setting, state.atmosphere)
 
-    elif step == "first_encounter_question":
-        state = first_encounter_question(state)
+async def story_node(inp: EncounterInput) -> dict:
+    state = inp["game"]
+    return {"game": await generate_story(state, state.name, state.setting, state.atmosphere)}
 
-    elif step == "first_encounter_followup":
-        state = first_encounter_followup(state, player_answer)
 
-    elif step == "second_encounter_question":
-        state = second_encounter_question(state)
+async def question_node(inp: EncounterInput) -> dict:
+    return {"game": await encounter_question(inp["game"], inp.get("prefetched"))}
 
-    elif step == "second_encounter_followup":
-        state = second_encounter_followup(state, player_answer)
 
-    elif step == "third_encounter_question":
-        state = third_encounter_question(state)
+async def followup_node(inp: EncounterInput) -> dict:
+    return {"game": await encounter_followup(inp["game"], inp.get("answer") or "")}
 
-    elif step == "third_encounter_followup":
-        state = third_encounter_followup(state, player_answer)
 
-    elif step == "end_game":
-        state = end_game(state)
+async def ending_node(inp: EncounterInput) -> dict:
+    return {"game": await end_game(inp["game"])}
 
-    elif step == "game_finished":
+
+async def finished_node(inp: EncounterInput) -> dict:
+    state = inp["game"]
+    if state.step == "game_finished":
         state.message = "게임이 이미 종료되었습니다."
     else:
-        state.message = f"알 수 없는 단계: {step}"
+        state.message = f"알 수 없는 단계: {state.step}"
+    return {"game": state}
+
+
+def route_step(inp: EncounterInput):
+    state = inp["game"]
+    step = state.step
+    if step == "start":
+        return "story"
+    if step == "encounter_question":
+        return "question"
+    if step == "encounter_followup":
+        return "followup"
+    if step == "end_game":
+        return "ending"
+    return "finished"
+
+
+GAME_STEP_LATENCY = Histogram("game_step_duration_seconds", "advance_game 한 단계 처리 시간", ("step", "outcome"))
+
+
+def build_encounter_graph() -> StateGraph:
+    graph = StateGraph(EncounterInput)
+    nodes = {
+        "story": story_node,
+        "question": question_node,
+        "followup": followup_node,
+        "ending": ending_node,
+        "finished": finished_node,
+    }
+    for name, node in nodes.items():
+        graph.add_node(name, node)
+        graph.add_edge(name, END)
+    graph.add_conditional_edges(START, route_step, list(nodes))
+    return graph
+
+
+# 모듈 로드 시 한 번만 컴파일
+encounter_graph = build_encounter_graph().compile(
+    checkpointer=MemorySaver() if ENCOUNTER_CHECKPOINT == "memory" else None
+)
+
 
-    return state    
+async def advance_game(state: MazeState, player_answer:Optional[str]=None,
+                       prefetched_quiz:Optional[dict]=None, thread_id:Optional[str]=None) -> MazeState:
+    normalize_step(state)
+    # 그래프 안의 LLM 호출 토큰을 이 게임 상태에 기록 (노드 작업은 컨텍스트를 복사하지만 dict는 공유)
+    use_ledger(state.token_usage)
+
+    config = None
+    if ENCOUNTER_CHECKPOINT == "memory":
+        config = {"configurable": {"thread_id": thread_id or "default"}}
+    with timed(GAME_STEP_LATENCY, (state.step,)):
+        result = await encounter_graph.ainvoke(
+            {"game": state, "answer": player_answer, "prefetched": prefetched_quiz}, config
+        )
+    return result["game"]
 
 
 
@@ -0,0 +1,320 @@
+import asyncio
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import zlib
+from collections import defaultdict
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from prompts import prompt_kind
+
+# -------------------------
+# 1) 설정
+# -------------------------
+# LLM_RECORD_PATH: 실제 LLM/이미지 호출의 응답과 지연 시간을 이 파일에 기록 (운영 서버에서 켜 둔다)
+# LLM_PROVIDER=replay + LLM_REPLAY_PATH: 기록한 응답을 같은 지연 시간으로 다시 재생
+LLM_RECORD_PATH = os.getenv("LLM_RECORD_PATH", "")
+LLM_REPLAY_PATH = os.getenv("LLM_REPLAY_PATH", "llm_trace.db")
+# 재생 지연 배율 (1.0 = 원래 속도, 0 = 기다리지 않음)
+REPLAY_TIME_SCALE = float(os.getenv("REPLAY_TIME_SCALE", "1.0"))
+
+# 트레이스 파일: SQLite 한 파일에 호출 하나당 한 행, 본문은 zlib 압축 JSON
+#  key:  sha1(호출 종류 + 이번 호출에만 쓰는 사용자 메시지)
+#        → 공통 시스템 프롬프트를 고쳐도 같은 게임 입력이면 같은 기록을 찾는다
+#  body: {"input", "content", "usage", "chunks": [[첫 바이트부터 ms, 글자 수], ...]}
+TRACE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS calls (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    latency_ms REAL NOT NULL,
+    error TEXT,
+    body BLOB,
+    recorded_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS calls_key ON calls(key, id);
+CREATE INDEX IF NOT EXISTS calls_kind ON calls(kind, id);
+"""
+
+
+class ReplayError(Exception):
+    pass
+
+
+def dynamic_text(messages) -> str:
+    # [시스템, 사용자] 중 사용자 메시지만 (문자열 프롬프트는 그대로)
+    if isinstance(messages, (list, tuple)):
+        return str(messages[-1].content) if messages else ""
+    return str(messages)
+
+
+def trace_key(kind: str, text: str) -> str:
+    return hashlib.sha1(f"{kind}\0{text}".encode("utf-8")).hexdigest()
+
+
+# -------------------------
+# 2) 기록
+# -------------------------
+class TraceWriter:
+    # 요청 처리 중에는 큐에 넣기만 하고, 쓰기는 별도 스레드가 모아서 한 트랜잭션으로 처리
+    def __init__(self, path: str):
+        self.path = path
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="llm-trace-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, kind: str, text: str, latency_ms: float, error: Optional[str] = None,
+              content: Optional[str] = None, usage: Optional[dict] = None,
+              chunks: Optional[List[List[float]]] = None) -> None:
+        body = None
+        if error is None:
+            body = zlib.compress(json.dumps({
+                "input": text, "content": content, "usage": usage, "chunks": chunks,
+            }, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 6)
+        self._queue.put((trace_key(kind, text), kind, round(latency_ms, 1), error, body, time.time()))
+
+    def _run(self) -> None:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(TRACE_SCHEMA)
+        while True:
+            rows = [self._queue.get()]
+            while len(rows) < 256:
+                try:
+                    rows.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            with conn:
+                conn.executemany(
+                    "INSERT INTO calls (key, kind, latency_ms, error, body, recorded_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+
+    def flush(self, timeout: float = 5.0) -> None:
+        deadline = time.monotonic() + timeout
+        while not self._queue.empty() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+
+_writer: Optional[TraceWriter] = None
+
+
+def trace_writer() -> TraceWriter:
+    global _writer
+    if _writer is None:
+        _writer = TraceWriter(LLM_RECORD_PATH)
+    return _writer
+
+
+class RecordingChatModel(BaseChatModel):
+    # 실제 모델을 감싸서 호출을 그대로 넘기고 결과/지연 시간만 기록
+    inner: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return "recording"
+
+    def _combine_llm_outputs(self, llm_outputs: List[Optional[dict]]) -> dict:
+        return self.inner._combine_llm_outputs(llm_outputs)
+
+    def _record(self, kind: str, text: str, start: float, result: ChatResult) -> ChatResult:
+        usage = (result.llm_output or {}).get("token_usage")
+        trace_writer().write(kind, text, (time.perf_counter() - start) * 1000,
+                             content=result.generations[0].message.content, usage=usage)
+        return result
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        # 동기 invoke (벤치마크/스크립트용): 비동기 버전과 같은 기록
+        kind, text = prompt_kind(messages), dynamic_text(messages)
+        start = time.perf_counter()
+        try:
+            result = self.inner._generate(messages, stop=stop, **kwargs)
+        except Exception as e:
+            trace_writer().write(kind, text, (time.perf_counter() - start) * 1000, error=repr(e))
+            raise
+        return self._record(kind, text, start, result)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        kind, text = prompt_kind(messages), dynamic_text(messages)
+        start = time.perf_counter()
+        try:
+            result = await self.inner._agenerate(messages, stop=stop, **kwargs)
+        except Exception as e:
+            trace_writer().write(kind, text, (time.perf_counter() - start) * 1000, error=repr(e))
+            raise
+        return self._record(kind, text, start, result)
+
+    async def _astream(self, messages, stop=None, run_manager=None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        kind, text = prompt_kind(messages), dynamic_text(messages)
+        start = time.perf_counter()
+        parts, chunks = [], []
+        try:
+            async for chunk in self.inner._astream(messages, stop=stop, **kwargs):
+                piece = str(chunk.message.content)
+                parts.append(piece)
+                chunks.append([round((time.perf_counter() - start) * 1000, 1), len(piece)])
+                if run_manager is not None:
+                    await run_manager.on_llm_new_token(piece, chunk=chunk)
+                yield chunk
+        except Exception as e:
+            trace_writer().write(kind, text, (time.perf_counter() - start) * 1000, error=repr(e))
+            raise
+        trace_writer().write(kind, text, (time.perf_counter() - start) * 1000,
+                             content="".join(parts), chunks=chunks)
+
+
+class RecordingImageProvider:
+    def __init__(self, inner):
+        self.inner = inner
+
+    async def generate(self, prompt: str, n: int = 1, size: str = "1024x1024") -> str:
+        text = f"{prompt}\0{size}"
+        start = time.perf_counter()
+        try:
+            url = await self.inner.generate(prompt, n=n, size=size)
+        except Exception as e:
+            trace_writer().write("image", text, (time.perf_counter() - start) * 1000, error=repr(e))
+            raise
+        trace_writer().write("image", text, (time.perf_counter() - start) * 1000, content=url)
+        return url
+
+
+# -------------------------
+# 3) 재생
+# -------------------------
+class Trace:
+    # 파일 전체를 한 번에 읽어 key/종류별 인덱스를 만든다 (본문 압축은 꺼낼 때 푼다)
+    def __init__(self, path: str):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"트레이스 파일이 없습니다: {path}")
+        conn = sqlite3.connect(path)
+        try:
+            rows = conn.execute("SELECT key, kind, latency_ms, error, body FROM calls ORDER BY id").fetchall()
+        finally:
+            conn.close()
+        self.by_key: Dict[str, list] = defaultdict(list)
+        self.by_kind: Dict[str, list] = defaultdict(list)
+        for row in rows:
+            self.by_key[row[0]].append(row)
+            self.by_kind[row[1]].append(row)
+        self._next: Dict[str, int] = defaultdict(int)
+        self._bodies: Dict[bytes, dict] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def pick(self, kind: str, text: str):
+        # 같은 입력의 n번째 호출은 n번째 기록 (재시도/헤지 포함), 없으면 같은 종류에서 결정적으로 하나 고른다
+        key = trace_key(kind, text)
+        seq = self._next[key]
+        self._next[key] = seq + 1
+        rows = self.by_key.get(key)
+        if rows:
+            self.hits += 1
+        else:
+            rows = self.by_kind.get(kind)
+            if not rows:
+                raise ReplayError(f"트레이스에 {kind} 호출 기록이 없습니다")
+            self.misses += 1
+            seq += int(key[:8], 16)
+        _, _, latency_ms, error, body = rows[seq % len(rows)]
+        return latency_ms, error, self.body(body) if body is not None else None
+
+    def body(self, blob: bytes) -> dict:
+        cached = self._bodies.get(blob)
+        if cached is None:
+            cached = self._bodies[blob] = json.loads(zlib.decompress(blob))
+        return cached
+
+    def stats(self) -> dict:
+        return {"calls": sum(len(v) for v in self.by_kind.values()), "hits": self.hits, "misses": self.misses,
+                "by_kind": {kind: len(rows) for kind, rows in self.by_kind.items()}}
+
+
+_trace: Optional[Trace] = None
+
+
+def replay_trace() -> Trace:
+    global _trace
+    if _trace is None:
+        _trace = Trace(LLM_REPLAY_PATH)
+    return _trace
+
+
+async def _wait(ms: float) -> None:
+    if REPLAY_TIME_SCALE > 0 and ms > 0:
+        await asyncio.sleep(ms / 1000 * REPLAY_TIME_SCALE)
+
+
+def _wait_sync(ms: float) -> None:
+    if REPLAY_TIME_SCALE > 0 and ms > 0:
+        time.sleep(ms / 1000 * REPLAY_TIME_SCALE)
+
+
+class ReplayChatModel(BaseChatModel):
+    @property
+    def _llm_type(self) -> str:
+        return "replay"
+
+    def _combine_llm_outputs(self, llm_outputs: List[Optional[dict]]) -> dict:
+        return next((output for output in llm_outputs if output), {})
+
+    def _pick(self, messages):
+        kind = prompt_kind(messages)
+        latency_ms, error, body = replay_trace().pick(kind, dynamic_text(messages))
+        return kind, latency_ms, error, body
+
+    @staticmethod
+    def _result(kind: str, error: Optional[str], body: Optional[dict]) -> ChatResult:
+        if error is not None:
+            raise ReplayError(f"기록된 {kind} 오류: {error}")
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=body["content"]))],
+                          llm_output={"token_usage": body.get("usage"), "model_name": "replay"})
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        # 동기 invoke: 같은 기록을 같은 지연 시간으로 (이벤트 루프 대신 스레드를 재운다)
+        kind, latency_ms, error, body = self._pick(messages)
+        _wait_sync(latency_ms)
+        return self._result(kind, error, body)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        kind, latency_ms, error, body = self._pick(messages)
+        await _wait(latency_ms)
+        return self._result(kind, error, body)
+
+    async def _astream(self, messages, stop=None, run_manager=None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        kind, latency_ms, error, body = self._pick(messages)
+        if error is not None:
+            await _wait(latency_ms)
+            raise ReplayError(f"기록된 {kind} 오류: {error}")
+        content = body["content"]
+        # 스트림으로 기록된 것은 조각 타이밍 그대로, 아니면 전체 지연 후 한 번에
+        chunks = body.get("chunks") or [[latency_ms, len(content)]]
+        elapsed, pos = 0.0, 0
+        for at_ms, length in chunks:
+            await _wait(at_ms - elapsed)
+            elapsed = at_ms
+            piece = content[pos:pos + length]
+            pos += length
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece))
+            if run_manager is not None:
+                await run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+
+
+class ReplayImageProvider:
+    async def generate(self, prompt: str, n: int = 1, size: str = "1024x1024") -> str:
+        latency_ms, error, body = replay_trace().pick("image", f"{prompt}\0{size}")
+        await _wait(latency_ms)
+        if error is not None:
+            raise ReplayError(f"기록된 image 오류: {error}")
+        return body["content"]
@@ -1,16 +1,59 @@
+import time
+IMPORT_START = time.perf_counter()
+
 from dotenv import load_dotenv
+# .env는 여기서 한 번만 읽는다 (다른 모듈이 불러올 때 환경 변수를 읽으므로 가장 먼저)
 load_dotenv()
 
-from fastapi import FastAPI, HTTPException, Body
+import asyncio
+import json
+import os
+from contextlib import AsyncExitStack, asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Body, Cookie, Depends, Header, Query, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Optional, List
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, ValidationError
+from typing import Dict, Literal, Optional, List, Tuple
 
-from llm_langchain import MazeState, advance_game
-from image_generate import generate_image
+from llm_langchain import (
+    MazeState, advance_game, apply_story, normalize_step, stream_end_game, stream_story, story_fields,
+    warm_up_llm
+)
+from image_generate import build_image_prompt, generate_image
+from image_jobs import cancel_image_job, get_image_job, start_image_job
+from image_store import (
+    IMAGE_CACHE_CONTROL, close_image_store, public_image_url, public_image_variants, sniff_media_type, stored_image_path
+)
+from llm_governor import (
+    PRIORITY_ENDING, PRIORITY_NAMES, PRIORITY_QUIZ, PRIORITY_WORLD, GovernorOverloaded, image_governor, llm_governor,
+    set_llm_priority
+)
+from llm_hedge import DeadlineExceeded, hedge_stats, set_deadline
+from json_extract import parse_stats
+from maze_engine import GRID_ENCODINGS, MazeSession
+from maze_batch import load_maze_catalog
+from maze_generator import MAZE_DEFAULT_SEED, new_maze_config
+from metrics import Counter, Gauge, Histogram, MetricsMiddleware, collect_all, flush_loop, register_collector
+from providers import close_providers, warm_up_providers
+from response_cache import response_cache
+from quiz_prefetch import start_quiz_prefetch, store_quizzes, take_quiz
+from session_store import SESSION_TTL, SessionBusy, create_store, new_session_id
+from token_budget import report as token_report, totals as token_totals
+from world_pool import WorldPool, refill_loop
+
+# 워커를 자주 재시작/증설할 수 있도록 import 시간을 재고 예산을 넘으면 알린다
+# (무거운 SDK/커넥션은 providers.py에서 처음 쓸 때 만든다, 측정: benchmarks/bench_startup.py)
+IMPORT_TIME_BUDGET = float(os.getenv("IMPORT_TIME_BUDGET", "1.5"))
+IMPORT_SECONDS = time.perf_counter() - IMPORT_START
+if IMPORT_SECONDS > IMPORT_TIME_BUDGET:
+    print(f"main import {IMPORT_SECONDS:.2f}s: 예산 {IMPORT_TIME_BUDGET:.2f}s 초과")
 
 app = FastAPI()
 
+# 요청별 지연 시간/진행 중 요청 수 (/metrics)
+app.add_middleware(MetricsMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # 필요한 경우 특정 도메인만 허용하도록 수정
@@ -19,7 +62,77 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-game_state: Optional[MazeState] = None
+@app.on_event("shutdown")
+async def shutdown_clients():
+    await close_providers()
+    await close_image_store()
+
+
+OVERLOADED_DETAIL = "요청이 많아 처리하지 못했습니다. 잠시 후 다시 시도해주세요."
+
+
+@app.exception_handler(GovernorOverloaded)
+async def governor_overloaded(request, exc: GovernorOverloaded):
+    # LLM 대기열이 가득 차면 바로 503으로 돌려보낸다
+    return JSONResponse(status_code=503, content={"detail": OVERLOADED_DETAIL},
+                        headers={"Retry-After": str(int(exc.retry_after))})
+
+
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded(request, exc: DeadlineExceeded):
+    # 템플릿으로 대신할 수 없는 단계(세계관 생성)가 예산을 넘긴 경우
+    return JSONResponse(status_code=504, content={"detail": "응답 시간이 초과되었습니다. 잠시 후 다시 시도해주세요."})
+
+
+# 플레이어별 게임 상태 저장소 (gunicorn 워커 간 공유)
+session_store = create_store()
+# 인기 설정용으로 미리 만들어 둔 세계관 풀
+world_pool = WorldPool()
+
+
+WORKER_STARTUP = Histogram("worker_startup_duration_seconds", "워커 시작 단계별 소요 시간", ("phase",))
+
+
+@app.on_event("startup")
+async def warm_up():
+    # 요청을 받기 전에 모델/커넥션/출력 형식을 준비해 첫 요청이 느려지지 않게 한다
+    WORKER_STARTUP.observe(IMPORT_SECONDS, ("import",))
+    warm_up_llm()
+    WORKER_STARTUP.observe(await warm_up_providers(), ("warmup",))
+
+
+@app.on_event("startup")
+async def start_world_pool():
+    app.state.world_pool_task = asyncio.create_task(refill_loop(world_pool, session_store))
+    app.state.metrics_task = asyncio.create_task(flush_loop())
+
+
+# --- 세션 헬퍼 ---
+def get_session_id(
+    x_session_id: Optional[str] = Header(default=None),
+    session_id: Optional[str] = Query(default=None),
+    session_cookie: Optional[str] = Cookie(default=None, alias="session_id"),
+) -> Optional[str]:
+    # 헤더 > 쿼리 > 쿠키 순으로 세션 ID 확인
+    return x_session_id or session_id or session_cookie
+
+
+@asynccontextmanager
+async def locked_session(session_id: Optional[str]):
+    if not session_id:
+        raise HTTPException(status_code=400, detail="게임이 시작되지 않았습니다.")
+    try:
+        async with session_store.alock(session_id):
+            yield
+    except SessionBusy:
+        raise HTTPException(status_code=409, detail="이전 요청을 처리 중입니다. 잠시 후 다시 시도해주세요.")
+
+
+def load_game_state(session_id: str) -> MazeState:
+    game_state = session_store.load(session_id)
+    if game_state is None:
+        raise HTTPException(status_code=400, detail="게임이 시작되지 않았습니다.")
+    return normalize_step(game_state)
 
 # --- Request/Response 모델 ---
 class MazeResponse(BaseModel):
@@ -29,93 +142,114 @@ class MazeResponse(BaseModel):
     userPos: List[int]
     npcCnt: int
     npcPos: List[List[int]]
-    exitPos: List[int]
+    # 시야 제한(MAZE_VIEW_RADIUS)이 켜져 있으면 아직 보지 못한 칸은 -1, 못 본 출구는 None
+    exitPos: Optional[List[int]]
 
 
 
 class MazeRequest(BaseModel):
     loc : List[int]
 
-def get_maze_data() -> MazeResponse:
-    return MazeResponse(
-        width=11,
-        height=11,
-        maze=[
-            [1, 1, 1, 1, 1, 1, 4, 1, 1, 1, 1],
-            [1, 0, 0, 0, 0, 1, 0, 0, 1, 0, 1],
-            [1, 1, 1, 0, 1, 1, 1, 0, 0, 0, 1],
-            [1, 2, 0, 0, 1, 0, 2, 1, 0, 1, 1],
-            [1, 1, 0, 1, 1, 0, 1, 1, 0, 1, 1],
-            [1, 1, 0, 0, 0, 3, 0, 0, 0, 0, 1],
-            [1, 0, 0, 1, 1, 0, 1, 1, 1, 0, 1],
-            [1, 1, 0, 0, 1, 0, 0, 0, 0, 0, 1],
-            [1, 1, 1, 0, 0, 0, 1, 0, 1, 1, 1],
-            [1, 0, 0, 0, 1, 0, 1, 0, 0, 2, 1],
-            [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1]
-        ],
-        userPos=[5, 5],
-        npcCnt=3,
-        npcPos=[
-            [3, 1],
-            [3, 6],
-            [9, 9]
-        ],
-        exitPos=[0, 6]
-    )
-
-
-def post_maze_data(req: MazeRequest) -> MazeResponse:
-    maze_data = {
-        "width": 11,
-        "height": 11,
-        "maze": [
-            [1, 1, 1, 1, 1, 1, 4, 1, 1, 1, 1],
-            [1, 0, 0, 0, 0, 1, 0, 0, 1, 0, 1],
-            [1, 1, 1, 0, 1, 1, 1, 0, 0, 0, 1],
-            [1, 2, 0, 0, 1, 0, 2, 1, 0, 1, 1],
-            [1, 1, 0, 1, 1, 0, 1, 1, 0, 1, 1],
-            [1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 1],
-            [1, 0, 0, 1, 1, 0, 1, 1, 1, 0, 1],
-            [1, 1, 0, 0, 1, 0, 0, 0, 0, 0, 1],
-            [1, 1, 1, 0, 0, 0, 1, 0, 1, 1, 1],
-            [1, 0, 0, 0, 1, 0, 1, 0, 0, 2, 1],
-            [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1]
-        ],
-        "userPos": [5, 5],
-        "npcCnt": 3,
-        "npcPos": [
-            [3, 1],
-            [3, 6],
-            [9, 9]
-        ],
-        "exitPos": [0, 6]
-    }
-
-    # 요청으로부터 입력받은 좌표 (예: [행, 열])
-    input_coord = req.loc
-
-    # NPC 좌표 리스트에서 입력 좌표와 일치하는 좌표 제거
-    new_npcPos = [npc for npc in maze_data["npcPos"] if npc != input_coord]
-    maze_data["npcPos"] = new_npcPos
-    maze_data["npcCnt"] = len(new_npcPos)
-
-    # 사용자 좌표 업데이트
-    maze_data["userPos"] = input_coord
+class MazeDeltaRequest(BaseModel):
+    loc: Optional[List[int]] = None
+    version: Optional[int] = None   # 클라이언트가 마지막으로 받은 버전
+    encoding: str = "rle"           # 전체 격자를 보낼 때의 인코딩 (rows | rle | bitpack)
 
-    # 해당 좌표에 값 3으로 설정
-    row, col = input_coord
-    maze_data["maze"][row][col] = 3
 
-    return MazeResponse(**maze_data)
+class MazeQueryResponse(BaseModel):
+    userPos: List[int]
+    reachable: bool
+    # 시야 제한이 켜져 있으면 본 칸만으로 계산하고, 출구/NPC를 아직 못 봤으면 None
+    distanceToExit: Optional[int] = None
+    nearestNpcPos: Optional[List[int]] = None
+    nearestNpcDistance: Optional[int] = None
+    moves: int
+    finished: bool
+
+
+def maze_key(session_id: str) -> str:
+    return f"maze:{session_id}"
+
+
+# 미리 만들어 평가해 둔 미로 카탈로그 (MAZE_CATALOG_PATH, maze_batch.py로 생성)
+# 읽기 전용 메모리 매핑이라 --preload로 fork된 워커들이 같은 페이지를 나눠 쓴다
+maze_catalog = load_maze_catalog()
+
+
+def session_maze_config(difficulty: Optional[str] = None) -> dict:
+    # 카탈로그가 있으면 요청한 난이도 구간에서 고르고, 없으면 새 시드로 만든다
+    if maze_catalog is not None:
+        config = maze_catalog.pick(difficulty)
+        if config is not None:
+            return config
+    return new_maze_config()
+
+
+def load_maze_session(session_id: Optional[str], create: bool = False) -> Optional[MazeSession]:
+    if not session_id:
+        return None
+    data = session_store.load_raw(maze_key(session_id))
+    if data is not None:
+        return MazeSession.load(data)
+    if not create:
+        return None
+    # 세션마다 새 시드로 미로를 만든다 (시드와 위치만 저장)
+    maze_session = MazeSession.start(session_maze_config())
+    session_store.save_raw(maze_key(session_id), maze_session.dump())
+    return maze_session
+
+
+def get_maze_data(session_id: Optional[str] = None) -> MazeResponse:
+    maze_session = load_maze_session(session_id, create=True)
+    if maze_session is None:
+        maze_session = MazeSession.start(new_maze_config(MAZE_DEFAULT_SEED))
+    return MazeResponse(**maze_session.to_response())
+
+
+def post_maze_data(req: MazeRequest, session_id: Optional[str] = None) -> MazeResponse:
+    if not session_id:
+        # 세션이 없으면 이동 기록을 알 수 없으므로 벽만 검사
+        maze_session = MazeSession.start(new_maze_config(MAZE_DEFAULT_SEED))
+        if not maze_session.engine.is_open(req.loc):
+            raise HTTPException(status_code=400, detail="이동할 수 없는 위치입니다.")
+        maze_session.pos = tuple(req.loc)
+        maze_session.move(req.loc)
+        maze_session.look()
+        return MazeResponse(**maze_session.to_response())
+
+    try:
+        with session_store.lock(maze_key(session_id)):
+            maze_session = load_maze_session(session_id, create=True)
+            # 상하좌우 한 칸 이동만 허용, 벽은 통과 불가
+            if maze_session.move(req.loc) is None:
+                raise HTTPException(status_code=400, detail="이동할 수 없는 위치입니다.")
+            session_store.save_raw(maze_key(session_id), maze_session.dump())
+    except SessionBusy:
+        raise HTTPException(status_code=409, detail="이전 요청을 처리 중입니다. 잠시 후 다시 시도해주세요.")
+
+    return MazeResponse(**maze_session.to_response())
 
 class StartRequest(BaseModel):
     name : str
     location: str
     mood: str
+    # True면 이미지를 기다리지 않고 imageJobId만 먼저 반환
+    asyncImage: bool = False
+    # 미로 난이도 구간 (미로 카탈로그가 있을 때만 적용)
+    difficulty: Optional[Literal["easy", "medium", "hard"]] = None
 
 class StartResponse(BaseModel):
     worldDescription: str
     image: str
+    sessionId: str
+    imageJobId: Optional[str] = None
+    # 로컬에 저장된 이미지의 크기별 변형 주소 (full/medium/thumb)
+    imageVariants: Dict[str, str] = {}
+
+class ImageJobResponse(BaseModel):
+    status: str
+    image: str
+    imageVariants: Dict[str, str] = {}
 
 class NpcQuizResponse(BaseModel):
     quiz : str
@@ -140,11 +274,64 @@ class EndGameResponse(BaseModel):
 # ----------------------------------
 
 @app.post("/maze", response_model=MazeResponse)
-def maze_endpoint(req: Optional[MazeRequest] = Body(default=None)):
+def maze_endpoint(req: Optional[MazeRequest] = Body(default=None),
+                  session_id: Optional[str] = Depends(get_session_id)):
     if req is None:
-        return get_maze_data()
+        return get_maze_data(session_id)
     else:
-        return post_maze_data(req)
+        return post_maze_data(req, session_id)
+
+
+def maze_delta_step(session_id: str, req: MazeDeltaRequest) -> Tuple[dict, int]:
+    # 호출하는 쪽에서 maze_key 락을 잡은 상태여야 한다. (응답, 새로 만난 NPC 번호 또는 -1)
+    maze_session = load_maze_session(session_id, create=True)
+    # 처음 요청이거나 버전이 어긋나면 이동은 적용하지 않고 전체 상태로 다시 맞춘다
+    if req.loc is None or req.version != maze_session.version:
+        return maze_session.snapshot(req.encoding), -1
+    prev_pos = maze_session.pos
+    met = maze_session.move(req.loc)
+    if met is None:
+        raise HTTPException(status_code=400, detail="이동할 수 없는 위치입니다.")
+    if maze_session.pos != prev_pos:
+        session_store.save_raw(maze_key(session_id), maze_session.dump())
+    return maze_session.delta(prev_pos, met), met
+
+
+def json_response(data: dict) -> Response:
+    # 응답 모델 검증 없이 바로 직렬화 (자주 호출되는 작은 응답용)
+    return Response(content=json.dumps(data, separators=(",", ":")), media_type="application/json")
+
+
+@app.post("/maze/delta")
+def maze_delta(req: MazeDeltaRequest, session_id: Optional[str] = Depends(get_session_id)):
+    if req.encoding not in GRID_ENCODINGS:
+        raise HTTPException(status_code=400, detail="지원하지 않는 인코딩입니다.")
+    if not session_id:
+        if req.loc is not None:
+            raise HTTPException(status_code=400, detail="세션이 없습니다. 먼저 세계관을 생성해주세요.")
+        return json_response(MazeSession.start(new_maze_config(MAZE_DEFAULT_SEED)).snapshot(req.encoding))
+
+    try:
+        with session_store.lock(maze_key(session_id)):
+            update, _ = maze_delta_step(session_id, req)
+    except SessionBusy:
+        raise HTTPException(status_code=409, detail="이전 요청을 처리 중입니다. 잠시 후 다시 시도해주세요.")
+    return json_response(update)
+
+
+@app.get("/maze/query", response_model=MazeQueryResponse)
+def maze_query(session_id: Optional[str] = Depends(get_session_id)):
+    # 미리 계산한 거리 지도로 O(1) 조회 (시야 제한이 켜져 있으면 본 칸만 따라가는 BFS)
+    maze_session = load_maze_session(session_id)
+    if maze_session is None:
+        raise HTTPException(status_code=400, detail="미로가 시작되지 않았습니다.")
+    return MazeQueryResponse(
+        userPos=list(maze_session.pos),
+        reachable=maze_session.engine.is_reachable(maze_session.pos),
+        **maze_session.query(),
+        moves=maze_session.moves,
+        finished=maze_session.finished,
+    )
 
 
 
@@ -152,60 +339,220 @@ def maze_endpoint(req: Optional[MazeRequest] = Body(default=None)):
 # ----------------------------------
 # 1) 게임 시작 API
 # ----------------------------------
-@app.post("/world", response_model=StartResponse)
-def start_game(req: StartRequest):
-    # 1) 새 MazeState
-    global game_state
-    # num은 필수 int 필드이므로 0 등 초기값을 지정
-    game_state = MazeState(
+def new_game_state(req: StartRequest, maze_session: MazeSession) -> MazeState:
+    return MazeState(
         name=req.name,
         setting=req.location,
         atmosphere=req.mood,
-        num="0",
         step="start",
-        quiz = "",
-        option1 = "",
-        option2 = "",
-        option3 = ""
+        # 만날 NPC 수는 이 세션 미로의 NPC 수를 따른다
+        npc_count = len(maze_session.engine.maze.npc_pos)
     )
 
-    game_state = advance_game(game_state)
 
-    image_prompt = (
-        f"The location is {req.location} and the mood is {req.mood}. Create a pixel-style image related to this location and mood."
-    )
-    image_url = generate_image(image_prompt, size="1024x1024")
+def register_session(game_state: MazeState, maze_session: MazeSession, pooled: Optional[dict] = None,
+                     session_id: Optional[str] = None) -> str:
+    # 세션 발급 및 저장
+    session_id = session_id or new_session_id()
+    session_store.save(session_id, game_state)
+    session_store.save_raw(maze_key(session_id), maze_session.dump())
 
+    # 플레이어가 미로를 걷는 동안 NPC 퀴즈를 미리 생성
+    if pooled and pooled["quizzes"]:
+        store_quizzes(session_store, session_id, pooled["quizzes"][:game_state.npc_count])
+    else:
+        start_quiz_prefetch(session_store, session_id, game_state.story_data, 0, game_state.name,
+                            game_state.npc_count)
+    return session_id
+
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/world", response_model=StartResponse)
+async def start_game(req: StartRequest, request: Request, response: Response):
+    set_llm_priority(PRIORITY_WORLD)
+    set_deadline("world")
+    # 1) 새 미로와 MazeState
+    maze_session = MazeSession.start(session_maze_config(req.difficulty))
+    game_state = new_game_state(req, maze_session)
+
+    # 미리 만들어 둔 세계관이 있으면 LLM 호출 없이 이름만 바꿔서 사용
+    pooled = world_pool.take(req.location, req.mood, req.name)
+    image_url = pooled["image"] if pooled else ""
+
+    # 이미지가 없으면 (이미지 프롬프트는 장소/분위기에만 의존하므로) 스토리 생성과 동시에 시작
+    image_job_id = None
+    image_task = None
+    if not image_url:
+        image_prompt = build_image_prompt(req.location, req.mood)
+        if req.asyncImage:
+            image_job_id = start_image_job(session_store, image_prompt, size="1024x1024")
+        else:
+            image_task = asyncio.create_task(generate_image(image_prompt, size="1024x1024"))
+
+    if pooled:
+        game_state = apply_story(game_state, pooled["story_data"])
+    else:
+        try:
+            game_state = await advance_game(game_state)
+        except BaseException:
+            # 세계관을 못 만들었거나 클라이언트가 떠났으면 세션이 없으므로 이미지 생성도 멈춘다
+            if image_task is not None:
+                image_task.cancel()
+            if image_job_id is not None:
+                cancel_image_job(session_store, image_job_id)
+            raise
+
+    if image_task is not None:
+        try:
+            image_url = await image_task
+        except GovernorOverloaded:
+            # 이미 비용을 치른 세계관은 버리지 않는다: 이미지 한도 초과면 이미지 없이 시작
+            image_url = ""
+
+    # 2) 세션 발급 및 퀴즈 사전 생성
+    session_id = register_session(game_state, maze_session, pooled)
+    response.set_cookie("session_id", session_id, max_age=int(SESSION_TTL), httponly=True)
 
     return StartResponse(
         worldDescription = game_state.message,
-        image = image_url
+        image = public_image_url(image_url, str(request.base_url)),
+        sessionId = session_id,
+        imageJobId = image_job_id,
+        imageVariants = public_image_variants(image_url, str(request.base_url))
     )
 
 
+async def world_stream_events(req: StartRequest, session_id: str, base_url: str):
+    # (이벤트, 데이터)를 차례로 내보낸다. SSE와 WebSocket이 함께 사용
+    set_llm_priority(PRIORITY_WORLD)
+    set_deadline("world")
+    maze_session = MazeSession.start(session_maze_config(req.difficulty))
+    game_state = new_game_state(req, maze_session)
+    pooled = world_pool.take(req.location, req.mood, req.name)
+    image_url = pooled["image"] if pooled else ""
+    image_job_id = None
+    if not image_url:
+        # 이미지 한도 초과는 작업 상태("overloaded")로 남으므로 세계관 스트림은 그대로 진행
+        image_job_id = start_image_job(session_store, build_image_prompt(req.location, req.mood), size="1024x1024")
+
+    registered = False
+    try:
+        if pooled:
+            game_state = apply_story(game_state, pooled["story_data"])
+            fields = story_fields(game_state)
+            yield "background", fields["background"]
+            yield "objective", fields["objective"]
+        else:
+            try:
+                async for field, value in stream_story(game_state):
+                    yield field, value
+            except ValueError:
+                yield "error", {"detail": "세계관 생성에 실패했습니다."}
+                return
+            except GovernorOverloaded as e:
+                yield "error", {"detail": OVERLOADED_DETAIL, "status": 503, "retryAfter": e.retry_after}
+                return
+            except DeadlineExceeded:
+                yield "error", {"detail": "응답 시간이 초과되었습니다. 잠시 후 다시 시도해주세요.", "status": 504}
+                return
+
+        register_session(game_state, maze_session, pooled, session_id)
+        registered = True
+    finally:
+        # 세계관 생성이 실패했거나 클라이언트가 중간에 떠났으면 이미지 작업도 멈춘다
+        if not registered and image_job_id is not None:
+            cancel_image_job(session_store, image_job_id)
+    yield "done", {
+        "worldDescription": game_state.message,
+        "image": public_image_url(image_url, base_url),
+        "sessionId": session_id,
+        "imageJobId": image_job_id,
+        "imageVariants": public_image_variants(image_url, base_url),
+    }
+
+
+@app.post("/world/stream")
+async def start_game_stream(req: StartRequest, request: Request):
+    # background / objective가 완성되는 대로 SSE로 보내고, 이미지는 항상 작업 ID로 전달
+    session_id = new_session_id()
+
+    async def events():
+        async for event, data in world_stream_events(req, session_id, str(request.base_url)):
+            yield sse_event(event, data)
+
+    response = StreamingResponse(events(), media_type="text/event-stream")
+    response.set_cookie("session_id", session_id, max_age=int(SESSION_TTL), httponly=True)
+    return response
+
+
+@app.get("/world/image/{job_id}", response_model=ImageJobResponse)
+async def get_world_image(job_id: str, request: Request):
+    job = get_image_job(session_store, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="이미지 작업을 찾을 수 없습니다.")
+    if job["status"] == "overloaded":
+        raise GovernorOverloaded(job.get("retryAfter", 0.0))
+    base_url = str(request.base_url)
+    return ImageJobResponse(status=job["status"], image=public_image_url(job["image"], base_url),
+                            imageVariants=public_image_variants(job["image"], base_url))
+
+
+@app.get("/images/{digest}/{variant}")
+async def get_stored_image(digest: str, variant: str, if_none_match: Optional[str] = Header(default=None)):
+    # 내용 해시 주소라 파일이 바뀌지 않는다: 오래 캐시하고 ETag/Range(FileResponse)를 지원
+    path = stored_image_path(digest, variant)
+    if path is None:
+        raise HTTPException(status_code=404, detail="이미지를 찾을 수 없습니다.")
+    etag = f'"{digest}-{variant}"'
+    headers = {"Cache-Control": IMAGE_CACHE_CONTROL, "ETag": etag}
+    if if_none_match is not None and (if_none_match.strip() == "*" or etag in if_none_match):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=sniff_media_type(path), headers=headers)
+
+
 # ----------------------------------
 # 2) NPC 퀴즈 요청 API
 # ----------------------------------
+async def npc_quiz_step(session_id: Optional[str]) -> MazeState:
+    set_llm_priority(PRIORITY_QUIZ)
+    set_deadline("quiz")
+    async with locked_session(session_id):
+        game_state = load_game_state(session_id)
+        if game_state.step != "encounter_question":
+            raise HTTPException(
+                status_code=400,
+                detail=f"현재 {game_state.step} 단계에서는 새 퀴즈를 받을 수 없습니다."
+            )
+
+        # 미리 생성된 퀴즈가 있으면 그대로 사용
+        npc_index = game_state.npc_index
+        prefetched = await take_quiz(session_store, session_id, npc_index)
+
+        # 다음 NPC 퀴즈 생성 시작 (현재 퀴즈를 지금 만들어야 하면 그동안 함께 생성된다)
+        start_quiz_prefetch(session_store, session_id, game_state.story_data, npc_index + 1, game_state.name,
+                            game_state.npc_count)
+
+        # NPC 퀴즈 단계로 진행
+        game_state = await advance_game(game_state, prefetched_quiz=prefetched, thread_id=session_id)
+        session_store.save(session_id, game_state)
+    return game_state
+
+
+def quiz_payload(game_state: MazeState) -> dict:
+    return {
+        "quiz": game_state.quiz,
+        "option1": game_state.option1,
+        "option2": game_state.option2,
+        "option3": game_state.option3,
+    }
+
+
 @app.get("/npc_quiz", response_model=NpcQuizResponse)
-def get_npc_quiz():
-    global game_state
-    if game_state is None:
-        raise HTTPException(status_code=400, detail="게임이 시작되지 않았습니다.")
-    
-    valid_quiz_steps = [
-        "first_encounter_question",
-        "second_encounter_question",
-        "third_encounter_question"
-    ]
-
-    if game_state.step not in valid_quiz_steps:
-        raise HTTPException(
-            status_code=400,
-            detail=f"현재 {game_state.step} 단계에서는 새 퀴즈를 받을 수 없습니다."
-        )
-
-    # NPC 퀴즈 단계로 진행
-    game_state = advance_game(game_state)
+async def get_npc_quiz(session_id: Optional[str] = Depends(get_session_id)):
+    game_state = await npc_quiz_step(session_id)
 
     # game_state.message가 NPC의 퀴즈 텍스트
     return NpcQuizResponse(
@@ -219,25 +566,26 @@ def get_npc_quiz():
 # ----------------------------------
 # 3) NPC 퀴즈 정답 제출 API
 # ----------------------------------
-@app.post("/npc_quiz_result", response_model=NpcQuizResultResponse)
-def post_npc_quiz_result(req: NpcQuizResultRequest):
-    global game_state
-    if game_state is None:
-        raise HTTPException(status_code=400, detail="게임이 시작되지 않았습니다.")
+async def npc_quiz_result_step(session_id: Optional[str], answer: str) -> MazeState:
+    set_llm_priority(PRIORITY_QUIZ)
+    set_deadline("followup")
+    async with locked_session(session_id):
+        game_state = load_game_state(session_id)
+        if game_state.step != "encounter_followup":
+            raise HTTPException(
+                status_code=400,
+                detail=f"현재 {game_state.step} 단계에서는 퀴즈 답변을 제출할 수 없습니다."
+            )
+
+        # 정답 체크
+        game_state = await advance_game(game_state, answer, thread_id=session_id)
+        session_store.save(session_id, game_state)
+    return game_state
 
-    valid_followup_steps = [
-        "first_encounter_followup",
-        "second_encounter_followup",
-        "third_encounter_followup"
-    ]
-    if game_state.step not in valid_followup_steps:
-        raise HTTPException(
-            status_code=400,
-            detail=f"현재 {game_state.step} 단계에서는 퀴즈 답변을 제출할 수 없습니다."
-        )
-
-    # 정답 체크
-    game_state = advance_game(game_state, req.answer)
+
+@app.post("/npc_quiz_result", response_model=NpcQuizResultResponse)
+async def post_npc_quiz_result(req: NpcQuizResultRequest, session_id: Optional[str] = Depends(get_session_id)):
+    game_state = await npc_quiz_result_step(session_id, req.answer)
     return NpcQuizResultResponse(
         answerDescription=game_state.message,
         result=game_state.num
@@ -247,10 +595,270 @@ def post_npc_quiz_result(req: NpcQuizResultRequest):
 # 4) 게임 결말 API
 # ----------------------------------
 @app.get("/end_game", response_model=EndGameResponse)
-def end_game():
-    global game_state
-    game_state = advance_game(game_state)
+async def end_game(session_id: Optional[str] = Depends(get_session_id)):
+    set_llm_priority(PRIORITY_ENDING)
+    set_deadline("ending")
+    async with locked_session(session_id):
+        game_state = load_game_state(session_id)
+        game_state = await advance_game(game_state, thread_id=session_id)
+        session_store.save(session_id, game_state)
     return EndGameResponse(
         finishDescription = game_state.message
     )
 
+
+async def end_game_events(session_id: str, game_state: MazeState):
+    # 호출하는 쪽에서 세션 락을 잡은 상태여야 한다
+    set_llm_priority(PRIORITY_ENDING)
+    set_deadline("ending")
+    # 예산 초과/과부하/제공자 오류는 stream_end_game이 템플릿이나 받은 데까지로 마무리한다
+    async for token in stream_end_game(game_state):
+        yield "token", token
+    session_store.save(session_id, game_state)
+    yield "done", {"finishDescription": game_state.message}
+
+
+@app.get("/end_game/stream")
+async def end_game_stream(session_id: Optional[str] = Depends(get_session_id)):
+    # 스트림이 끝날 때까지 세션 락을 유지
+    stack = AsyncExitStack()
+    await stack.enter_async_context(locked_session(session_id))
+    try:
+        game_state = load_game_state(session_id)
+    except Exception:
+        await stack.aclose()
+        raise
+
+    async def events():
+        try:
+            async for event, data in end_game_events(session_id, game_state):
+                yield sse_event(event, data)
+        finally:
+            await stack.aclose()
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+# ----------------------------------
+# 5) WebSocket 게임 채널
+# ----------------------------------
+# 클라이언트 → 서버: {"type": "move" | "sync" | "world" | "quiz" | "answer" | "end" | "ping", ...}
+# 서버 → 클라이언트: {"type": 이벤트, "data": 내용}
+#   maze(delta/full), encounter, quiz, result, background, objective, world, token, ending, error, pong
+WS_CONNECTIONS = Gauge("ws_connections", "열려 있는 WebSocket 연결 수")
+WS_MESSAGES = Counter("ws_messages_total", "받은 WebSocket 메시지 수", ("type",))
+WS_LATENCY = Histogram("ws_message_duration_seconds", "WebSocket 메시지 처리 시간", ("type", "outcome"))
+
+
+class GameChannel:
+    # 연결마다 만들어지는 작은 객체. 5천 개 이상 열려 있어도 부담이 없도록 상태를 최소화
+    __slots__ = ("websocket", "session_id", "send_lock", "tasks")
+
+    def __init__(self, websocket: WebSocket, session_id: Optional[str]):
+        self.websocket = websocket
+        self.session_id = session_id
+        self.send_lock = asyncio.Lock()
+        self.tasks = set()
+
+    async def send(self, event: str, data) -> None:
+        text = json.dumps({"type": event, "data": data}, ensure_ascii=False, separators=(",", ":"))
+        async with self.send_lock:
+            await self.websocket.send_text(text)
+
+    async def send_error(self, request: Optional[str], status: int, detail) -> None:
+        await self.send("error", {"request": request, "status": status, "detail": detail})
+
+    def spawn(self, kind: str, coro) -> None:
+        # LLM을 기다리는 요청은 백그라운드로 돌려 이동 메시지를 계속 받는다
+        task = asyncio.create_task(self.guarded(kind, coro))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def guarded(self, kind: Optional[str], coro) -> None:
+        start = time.perf_counter()
+        outcome = "ok"
+        try:
+            await coro
+        except HTTPException as e:
+            outcome = str(e.status_code)
+            await self.send_error(kind, e.status_code, e.detail)
+        except ValidationError as e:
+            outcome = "422"
+            await self.send_error(kind, 422, e.errors(include_url=False))
+        except GovernorOverloaded as e:
+            outcome = "503"
+            await self.send("error", {"request": kind, "status": 503, "detail": OVERLOADED_DETAIL,
+                                      "retryAfter": e.retry_after})
+        except DeadlineExceeded:
+            outcome = "504"
+            await self.send_error(kind, 504, "응답 시간이 초과되었습니다. 잠시 후 다시 시도해주세요.")
+        except WebSocketDisconnect:
+            outcome = "disconnect"
+        finally:
+            WS_LATENCY.observe(time.perf_counter() - start, (kind or "", outcome))
+
+    def close(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+
+    # --- 메시지 처리 ---
+    async def on_move(self, msg: dict) -> None:
+        if not self.session_id:
+            raise HTTPException(status_code=400, detail="세션이 없습니다. 먼저 세계관을 생성해주세요.")
+        req = MazeDeltaRequest(loc=msg.get("loc"), version=msg.get("version"),
+                               encoding=msg.get("encoding", "rle"))
+        if req.encoding not in GRID_ENCODINGS:
+            raise HTTPException(status_code=400, detail="지원하지 않는 인코딩입니다.")
+        try:
+            async with session_store.alock(maze_key(self.session_id)):
+                update, met = maze_delta_step(self.session_id, req)
+        except SessionBusy:
+            raise HTTPException(status_code=409, detail="이전 요청을 처리 중입니다. 잠시 후 다시 시도해주세요.")
+        await self.send("maze", update)
+
+        if met >= 0:
+            await self.send("encounter", {"npcPos": update["npcRemoved"]})
+            # 미리 만들어 둔 퀴즈를 바로 밀어 준다
+            game_state = session_store.load(self.session_id)
+            if game_state is not None and normalize_step(game_state).step == "encounter_question":
+                self.spawn("quiz", self.on_quiz(msg))
+
+    async def on_world(self, msg: dict) -> None:
+        req = StartRequest(**{k: v for k, v in msg.items() if k != "type"})
+        session_id = new_session_id()
+        async for event, data in world_stream_events(req, session_id, str(self.websocket.base_url)):
+            if event == "done":
+                self.session_id = session_id
+                event = "world"
+            await self.send(event, data)
+
+    async def on_quiz(self, msg: dict) -> None:
+        game_state = await npc_quiz_step(self.session_id)
+        await self.send("quiz", quiz_payload(game_state))
+
+    async def on_answer(self, msg: dict) -> None:
+        game_state = await npc_quiz_result_step(self.session_id, str(msg.get("answer", "")))
+        await self.send("result", {"answerDescription": game_state.message, "result": game_state.num})
+
+    async def on_end(self, msg: dict) -> None:
+        async with locked_session(self.session_id):
+            game_state = load_game_state(self.session_id)
+            async for event, data in end_game_events(self.session_id, game_state):
+                await self.send("ending" if event == "done" else event, data)
+
+
+# 바로 처리하는 메시지 / LLM을 기다려서 백그라운드로 돌리는 메시지
+WS_INLINE = {"move": GameChannel.on_move}
+WS_BACKGROUND = {
+    "world": GameChannel.on_world,
+    "quiz": GameChannel.on_quiz,
+    "answer": GameChannel.on_answer,
+    "end": GameChannel.on_end,
+}
+# 지표 라벨용 (알 수 없는 종류는 하나로 묶어 라벨 수가 늘지 않게 한다)
+WS_TYPES = {"ping", "sync", *WS_INLINE, *WS_BACKGROUND}
+
+
+@app.websocket("/ws/game")
+async def game_socket(websocket: WebSocket, session_id: Optional[str] = Depends(get_session_id)):
+    await websocket.accept()
+    channel = GameChannel(websocket, session_id)
+    WS_CONNECTIONS.inc()
+    try:
+        while True:
+            try:
+                msg = json.loads(await websocket.receive_text())
+                kind = msg.get("type")
+            except (ValueError, AttributeError):
+                await channel.send_error(None, 400, "잘못된 메시지 형식입니다.")
+                continue
+            WS_MESSAGES.inc((kind if kind in WS_TYPES else "unknown",))
+
+            if kind == "ping":
+                await channel.send("pong", msg.get("data"))
+            elif kind == "sync":
+                await channel.guarded(kind, channel.on_move({"encoding": msg.get("encoding", "rle")}))
+            elif kind in WS_INLINE:
+                await channel.guarded(kind, WS_INLINE[kind](channel, msg))
+            elif kind in WS_BACKGROUND:
+                channel.spawn(kind, WS_BACKGROUND[kind](channel, msg))
+            else:
+                await channel.send_error(kind, 400, "알 수 없는 메시지입니다.")
+    except WebSocketDisconnect:
+        pass
+    finally:
+        WS_CONNECTIONS.dec()
+        channel.close()
+
+
+# ----------------------------------
+# 6) 캐시 통계
+# ----------------------------------
+@app.get("/cache/stats")
+async def cache_stats():
+    return response_cache.stats()
+
+
+@app.get("/pool/stats")
+async def pool_stats():
+    return world_pool.stats()
+
+
+@app.get("/maze/catalog/stats")
+async def maze_catalog_stats():
+    return maze_catalog.stats() if maze_catalog is not None else {"mazes": 0}
+
+
+@app.get("/governor/stats")
+async def governor_stats():
+    return {"llm": llm_governor.stats(), "image": image_governor.stats(), "hedge": hedge_stats(),
+            "parse": parse_stats(), "tokens": token_totals()}
+
+
+# ----------------------------------
+# 7) Prometheus 지표 (모든 워커 합산)
+# ----------------------------------
+# 요청마다 세지 않아도 되는 값은 기존 통계에서 스냅샷 시점에 읽어 온다
+register_collector("llm_tokens_total", "counter", "LLM 토큰 사용량", ("kind", "type"), lambda: {
+    (kind, t): usage[f"{t}_tokens"] for kind, usage in token_totals().items()
+    for t in ("prompt", "completion", "cached_prompt")
+})
+register_collector("llm_calls_total", "counter", "LLM 호출 수 (토큰 기록 기준)", ("kind",), lambda: {
+    (kind,): usage["calls"] for kind, usage in token_totals().items()
+})
+register_collector("llm_parse_total", "counter", "LLM JSON 응답 파싱 결과", ("kind", "outcome"), lambda: {
+    (kind, outcome): count for kind, counter in parse_stats().items() for outcome, count in counter.items()
+})
+register_collector("llm_hedge_events_total", "counter", "헤지/재시도/마감 초과/템플릿 대체 횟수", ("event",), lambda: {
+    (event,): value for event, value in hedge_stats().items() if isinstance(value, int)
+})
+register_collector("cache_requests_total", "counter", "응답 캐시 조회 (hit/miss)", ("kind", "result"), lambda: {
+    **{(kind, "hit"): n for kind, n in list(response_cache.hits.items())},
+    **{(kind, "miss"): n for kind, n in list(response_cache.misses.items())},
+})
+register_collector("world_pool_requests_total", "counter", "세계관 풀 사용 (taken/empty)", ("result",), lambda: {
+    ("taken",): world_pool.taken, ("empty",): world_pool.empty,
+})
+register_collector("governor_in_flight", "gauge", "거버너를 통과해 진행 중인 호출 수", ("governor",), lambda: {
+    (g.name,): g.in_flight for g in (llm_governor, image_governor)
+})
+register_collector("governor_queue_depth", "gauge", "거버너 대기열 길이", ("governor", "priority"), lambda: {
+    (g.name, name): g.depth[i] for g in (llm_governor, image_governor) for i, name in enumerate(PRIORITY_NAMES)
+})
+register_collector("governor_granted_total", "counter", "거버너를 통과한 호출 수", ("governor", "priority"), lambda: {
+    (g.name, name): g.granted[i] for g in (llm_governor, image_governor) for i, name in enumerate(PRIORITY_NAMES)
+})
+register_collector("governor_rejected_total", "counter", "대기열 초과로 거절된 호출 수", ("governor", "priority"), lambda: {
+    (g.name, name): g.rejected[i] for g in (llm_governor, image_governor) for i, name in enumerate(PRIORITY_NAMES)
+})
+
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(collect_all(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/game/tokens")
+async def game_tokens(session_id: Optional[str] = Depends(get_session_id)):
+    # 이 게임에서 쓴 토큰과 게임당 예산 대비 잔량
+    return token_report(load_game_state(session_id).token_usage)
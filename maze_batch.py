@@ -0,0 +1,346 @@
+import argparse
+import os
+import random
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from maze_generator import ALGORITHMS, WALL, GeneratedMaze, bfs_distances, generate_maze
+
+# -------------------------
+# 1) 설정 / 파일 형식
+# -------------------------
+# 미로를 대량으로 만들어 통계를 매기고, 난이도 구간별로 골라 쓸 수 있게 카탈로그 파일로 저장한다.
+# 미로는 (크기, NPC 수, 알고리즘, 시드)로 언제든 똑같이 다시 만들 수 있으므로 격자는 저장하지 않는다.
+MAZE_CATALOG_PATH = os.getenv("MAZE_CATALOG_PATH", "")
+# 난이도 구간 경계 (분위수): 같은 크기 미로끼리 점수 하위 1/3 → easy, 다음 1/3 → medium, 나머지 → hard
+# 점수의 절대값은 크기에 따라 분포가 달라서 크기별 분위수로 나눈다
+MAZE_TIER_QUANTILES = tuple(float(x) for x in os.getenv("MAZE_TIER_QUANTILES", "0.3333,0.6667").split(","))
+TIERS = ("easy", "medium", "hard")
+
+# 파일 = 헤더 16바이트 + 고정 길이 레코드 배열 (np.memmap으로 그대로 연다)
+CATALOG_MAGIC = b"MZCT"
+CATALOG_VERSION = 2
+_HEADER = struct.Struct("<4sHHII")   # magic, version, 레코드 크기, 레코드 수, 예약
+ALGORITHM_NAMES = tuple(ALGORITHMS)
+
+RECORD_DTYPE = np.dtype([
+    ("seed", "<u4"),
+    ("width", "<u2"),
+    ("height", "<u2"),
+    ("npc", "u1"),
+    ("algorithm", "u1"),          # ALGORITHM_NAMES 번호
+    ("tier", "u1"),               # TIERS 번호 (같은 크기 미로 안에서의 점수 분위수)
+    ("path_length", "<u4"),       # 시작 → 출구 최단 거리
+    ("dead_ends", "<u4"),         # 막다른 칸 수 (시작/출구 제외)
+    ("junctions", "<u4"),         # 갈림길 칸 수 (통로 3개 이상)
+    ("path_branches", "<u4"),     # 정답 경로에서 갈라지는 옆길 수
+    ("branching", "<f4"),         # 정답 경로 한 칸당 옆길 수
+    ("difficulty", "<f4"),        # 난이도 점수 (경로 칸 수 + 옆길 수) / 통로 칸 수
+])
+
+
+# -------------------------
+# 2) 미로 통계
+# -------------------------
+def open_degrees(open_mask: np.ndarray) -> np.ndarray:
+    # 각 통로 칸에서 상하좌우로 이어진 통로 수
+    m = open_mask.astype(np.uint8)
+    deg = np.zeros(m.shape, dtype=np.uint8)
+    deg[1:, :] += m[:-1, :]
+    deg[:-1, :] += m[1:, :]
+    deg[:, 1:] += m[:, :-1]
+    deg[:, :-1] += m[:, 1:]
+    return deg * m
+
+
+def difficulty_score(path_length: int, path_branches: int, open_cells: int) -> float:
+    # 걸어야 하는 칸과 경로에서 골라야 하는 갈림길을 미로 크기(통로 칸 수)로 나눈 값
+    # NPC는 생성기가 정답 경로 위에 두므로 경로 길이 외에 더 걷게 만들지 않는다
+    return (path_length + path_branches) / max(1, open_cells)
+
+
+def assign_tiers(records: np.ndarray) -> None:
+    # 크기(너비, 높이)별로 점수 분위수를 구해 tier 열을 채운다 (records를 그 자리에서 고침)
+    sizes = records["width"].astype(np.uint32) << 16 | records["height"]
+    for size in np.unique(sizes):
+        rows = np.flatnonzero(sizes == size)
+        scores = records["difficulty"][rows]
+        bounds = np.quantile(scores, MAZE_TIER_QUANTILES)
+        records["tier"][rows] = np.minimum(np.searchsorted(bounds, scores, side="right"), len(TIERS) - 1)
+
+
+def maze_stats(maze: GeneratedMaze) -> Dict[str, float]:
+    open_mask = maze.grid != WALL
+    deg = open_degrees(open_mask)
+    from_user = bfs_distances(open_mask, maze.user_pos)
+    from_exit = bfs_distances(open_mask, maze.exit_pos)
+    path_length = int(from_user[maze.exit_pos])
+
+    ends = (deg == 1) & open_mask
+    ends[maze.user_pos] = False
+    ends[maze.exit_pos] = False
+    on_path = (from_user >= 0) & (from_exit >= 0) & (from_user + from_exit == path_length)
+    # 경로 위 칸에서 경로 앞뒤 두 칸을 뺀 나머지 통로가 옆길 (시작 칸은 앞이 없다)
+    side = deg.astype(np.int32)[on_path] - 2
+    path_branches = int(np.clip(side, 0, None).sum()) + (int(deg[maze.user_pos]) - 1 if deg[maze.user_pos] > 1 else 0)
+
+    return {
+        "path_length": path_length,
+        "dead_ends": int(ends.sum()),
+        "junctions": int(((deg >= 3) & open_mask).sum()),
+        "path_branches": path_branches,
+        "branching": path_branches / max(1, path_length),
+        "difficulty": difficulty_score(path_length, path_branches, int(open_mask.sum())),
+    }
+
+
+MazeSpec = Tuple[int, int, int, int, str]   # (width, height, npc, seed, algorithm)
+
+
+def measure(spec: MazeSpec) -> tuple:
+    # 프로세스 풀에서 실행: 미로를 만들고 레코드 한 줄(튜플)만 돌려준다 (격자는 보내지 않음)
+    # 난이도 구간은 같은 크기 미로가 다 모인 뒤 assign_tiers에서 정한다
+    width, height, npc, seed, algorithm = spec
+    maze = generate_maze(width, height, npc, seed, algorithm)
+    stats = maze_stats(maze)
+    return (seed, maze.width, maze.height, npc, ALGORITHM_NAMES.index(algorithm), 0,
+            stats["path_length"], stats["dead_ends"], stats["junctions"], stats["path_branches"],
+            stats["branching"], stats["difficulty"])
+
+
+def record_config(record) -> dict:
+    # 카탈로그 레코드 → 세션용 미로 설정 (maze_generator.new_maze_config와 같은 형태)
+    return {
+        "width": int(record["width"]),
+        "height": int(record["height"]),
+        "npc": int(record["npc"]),
+        "algorithm": ALGORITHM_NAMES[int(record["algorithm"])],
+        "seed": int(record["seed"]),
+    }
+
+
+# -------------------------
+# 3) 대량 생성 (프로세스 풀)
+# -------------------------
+def iter_specs(count: int, width: int, height: int, npc: int, algorithms: List[str],
+               seed: int = 0) -> Iterator[MazeSpec]:
+    rng = random.Random(seed)
+    for i in range(count):
+        yield width, height, npc, rng.randrange(2 ** 31), algorithms[i % len(algorithms)]
+
+
+def generate_batch(specs: Iterable[MazeSpec], workers: Optional[int] = None,
+                   chunksize: int = 64) -> Iterator[tuple]:
+    # 순서대로 결과를 내보낸다 (workers=1이면 풀 없이 현재 프로세스에서)
+    if workers == 1:
+        yield from map(measure, specs)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(measure, specs, chunksize=chunksize)
+
+
+def accept_mask(records: np.ndarray, tiers: Optional[set], min_path: int, max_path: int,
+                min_difficulty: float, max_difficulty: float) -> np.ndarray:
+    path_length, difficulty = records["path_length"], records["difficulty"]
+    mask = (min_path <= path_length) & (path_length <= max_path)
+    mask &= (min_difficulty <= difficulty) & (difficulty <= max_difficulty)
+    if tiers is not None:
+        mask &= np.isin(records["tier"], list(tiers))
+    return mask
+
+
+class CatalogWriter:
+    # 레코드를 모아 조금씩 파일 끝에 붙이고, 닫을 때 헤더의 레코드 수를 채운다
+    def __init__(self, path: str, flush_every: int = 4096):
+        self.path = path
+        self.flush_every = flush_every
+        self.count = 0
+        self._pending: List[tuple] = []
+        self._tmp = f"{path}.{os.getpid()}.tmp"
+        self._file = open(self._tmp, "wb")
+        self._file.write(_HEADER.pack(CATALOG_MAGIC, CATALOG_VERSION, RECORD_DTYPE.itemsize, 0, 0))
+
+    def write(self, record: tuple) -> None:
+        self._pending.append(record)
+        if len(self._pending) >= self.flush_every:
+            self.flush()
+
+    def write_array(self, records: np.ndarray) -> None:
+        self.flush()
+        self._file.write(np.ascontiguousarray(records, dtype=RECORD_DTYPE).tobytes())
+        self.count += len(records)
+
+    def flush(self) -> None:
+        if self._pending:
+            self._file.write(np.array(self._pending, dtype=RECORD_DTYPE).tobytes())
+            self.count += len(self._pending)
+            self._pending = []
+
+    def close(self) -> None:
+        self.flush()
+        self._file.seek(0)
+        self._file.write(_HEADER.pack(CATALOG_MAGIC, CATALOG_VERSION, RECORD_DTYPE.itemsize, self.count, 0))
+        self._file.close()
+        # 다 쓴 뒤에 바꿔 끼워서 서버가 반쯤 쓴 파일을 읽지 않게 한다
+        os.replace(self._tmp, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+            os.unlink(self._tmp)
+        return False
+
+
+# -------------------------
+# 4) 카탈로그 읽기 (서버 시작 시 난이도별 색인)
+# -------------------------
+def open_catalog(path: str, mode: str = "r") -> np.ndarray:
+    with open(path, "rb") as f:
+        magic, version, size, count, _ = _HEADER.unpack(f.read(_HEADER.size))
+    if magic != CATALOG_MAGIC or version != CATALOG_VERSION or size != RECORD_DTYPE.itemsize:
+        raise ValueError(f"미로 카탈로그 형식이 맞지 않습니다: {path}")
+    if count == 0:
+        return np.empty(0, dtype=RECORD_DTYPE)
+    return np.memmap(path, dtype=RECORD_DTYPE, mode=mode, offset=_HEADER.size, shape=(count,))
+
+
+class MazeCatalog:
+    # 레코드는 파일을 메모리 매핑해서 읽으므로 워커들이 같은 페이지를 공유한다 (색인만 워커마다)
+    def __init__(self, path: str):
+        self.path = path
+        self.records = open_catalog(path)
+        tiers = self.records["tier"]
+        self.by_tier: Dict[str, np.ndarray] = {name: np.flatnonzero(tiers == i) for i, name in enumerate(TIERS)}
+        self.picked = 0
+        # 요청한 난이도의 미로가 없어서 다른 구간에서 고른 횟수
+        self.fallbacks: Dict[str, int] = {}
+
+    def pick(self, tier: Optional[str] = None, rng: Optional[random.Random] = None) -> Optional[dict]:
+        if not len(self.records):
+            return None
+        rand = (rng or random).randrange
+        candidates = self.by_tier.get(tier) if tier else None
+        if tier and (candidates is None or not len(candidates)):
+            self.fallbacks[tier] = self.fallbacks.get(tier, 0) + 1
+            if self.fallbacks[tier] == 1:
+                print(f"미로 카탈로그에 '{tier}' 난이도가 없어 전체에서 고릅니다: {self.path}")
+            candidates = None
+        index = candidates[rand(len(candidates))] if candidates is not None else rand(len(self.records))
+        self.picked += 1
+        return record_config(self.records[index])
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "mazes": int(len(self.records)),
+            "picked": self.picked,
+            "fallbacks": dict(self.fallbacks),
+            "tiers": {name: int(len(idx)) for name, idx in self.by_tier.items()},
+        }
+
+
+def load_maze_catalog(path: str = MAZE_CATALOG_PATH) -> Optional[MazeCatalog]:
+    # 경로가 없거나 읽을 수 없으면 None (카탈로그 없이 매번 새 시드로 만든다)
+    if not path:
+        return None
+    try:
+        return MazeCatalog(path)
+    except (OSError, ValueError) as e:
+        print("미로 카탈로그를 불러오지 못했습니다:", e)
+        return None
+
+
+# -------------------------
+# 5) CLI
+# -------------------------
+# 사용 예:
+#   python maze_batch.py generate mazes.cat --count 20000 --size 11 --algorithms backtracker prim wilson
+#   python maze_batch.py generate hard.cat --count 5000 --tier hard --min-path 40
+#   python maze_batch.py stats mazes.cat
+#   MAZE_CATALOG_PATH=mazes.cat gunicorn ... main:app   → /world, /maze가 카탈로그에서 고른다
+def cmd_generate(args) -> None:
+    algorithms = args.algorithms or list(ALGORITHMS)
+    for name in algorithms:
+        if name not in ALGORITHMS:
+            raise SystemExit(f"알 수 없는 미로 알고리즘: {name}")
+    tiers = {TIERS.index(t) for t in args.tier} if args.tier else None
+    specs = iter_specs(args.count, args.size, args.height or args.size, args.npc, algorithms, args.seed)
+    start = time.perf_counter()
+    # 1) 전부 임시 카탈로그로 흘려 쓰고 2) 크기별 분위수로 난이도 구간을 매긴 뒤 3) 조건에 맞는 것만 남긴다
+    everything = f"{args.output}.all"
+    with CatalogWriter(everything) as writer:
+        for record in generate_batch(specs, args.workers, args.chunksize):
+            writer.write(record)
+    generated = writer.count
+    records = open_catalog(everything, mode="r+")
+    assign_tiers(records)
+    records.flush()
+    mask = accept_mask(records, tiers, args.min_path, args.max_path, args.min_difficulty, args.max_difficulty)
+    if mask.all():
+        del records
+        os.replace(everything, args.output)
+    else:
+        with CatalogWriter(args.output) as writer:
+            writer.write_array(records[mask])
+        del records
+        os.unlink(everything)
+    elapsed = time.perf_counter() - start
+    kept = int(mask.sum())
+    print(f"{generated} mazes in {elapsed:.1f}s ({generated / elapsed:.0f}/s), kept {kept}"
+          f" → {args.output} ({os.path.getsize(args.output)} bytes)")
+    print_stats(open_catalog(args.output))
+
+
+def print_stats(records: np.ndarray) -> None:
+    print(f"{'tier':<8} {'count':>7} {'path':>7} {'dead':>6} {'branch':>7} {'score':>6}")
+    for i, name in enumerate(TIERS):
+        rows = records[records["tier"] == i]
+        if not len(rows):
+            print(f"{name:<8} {0:>7}")
+            continue
+        print(f"{name:<8} {len(rows):>7} {rows['path_length'].mean():>7.1f} {rows['dead_ends'].mean():>6.1f}"
+              f" {rows['branching'].mean():>7.2f} {rows['difficulty'].mean():>6.2f}")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="미로 대량 생성/평가 및 난이도별 카탈로그 파일 작성")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    gen = sub.add_parser("generate", help="미로를 만들어 통계를 매기고 조건에 맞는 것만 카탈로그로 저장")
+    gen.add_argument("output")
+    gen.add_argument("--count", type=int, default=10000)
+    gen.add_argument("--size", type=int, default=11, help="너비 (홀수로 맞춤)")
+    gen.add_argument("--height", type=int, default=0, help="높이 (없으면 너비와 같음)")
+    gen.add_argument("--npc", type=int, default=3)
+    gen.add_argument("--algorithms", nargs="+", default=None)
+    gen.add_argument("--seed", type=int, default=0, help="시드 목록을 만드는 시드 (같으면 같은 카탈로그)")
+    gen.add_argument("--workers", type=int, default=None, help="프로세스 수 (기본: CPU 수, 1이면 풀 없이)")
+    gen.add_argument("--chunksize", type=int, default=64)
+    gen.add_argument("--tier", nargs="+", choices=TIERS, default=None)
+    gen.add_argument("--min-path", type=int, default=0)
+    gen.add_argument("--max-path", type=int, default=2 ** 31)
+    gen.add_argument("--min-difficulty", type=float, default=0.0)
+    gen.add_argument("--max-difficulty", type=float, default=float("inf"))
+
+    stats = sub.add_parser("stats", help="카탈로그 파일의 난이도별 요약")
+    stats.add_argument("path")
+
+    args = parser.parse_args(argv)
+    if args.command == "generate":
+        cmd_generate(args)
+    else:
+        print_stats(open_catalog(args.path))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
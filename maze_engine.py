@@ -0,0 +1,472 @@
+import base64
+import json
+import math
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from maze_generator import NPC, PATH, USER, WALL, GeneratedMaze, bfs_distances, maze_from_config
+
+# 이동 방향 (상, 하, 좌, 우)
+DIRECTIONS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+
+# 전체 격자 인코딩 방식
+#  rows:    기존 MazeResponse와 같은 2차원 배열
+#  rle:     행 우선으로 펼친 격자를 [값, 개수, 값, 개수, ...]로 압축
+#  bitpack: 벽 여부만 1비트씩 묶은 base64 (출구/NPC/플레이어는 좌표로 따로 보냄)
+GRID_ENCODINGS = ("rows", "rle", "bitpack")
+
+# 시야 제한(전장의 안개): 플레이어 위치에서 이 반지름 안의, 벽에 가리지 않은 칸만 보낸다 (0이면 끔 → 전체 격자)
+MAZE_VIEW_RADIUS = int(os.getenv("MAZE_VIEW_RADIUS", "0"))
+# 아직 보지 못한 칸의 값
+UNKNOWN = -1
+# 미로 엔진 캐시: 세션마다 시드가 달라 엔진도 살아 있는 세션 수만큼 필요하다.
+# 개수 대신 칸 수로 상한을 두고 (엔진은 칸당 약 40~60바이트 → 기본값이면 워커당 200MB 안쪽),
+# 세션 TTL 동안 쓰이지 않은 엔진(세션이 끝난 미로)부터 비운다
+MAZE_ENGINE_CACHE_CELLS = int(os.getenv("MAZE_ENGINE_CACHE_CELLS", "4000000"))
+MAZE_ENGINE_IDLE = float(os.getenv("MAZE_ENGINE_IDLE", os.getenv("SESSION_TTL", "3600")))
+
+
+def rle_encode(values) -> List[int]:
+    out: List[int] = []
+    prev = None
+    count = 0
+    for v in values:
+        if v == prev:
+            count += 1
+            continue
+        if prev is not None:
+            out += (prev, count)
+        prev, count = v, 1
+    if prev is not None:
+        out += (prev, count)
+    return out
+
+
+def rle_encode_array(values: np.ndarray) -> List[int]:
+    # rle_encode와 같은 결과를 numpy로 (큰 격자를 요청마다 인코딩할 때)
+    if not values.size:
+        return []
+    starts = np.concatenate(([0], np.flatnonzero(values[1:] != values[:-1]) + 1))
+    counts = np.diff(np.append(starts, values.size))
+    return np.column_stack((values[starts], counts)).ravel().tolist()
+
+
+def pack_bits(mask: np.ndarray) -> str:
+    return base64.b64encode(np.packbits(mask.astype(np.uint8)).tobytes()).decode("ascii")
+
+
+# -------------------------
+# 0) 시야 계산
+# -------------------------
+def _round_half_away(x: float) -> int:
+    return int(math.copysign(math.floor(abs(x) + 0.5), x))
+
+
+@lru_cache(maxsize=16)
+def view_rays(radius: int) -> Tuple[tuple, ...]:
+    # 반지름 안의 모든 상대 좌표를 "시선 트리"로 미리 계산한다.
+    # 각 칸의 부모는 중심에서 그 칸으로 가는 직선에서 한 걸음 앞의 칸이고,
+    # 부모가 보이면서 벽이 아니어야 그 칸이 보인다 → 이동마다 칸당 O(1) 검사로 시야가 나온다.
+    # 항목: (dr, dc, 부모 번호 또는 -1(중심), 대각선으로 넘어갈 때 양옆 칸 두 개 또는 None)
+    limit = radius * radius + radius
+    offsets = [(dr, dc) for dr in range(-radius, radius + 1) for dc in range(-radius, radius + 1)
+               if (dr or dc) and dr * dr + dc * dc <= limit]
+    offsets.sort(key=lambda o: (max(abs(o[0]), abs(o[1])), abs(o[0]) + abs(o[1])))
+    index = {(0, 0): -1}
+    rays = []
+    for dr, dc in offsets:
+        n = max(abs(dr), abs(dc))
+        pr, pc = _round_half_away(dr * (n - 1) / n), _round_half_away(dc * (n - 1) / n)
+        # 대각선 틈(양옆이 모두 벽)으로는 보이지 않게 한다
+        sides = ((pr, dc), (dr, pc)) if pr != dr and pc != dc else None
+        index[(dr, dc)] = len(rays)
+        rays.append((dr, dc, index[(pr, pc)], sides))
+    return tuple(rays)
+
+
+def visible_cells(walls: bytearray, height: int, width: int, pos, radius: int) -> List[int]:
+    # pos에서 보이는 칸의 평탄화 번호 (벽도 보이는 칸이면 포함, 그 너머는 가려진다)
+    r0, c0 = pos
+    rays = view_rays(radius)
+    # 빛이 통과하는 칸인지 (보이면서 벽이 아님)
+    through = [False] * len(rays)
+    cells = [r0 * width + c0]
+    for i, (dr, dc, parent, sides) in enumerate(rays):
+        if parent >= 0 and not through[parent]:
+            continue
+        r, c = r0 + dr, c0 + dc
+        # 부모가 범위 밖이면 자식도 범위 밖이라 through가 False로 남아 가지가 잘린다
+        if not (0 <= r < height and 0 <= c < width):
+            continue
+        if sides is not None:
+            (ar, ac), (br, bc) = sides
+            if walls[(r0 + ar) * width + c0 + ac] and walls[(r0 + br) * width + c0 + bc]:
+                continue
+        index = r * width + c
+        cells.append(index)
+        through[i] = not walls[index]
+    return cells
+
+
+# -------------------------
+# 1) 미로 한 개에 대한 사전 계산 결과 (세션 간 공유, 읽기 전용)
+# -------------------------
+class MazeEngine:
+    def __init__(self, maze: GeneratedMaze):
+        self.maze = maze
+        self.height, self.width = maze.grid.shape
+        grid = maze.grid
+        # 벽 여부를 평탄화한 bytearray → 인덱싱이 numpy 스칼라보다 빠르다
+        self.walls = bytearray((grid == WALL).ravel().tolist())
+        open_mask = grid != WALL
+
+        # 출구/각 NPC까지의 BFS 거리 지도를 미로당 한 번만 계산
+        self.dist_exit = bfs_distances(open_mask, maze.exit_pos).ravel()
+        if maze.npc_pos:
+            self.dist_npc = np.stack([bfs_distances(open_mask, p).ravel() for p in maze.npc_pos])
+        else:
+            self.dist_npc = np.empty((0, self.height * self.width), dtype=np.int32)
+        self.npc_index = {tuple(p): i for i, p in enumerate(maze.npc_pos)}
+        self.exit_pos = tuple(maze.exit_pos)
+
+        # NPC/플레이어를 지운 바탕 격자 (응답 만들 때 복사해서 사용)
+        base = grid.copy()
+        base[(base == NPC) | (base == USER)] = PATH
+        self.base_rows: List[List[int]] = base.tolist()
+        self.base_flat: List[int] = base.ravel().tolist()
+        self.base_array = base.ravel().astype(np.int8)
+        self._encoded = {}
+
+    def encoded_grid(self, encoding: str):
+        # NPC/플레이어를 뺀 바탕 격자는 미로마다 고정이므로 인코딩 결과를 재사용
+        cached = self._encoded.get(encoding)
+        if cached is None:
+            if encoding == "rle":
+                cached = rle_encode(self.base_flat)
+            elif encoding == "bitpack":
+                bits = np.packbits(np.frombuffer(bytes(self.walls), dtype=np.uint8))
+                cached = base64.b64encode(bits.tobytes()).decode("ascii")
+            else:
+                cached = self.base_rows
+            self._encoded[encoding] = cached
+        return cached
+
+    def fog_grid(self, seen: bytearray, encoding: str):
+        # 본 칸만 채우고 나머지는 UNKNOWN (bitpack은 본 칸의 벽 비트 + 본 칸 비트를 따로)
+        mask = np.frombuffer(seen, dtype=np.uint8).astype(bool)
+        if encoding == "bitpack":
+            walls = np.frombuffer(bytes(self.walls), dtype=np.uint8).astype(bool)
+            return pack_bits(walls & mask), pack_bits(mask)
+        masked = np.where(mask, self.base_array, UNKNOWN)
+        if encoding == "rle":
+            return rle_encode_array(masked), None
+        return masked.reshape(self.height, self.width).tolist(), None
+
+    def index(self, pos) -> int:
+        return pos[0] * self.width + pos[1]
+
+    def in_bounds(self, pos) -> bool:
+        return 0 <= pos[0] < self.height and 0 <= pos[1] < self.width
+
+    def is_open(self, pos) -> bool:
+        return self.in_bounds(pos) and not self.walls[self.index(pos)]
+
+    def can_move(self, src, dst) -> bool:
+        # 상하좌우 한 칸 + 벽이 아닌 칸만 허용 (제자리는 허용)
+        if abs(src[0] - dst[0]) + abs(src[1] - dst[1]) > 1:
+            return False
+        return self.is_open(dst)
+
+    def is_reachable(self, pos) -> bool:
+        return self.is_open(pos) and self.dist_exit[self.index(pos)] >= 0
+
+    def distance_to_exit(self, pos) -> int:
+        if not self.in_bounds(pos):
+            return -1
+        return int(self.dist_exit[self.index(pos)])
+
+    def nearest_npc(self, pos, remaining: int) -> Optional[Tuple[int, int]]:
+        # remaining: 남은 NPC 비트마스크 → (NPC 번호, 거리)
+        if not self.in_bounds(pos) or not remaining:
+            return None
+        column = self.dist_npc[:, self.index(pos)]
+        best = None
+        for i in range(len(column)):
+            if remaining >> i & 1 and column[i] >= 0 and (best is None or column[i] < column[best]):
+                best = i
+        if best is None:
+            return None
+        return best, int(column[best])
+
+
+# 키 → [엔진, 마지막 사용 시각]. 동기 엔드포인트가 스레드 풀에서 함께 쓰므로 락으로 감싼다
+_engines: "OrderedDict[tuple, list]" = OrderedDict()
+_engine_cells = 0
+_engines_guard = threading.Lock()
+
+
+def _cached_engine(key: tuple, now: float) -> Optional[MazeEngine]:
+    item = _engines.get(key)
+    if item is None:
+        return None
+    item[1] = now
+    _engines.move_to_end(key)
+    return item[0]
+
+
+def engine_for(config: dict) -> MazeEngine:
+    global _engine_cells
+    key = (config["width"], config["height"], config["npc"], config["seed"], config["algorithm"])
+    now = time.monotonic()
+    with _engines_guard:
+        engine = _cached_engine(key, now)
+    if engine is not None:
+        return engine
+    # 미로 생성 + BFS는 락 밖에서 (같은 미로를 두 스레드가 함께 만들었으면 먼저 넣은 쪽을 쓴다)
+    built = MazeEngine(maze_from_config(config))
+    with _engines_guard:
+        engine = _cached_engine(key, now)
+        if engine is not None:
+            return engine
+        _engines[key] = [built, now]
+        _engine_cells += built.height * built.width
+        # 칸 수 상한을 넘었거나 오래 안 쓴 엔진을 앞(가장 오래 전에 쓴 쪽)부터 비운다
+        while len(_engines) > 1:
+            oldest, used = next(iter(_engines.values()))
+            if _engine_cells <= MAZE_ENGINE_CACHE_CELLS and now - used <= MAZE_ENGINE_IDLE:
+                break
+            _engines.popitem(last=False)
+            _engine_cells -= oldest.height * oldest.width
+    return built
+
+
+# -------------------------
+# 2) 세션별 이동 상태 (작게 직렬화)
+# -------------------------
+@dataclass
+class MazeSession:
+    config: dict
+    pos: Tuple[int, int]
+    remaining: int          # 아직 만나지 않은 NPC 비트마스크
+    moves: int = 0
+    finished: bool = False
+    version: int = 0        # 상태가 바뀔 때마다 증가 (델타 동기화용)
+    # 시야 제한이 켜져 있을 때 지금까지 본 칸 (칸마다 1바이트), 꺼져 있으면 None
+    seen: Optional[bytearray] = None
+    # 마지막 이동으로 새로 보이게 된 칸 (저장하지 않음)
+    revealed: List[int] = field(default_factory=list, repr=False)
+    # 이 세션 객체가 쓰는 엔진 (저장하지 않음, 요청 하나 안에서 캐시를 다시 찾지 않도록)
+    _engine: Optional[MazeEngine] = field(default=None, repr=False, compare=False)
+
+    @classmethod
+    def start(cls, config: dict) -> "MazeSession":
+        engine = engine_for(config)
+        session = cls(config=config, pos=tuple(engine.maze.user_pos),
+                      remaining=(1 << len(engine.maze.npc_pos)) - 1)
+        session.init_fog()
+        return session
+
+    def init_fog(self) -> None:
+        if MAZE_VIEW_RADIUS > 0 and self.seen is None:
+            engine = self.engine
+            self.seen = bytearray(engine.height * engine.width)
+            self.look()
+
+    def dump(self) -> bytes:
+        data = {
+            "c": self.config, "p": list(self.pos), "r": self.remaining,
+            "m": self.moves, "f": int(self.finished), "v": self.version,
+        }
+        if self.seen is not None:
+            # 본 칸은 뭉쳐 있으므로 비트로 묶은 뒤 압축하면 200×200에서도 수백 바이트
+            bits = np.packbits(np.frombuffer(self.seen, dtype=np.uint8)).tobytes()
+            data["s"] = base64.b64encode(zlib.compress(bits, 1)).decode("ascii")
+        return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+    @classmethod
+    def load(cls, data: bytes) -> "MazeSession":
+        raw = json.loads(data)
+        if "c" not in raw:
+            # 이전 형식(설정만 저장)과 호환
+            return cls.start(raw)
+        session = cls(config=raw["c"], pos=tuple(raw["p"]), remaining=raw["r"],
+                      moves=raw["m"], finished=bool(raw["f"]), version=raw.get("v", 0))
+        if "s" in raw:
+            cells = session.engine.height * session.engine.width
+            bits = np.frombuffer(zlib.decompress(base64.b64decode(raw["s"])), dtype=np.uint8)
+            session.seen = bytearray(np.unpackbits(bits, count=cells).tobytes())
+        else:
+            # 시야 제한을 켜기 전에 시작한 세션은 지금 위치에서부터 다시 본다
+            session.init_fog()
+        return session
+
+    @property
+    def engine(self) -> MazeEngine:
+        if self._engine is None:
+            self._engine = engine_for(self.config)
+        return self._engine
+
+    def look(self) -> List[int]:
+        # 이동할 때마다 지금 위치의 시야 전체를 다시 계산하고, 그중 처음 보는 칸만 seen에 표시한다.
+        # 이전 시야에서 이어서 계산하지는 않는다: 시선 트리 덕분에 201×201, 반지름 7에서도
+        # 이동당 평균 약 11µs라 증분 갱신의 복잡도가 값어치를 못 한다 (benchmarks/bench_maze.py --view-radius 7)
+        seen = self.seen
+        if seen is None:
+            return []
+        engine = self.engine
+        revealed = [i for i in visible_cells(engine.walls, engine.height, engine.width, self.pos, MAZE_VIEW_RADIUS)
+                    if not seen[i]]
+        for i in revealed:
+            seen[i] = 1
+        self.revealed = revealed
+        return revealed
+
+    def is_seen(self, pos) -> bool:
+        return self.seen is None or bool(self.seen[self.engine.index(pos)])
+
+    def move(self, target) -> Optional[int]:
+        # 성공하면 새로 만난 NPC 번호(없으면 -1), 이동 불가면 None
+        engine = self.engine
+        target = (int(target[0]), int(target[1]))
+        if not engine.can_move(self.pos, target):
+            return None
+        met = -1
+        self.revealed = []
+        if target != self.pos:
+            self.moves += 1
+            self.version += 1
+            self.pos = target
+            npc = engine.npc_index.get(target)
+            if npc is not None and self.remaining >> npc & 1:
+                self.remaining &= ~(1 << npc)
+                met = npc
+            if target == engine.exit_pos:
+                self.finished = True
+            self.look()
+        return met
+
+    def known_distances(self) -> dict:
+        # 본 통로만 따라가는 BFS 거리 (평탄화 번호 → 거리). 본 칸 수에 비례하는 비용
+        engine = self.engine
+        width, size = engine.width, engine.height * engine.width
+        walls, seen = engine.walls, self.seen
+        start = engine.index(self.pos)
+        dist = {start: 0}
+        queue = deque([start])
+        while queue:
+            cur = queue.popleft()
+            nd = dist[cur] + 1
+            col = cur % width
+            for nb in (cur - width, cur + width, cur - 1 if col else -1, cur + 1 if col + 1 < width else -1):
+                if 0 <= nb < size and seen[nb] and not walls[nb] and nb not in dist:
+                    dist[nb] = nd
+                    queue.append(nb)
+        return dist
+
+    def query(self) -> dict:
+        # 출구까지 거리 / 가장 가까운 남은 NPC. 시야 제한이 켜져 있으면 본 칸만으로 답한다
+        # (못 본 출구/NPC나 본 칸으로 이어지지 않는 대상은 None → 숨은 칸 정보가 새지 않게)
+        engine = self.engine
+        if self.seen is None:
+            nearest = engine.nearest_npc(self.pos, self.remaining)
+            return {
+                "distanceToExit": engine.distance_to_exit(self.pos),
+                "nearestNpcPos": list(engine.maze.npc_pos[nearest[0]]) if nearest else None,
+                "nearestNpcDistance": nearest[1] if nearest else None,
+            }
+        dist = self.known_distances()
+        best = None
+        for i, p in enumerate(engine.maze.npc_pos):
+            d = dist.get(engine.index(p))
+            if self.remaining >> i & 1 and d is not None and (best is None or d < best[1]):
+                best = (i, d)
+        return {
+            "distanceToExit": dist.get(engine.index(engine.exit_pos)),
+            "nearestNpcPos": list(engine.maze.npc_pos[best[0]]) if best else None,
+            "nearestNpcDistance": best[1] if best else None,
+        }
+
+    def npc_positions(self) -> List[List[int]]:
+        # 시야 제한이 켜져 있으면 본 적 있는 NPC만
+        return [list(p) for i, p in enumerate(self.engine.maze.npc_pos)
+                if self.remaining >> i & 1 and self.is_seen(p)]
+
+    def exit_position(self) -> Optional[List[int]]:
+        exit_pos = self.engine.exit_pos
+        return list(exit_pos) if self.is_seen(exit_pos) else None
+
+    def to_response(self) -> dict:
+        # MazeResponse 형태: 바탕 격자 행만 복사하고 NPC/플레이어를 덮어쓴다
+        engine = self.engine
+        if self.seen is None:
+            rows = [row[:] for row in engine.base_rows]
+        else:
+            rows, _ = engine.fog_grid(self.seen, "rows")
+        npc_pos = self.npc_positions()
+        for r, c in npc_pos:
+            rows[r][c] = NPC
+        rows[self.pos[0]][self.pos[1]] = USER
+        return {
+            "width": engine.width,
+            "height": engine.height,
+            "maze": rows,
+            "userPos": list(self.pos),
+            "npcCnt": len(npc_pos),
+            "npcPos": npc_pos,
+            "exitPos": self.exit_position(),
+        }
+
+    def snapshot(self, encoding: str = "rle") -> dict:
+        # 처음 접속하거나 버전이 어긋났을 때 보내는 전체 상태
+        engine = self.engine
+        data = {
+            "type": "full",
+            "version": self.version,
+            "width": engine.width,
+            "height": engine.height,
+            "encoding": encoding,
+            "grid": engine.encoded_grid(encoding),
+            "userPos": list(self.pos),
+            "npcPos": self.npc_positions(),
+            "exitPos": self.exit_position(),
+            "finished": self.finished,
+        }
+        if self.seen is not None:
+            # 본 칸만 담은 격자 (나머지는 UNKNOWN, bitpack이면 본 칸 비트를 seen으로 따로)
+            data["grid"], seen_bits = engine.fog_grid(self.seen, encoding)
+            data["fog"] = True
+            if seen_bits is not None:
+                data["seen"] = seen_bits
+        return data
+
+    def delta(self, prev_pos: Tuple[int, int], met: int) -> dict:
+        # 이동 한 번에 바뀌는 칸은 떠난 칸과 도착한 칸, 그리고 시야 제한이 켜져 있으면 새로 보이게 된 칸
+        cells = []
+        engine = self.engine
+        if prev_pos != self.pos:
+            cells.append([prev_pos[0], prev_pos[1], engine.base_flat[engine.index(prev_pos)]])
+            cells.append([self.pos[0], self.pos[1], USER])
+        if self.revealed:
+            width, base = engine.width, engine.base_flat
+            here = engine.index(self.pos)
+            npcs = {engine.index(p) for i, p in enumerate(engine.maze.npc_pos) if self.remaining >> i & 1}
+            for i in self.revealed:
+                if i != here:
+                    cells.append([i // width, i % width, NPC if i in npcs else base[i]])
+        return {
+            "type": "delta",
+            "version": self.version,
+            "cells": cells,
+            "userPos": list(self.pos),
+            # 만난 NPC는 좌표로 알려 주고 클라이언트가 npcPos에서 지운다
+            "npcRemoved": list(engine.maze.npc_pos[met]) if met >= 0 else None,
+            "finished": self.finished,
+        }
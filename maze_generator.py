@@ -0,0 +1,330 @@
+import json
+import os
+import random
+from collections import deque
+from functools import lru_cache
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# -------------------------
+# 1) 셀 값 (MazeResponse.maze와 동일)
+# -------------------------
+PATH, WALL, NPC, USER, EXIT = 0, 1, 2, 3, 4
+
+# 기본 미로 설정
+MAZE_WIDTH = int(os.getenv("MAZE_WIDTH", "11"))
+MAZE_HEIGHT = int(os.getenv("MAZE_HEIGHT", "11"))
+MAZE_NPC_COUNT = int(os.getenv("MAZE_NPC_COUNT", "3"))
+MAZE_ALGORITHM = os.getenv("MAZE_ALGORITHM", "backtracker")
+# 세션 없이 호출될 때 쓰는 고정 시드
+MAZE_DEFAULT_SEED = int(os.getenv("MAZE_DEFAULT_SEED", "0"))
+
+# 통로 셀은 홀수 좌표에 위치하고, 셀 사이의 벽을 허물어 길을 만든다.
+# 셀 번호 i = r * cw + c  (r, c는 셀 단위 좌표, cw = (width - 1) // 2)
+
+
+# -------------------------
+# 2) 미로 생성 알고리즘
+# -------------------------
+# 모두 root 셀에서 시작하는 신장 트리를 만들고 (parent, order)를 반환한다.
+#   parent[i]: 트리에서 i의 부모 셀 (root는 -1)
+#   order    : 부모가 항상 자식보다 먼저 오는 셀 순서 → 한 번에 거리 계산 가능
+def carve_backtracker(ch: int, cw: int, rng: random.Random, root: int) -> Tuple[List[int], List[int]]:
+    n = ch * cw
+    parent = [-1] * n
+    visited = bytearray(n)
+    rand = rng.random
+    visited[root] = 1
+    order = [root]
+    stack = [root]
+    while stack:
+        cur = stack[-1]
+        r, c = divmod(cur, cw)
+        nbrs = []
+        if r > 0 and not visited[cur - cw]:
+            nbrs.append(cur - cw)
+        if r < ch - 1 and not visited[cur + cw]:
+            nbrs.append(cur + cw)
+        if c > 0 and not visited[cur - 1]:
+            nbrs.append(cur - 1)
+        if c < cw - 1 and not visited[cur + 1]:
+            nbrs.append(cur + 1)
+        if not nbrs:
+            stack.pop()
+            continue
+        nxt = nbrs[int(rand() * len(nbrs))] if len(nbrs) > 1 else nbrs[0]
+        visited[nxt] = 1
+        parent[nxt] = cur
+        order.append(nxt)
+        stack.append(nxt)
+    return parent, order
+
+
+def carve_prim(ch: int, cw: int, rng: random.Random, root: int) -> Tuple[List[int], List[int]]:
+    n = ch * cw
+    parent = [-1] * n
+    in_maze = bytearray(n)
+    order = []
+    frontier = []   # (미로 밖 셀, 미로 안 이웃 셀)
+
+    def add(cell):
+        in_maze[cell] = 1
+        order.append(cell)
+        r, c = divmod(cell, cw)
+        if r > 0 and not in_maze[cell - cw]:
+            frontier.append((cell - cw, cell))
+        if r < ch - 1 and not in_maze[cell + cw]:
+            frontier.append((cell + cw, cell))
+        if c > 0 and not in_maze[cell - 1]:
+            frontier.append((cell - 1, cell))
+        if c < cw - 1 and not in_maze[cell + 1]:
+            frontier.append((cell + 1, cell))
+
+    rand = rng.random
+    add(root)
+    while frontier:
+        # 임의의 항목을 꺼내 맨 뒤와 바꿔서 O(1) 제거
+        i = int(rand() * len(frontier))
+        frontier[i], frontier[-1] = frontier[-1], frontier[i]
+        cell, src = frontier.pop()
+        if in_maze[cell]:
+            continue
+        parent[cell] = src
+        add(cell)
+    return parent, order
+
+
+def carve_wilson(ch: int, cw: int, rng: random.Random, root: int) -> Tuple[List[int], List[int]]:
+    n = ch * cw
+    parent = [-1] * n
+    in_maze = bytearray(n)
+    nxt = [0] * n
+    in_maze[root] = 1
+    order = [root]
+    cells = list(range(n))
+    rng.shuffle(cells)
+    rand = rng.random
+    for start in cells:
+        if in_maze[start]:
+            continue
+        # 미로에 닿을 때까지 무작위 보행 (마지막 방향만 기억 → 자연스럽게 루프 제거)
+        cur = start
+        while not in_maze[cur]:
+            r, c = divmod(cur, cw)
+            while True:
+                d = int(rand() * 4)
+                if d == 0 and r > 0:
+                    step = cur - cw
+                elif d == 1 and r < ch - 1:
+                    step = cur + cw
+                elif d == 2 and c > 0:
+                    step = cur - 1
+                elif d == 3 and c < cw - 1:
+                    step = cur + 1
+                else:
+                    continue
+                break
+            nxt[cur] = step
+            cur = step
+        # 루프가 지워진 경로를 미로에 붙인다 (미로 쪽에서부터 order에 추가)
+        walk = []
+        cur = start
+        while not in_maze[cur]:
+            in_maze[cur] = 1
+            parent[cur] = nxt[cur]
+            walk.append(cur)
+            cur = nxt[cur]
+        walk.reverse()
+        order.extend(walk)
+        if len(order) == n:
+            break
+    return parent, order
+
+
+ALGORITHMS: Dict[str, Callable[[int, int, random.Random, int], Tuple[List[int], List[int]]]] = {
+    "backtracker": carve_backtracker,
+    "prim": carve_prim,
+    "wilson": carve_wilson,
+}
+
+
+# -------------------------
+# 3) 결과 모델
+# -------------------------
+@dataclass
+class GeneratedMaze:
+    grid: np.ndarray                    # (height, width) uint8
+    user_pos: Tuple[int, int]
+    npc_pos: List[Tuple[int, int]]
+    exit_pos: Tuple[int, int]
+    seed: int
+    algorithm: str
+    path_length: int = 0                # 시작 → 출구 최단 거리
+    npc_distances: List[int] = field(default_factory=list)
+
+    @property
+    def height(self) -> int:
+        return self.grid.shape[0]
+
+    @property
+    def width(self) -> int:
+        return self.grid.shape[1]
+
+    def to_dict(self) -> dict:
+        # MazeResponse 필드와 동일한 형태
+        return {
+            "width": self.width,
+            "height": self.height,
+            "maze": self.grid.tolist(),
+            "userPos": list(self.user_pos),
+            "npcCnt": len(self.npc_pos),
+            "npcPos": [list(p) for p in self.npc_pos],
+            "exitPos": list(self.exit_pos),
+        }
+
+
+# -------------------------
+# 4) 탐색 도우미
+# -------------------------
+def bfs_distances(open_mask: np.ndarray, start: Tuple[int, int]) -> np.ndarray:
+    # 통로(open_mask=True)만 따라가는 BFS 거리 (-1 = 도달 불가)
+    h, w = open_mask.shape
+    flat_open = open_mask.ravel().tolist()
+    dist = [-1] * (h * w)
+    s = start[0] * w + start[1]
+    dist[s] = 0
+    queue = deque([s])
+    pop, push = queue.popleft, queue.append
+    while queue:
+        cur = pop()
+        nd = dist[cur] + 1
+        for nb in (cur - w, cur + w, cur - 1, cur + 1):
+            if 0 <= nb < h * w and flat_open[nb] and dist[nb] < 0:
+                # 좌우 이동이 줄을 넘어가지 않도록 확인
+                if (nb == cur - 1 or nb == cur + 1) and nb // w != cur // w:
+                    continue
+                dist[nb] = nd
+                push(nb)
+    return np.asarray(dist, dtype=np.int32).reshape(h, w)
+
+
+# -------------------------
+# 5) 미로 생성
+# -------------------------
+def generate_maze(width: int = 11, height: int = 11, npc_count: int = 3,
+                  seed: Optional[int] = None, algorithm: str = "backtracker") -> GeneratedMaze:
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f"알 수 없는 미로 알고리즘: {algorithm}")
+    # 벽으로 둘러싸이도록 홀수 크기로 맞춘다
+    width = max(5, width | 1)
+    height = max(5, height | 1)
+    if seed is None:
+        seed = random.randrange(2 ** 31)
+    rng = random.Random(seed)
+
+    ch, cw = (height - 1) // 2, (width - 1) // 2
+    # 시작 위치(중앙에 가장 가까운 셀)를 트리의 루트로 생성
+    start_cell = (ch // 2) * cw + cw // 2
+    user = _to_grid(start_cell, cw)
+    parent, order = ALGORITHMS[algorithm](ch, cw, rng, start_cell)
+
+    # 셀과 허문 벽(셀-부모 사이)을 한 번에 칠한다
+    grid = np.ones((height, width), dtype=np.uint8)
+    grid[1:height:2, 1:width:2] = PATH
+    par = np.asarray(parent, dtype=np.int64)
+    child = np.flatnonzero(par >= 0)
+    if child.size:
+        ar, ac = np.divmod(child, cw)
+        br, bc = np.divmod(par[child], cw)
+        grid[ar + br + 1, ac + bc + 1] = PATH
+
+    # 루트로부터의 셀 거리 (order는 부모가 먼저 오므로 한 번에 계산)
+    cell_dist = [0] * (ch * cw)
+    for cell in order[1:]:
+        cell_dist[cell] = cell_dist[parent[cell]] + 1
+
+    # 출구: 시작점에서 가장 먼 가장자리 셀 바깥 벽에 뚫는다
+    candidates = []
+    for c in range(cw):
+        candidates.append((cell_dist[c], c, (0, 2 * c + 1)))
+        last = (ch - 1) * cw + c
+        candidates.append((cell_dist[last], last, (height - 1, 2 * c + 1)))
+    for r in range(ch):
+        candidates.append((cell_dist[r * cw], r * cw, (2 * r + 1, 0)))
+        last = r * cw + cw - 1
+        candidates.append((cell_dist[last], last, (2 * r + 1, width - 1)))
+    best = max(d for d, _, _ in candidates)
+    _, exit_cell, exit_pos = rng.choice([item for item in candidates if item[0] == best])
+    grid[exit_pos] = EXIT
+
+    # 시작 → 출구 경로 (격자 좌표, 셀 사이의 허문 벽 칸 포함)
+    cells = [exit_cell]
+    while parent[cells[-1]] >= 0:
+        cells.append(parent[cells[-1]])
+    cells.reverse()
+    path = [user]
+    for a, b in zip(cells, cells[1:]):
+        (ar, ac), (br, bc) = _to_grid(a, cw), _to_grid(b, cw)
+        path.append(((ar + br) // 2, (ac + bc) // 2))
+        path.append((br, bc))
+    path_length = len(path)   # 출구 칸까지 포함한 이동 횟수
+
+    # NPC: 출구까지의 경로 위, 거리 (i+1)/(n+1) 지점에 균등 배치
+    npc_pos = []
+    npc_distances = []
+    usable = path[1:]   # 시작 칸 제외
+    for i in range(min(npc_count, len(usable))):
+        k = min(len(usable) - 1, round(len(usable) * (i + 1) / (npc_count + 1)))
+        # 경로가 짧아 겹치면 뒤쪽의 빈 칸으로 민다
+        while usable[k] in npc_pos and k + 1 < len(usable):
+            k += 1
+        if usable[k] in npc_pos:
+            break
+        npc_pos.append(usable[k])
+        npc_distances.append(k + 1)
+    for pos in npc_pos:
+        grid[pos] = NPC
+
+    grid[user] = USER
+    return GeneratedMaze(grid=grid, user_pos=user, npc_pos=npc_pos, exit_pos=exit_pos,
+                         seed=seed, algorithm=algorithm, path_length=path_length,
+                         npc_distances=npc_distances)
+
+
+def _to_grid(cell: int, cw: int) -> Tuple[int, int]:
+    r, c = divmod(cell, cw)
+    return (2 * r + 1, 2 * c + 1)
+
+
+# -------------------------
+# 6) 세션용 설정 (시드만 저장하고 미로는 다시 만든다)
+# -------------------------
+def new_maze_config(seed: Optional[int] = None) -> dict:
+    return {
+        "width": MAZE_WIDTH,
+        "height": MAZE_HEIGHT,
+        "npc": MAZE_NPC_COUNT,
+        "algorithm": MAZE_ALGORITHM,
+        "seed": random.randrange(2 ** 31) if seed is None else seed,
+    }
+
+
+def dump_maze_config(config: dict) -> bytes:
+    return json.dumps(config, separators=(",", ":")).encode("utf-8")
+
+
+def load_maze_config(data: bytes) -> dict:
+    return json.loads(data)
+
+
+@lru_cache(maxsize=256)
+def _cached_maze(width: int, height: int, npc: int, seed: int, algorithm: str) -> GeneratedMaze:
+    return generate_maze(width, height, npc, seed, algorithm)
+
+
+def maze_from_config(config: dict) -> GeneratedMaze:
+    # 같은 설정이면 같은 미로 (캐시된 객체이므로 grid는 수정하지 말 것)
+    return _cached_maze(config["width"], config["height"], config["npc"],
+                        config["seed"], config["algorithm"])
@@ -0,0 +1,269 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Sequence, Tuple
+
+# -------------------------
+# 1) 설정
+# -------------------------
+# 워커마다 메모리에서 집계하고, 주기적으로 공유 SQLite에 스냅샷을 써서 /metrics에서 합친다
+# (prometheus_client의 multiprocess 모드와 같은 방식, 별도 의존성 없음)
+METRICS_DB_PATH = os.getenv("METRICS_DB_PATH", "metrics.db")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+# 이 시간 동안 스냅샷이 갱신되지 않은 워커의 게이지(진행 중 요청 수 등)는 빼고 합산
+METRICS_STALE_AFTER = float(os.getenv("METRICS_STALE_AFTER", str(METRICS_FLUSH_INTERVAL * 3)))
+# 종료된 워커의 카운터를 남겨 두는 시간 (이후 삭제되면 Prometheus에는 카운터 리셋으로 보인다)
+METRICS_RETENTION = float(os.getenv("METRICS_RETENTION", "86400"))
+
+# 초 단위 지연 시간 버킷 (LLM 호출은 수십 초까지 걸린다)
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 60.0)
+
+# 프로세스 재시작으로 같은 pid가 다시 쓰여도 구분되도록 시작 시각을 붙인다
+# (gunicorn --preload면 import는 마스터에서 한 번만 하므로 fork된 워커마다 새로 만든다)
+_worker = (0, "")
+
+
+def worker_id() -> str:
+    global _worker
+    if _worker[0] != os.getpid():
+        _worker = (os.getpid(), f"{os.getpid()}-{int(time.time() * 1000)}")
+    return _worker[1]
+
+Labels = Tuple[str, ...]
+
+
+# -------------------------
+# 2) 지표 종류
+# -------------------------
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[Labels, object] = {}
+        _registry.append(self)
+
+    def snapshot(self) -> dict:
+        return {"type": self.kind, "help": self.help, "labels": self.labelnames,
+                "values": [[list(k), v] for k, v in self.values.items()]}
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, labels: Labels = (), amount: float = 1) -> None:
+        values = self.values
+        values[labels] = values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, labels: Labels = (), amount: float = 1) -> None:
+        values = self.values
+        values[labels] = values.get(labels, 0) + amount
+
+    def dec(self, labels: Labels = (), amount: float = 1) -> None:
+        values = self.values
+        values[labels] = values.get(labels, 0) - amount
+
+    def set(self, value: float, labels: Labels = ()) -> None:
+        self.values[labels] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        # [버킷별 개수..., +Inf 개수, 합계] (누적은 출력할 때 계산)
+        row = self.values.get(labels)
+        if row is None:
+            row = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        row[bisect_left(self.buckets, value)] += 1
+        row[-1] += value
+
+    def snapshot(self) -> dict:
+        data = super().snapshot()
+        data["buckets"] = self.buckets
+        return data
+
+
+_registry: list = []
+# 요청마다 세지 않고 스냅샷을 만들 때 기존 통계에서 읽어 오는 지표
+_collectors: list = []
+
+
+def register_collector(name: str, kind: str, help_text: str, labelnames: Sequence[str],
+                       collect: Callable[[], Dict[Labels, float]]) -> None:
+    _collectors.append((name, kind, help_text, tuple(labelnames), collect))
+
+
+def snapshot() -> dict:
+    data = {metric.name: metric.snapshot() for metric in _registry}
+    for name, kind, help_text, labelnames, collect in _collectors:
+        try:
+            values = collect()
+        except Exception as e:
+            print("지표 수집 중 오류 발생:", name, e)
+            continue
+        data[name] = {"type": kind, "help": help_text, "labels": labelnames,
+                      "values": [[list(k), v] for k, v in values.items()]}
+    return data
+
+
+# -------------------------
+# 3) 워커 간 공유 (SQLite)
+# -------------------------
+_local = threading.local()
+
+
+def _conn() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(METRICS_DB_PATH, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS metrics (worker TEXT PRIMARY KEY, updated REAL NOT NULL, data TEXT NOT NULL)"
+        )
+        _local.conn = conn
+    return conn
+
+
+def flush() -> None:
+    now = time.time()
+    conn = _conn()
+    conn.execute("INSERT OR REPLACE INTO metrics (worker, updated, data) VALUES (?, ?, ?)",
+                 (worker_id(), now, json.dumps(snapshot(), separators=(",", ":"))))
+    conn.execute("DELETE FROM metrics WHERE updated < ?", (now - METRICS_RETENTION,))
+
+
+async def flush_loop() -> None:
+    while True:
+        await asyncio.sleep(METRICS_FLUSH_INTERVAL)
+        try:
+            flush()
+        except Exception as e:
+            print("지표 저장 중 오류 발생:", e)
+
+
+def merge(snapshots) -> dict:
+    merged: dict = {}
+    for data, live in snapshots:
+        for name, metric in data.items():
+            if metric["type"] == "gauge" and not live:
+                continue
+            target = merged.setdefault(name, {**metric, "values": {}})
+            values = target["values"]
+            for labels, value in metric["values"]:
+                key = tuple(labels)
+                if metric["type"] == "histogram":
+                    row = values.get(key)
+                    values[key] = list(value) if row is None else [a + b for a, b in zip(row, value)]
+                else:
+                    values[key] = values.get(key, 0) + value
+    return merged
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def render(merged: dict) -> str:
+    # Prometheus 텍스트 형식 (0.0.4)
+    lines = []
+    for name in sorted(merged):
+        metric = merged[name]
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        names = metric["labels"]
+        for labels, value in sorted(metric["values"].items()):
+            if metric["type"] != "histogram":
+                lines.append(f"{name}{_labels(names, labels)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(list(metric["buckets"]) + ["+Inf"], value[:-1]):
+                cumulative += count
+                le = 'le="%s"' % (bound if bound == "+Inf" else repr(float(bound)))
+                lines.append(f"{name}_bucket{_labels(names, labels, le)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(names, labels)} {value[-1]}")
+            lines.append(f"{name}_count{_labels(names, labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def collect_all() -> str:
+    # 이 워커의 최신 값을 먼저 쓰고 모든 워커의 스냅샷을 합친다
+    flush()
+    now = time.time()
+    rows = _conn().execute("SELECT updated, data FROM metrics").fetchall()
+    return render(merge((json.loads(data), now - updated <= METRICS_STALE_AFTER) for updated, data in rows))
+
+
+# -------------------------
+# 4) HTTP 요청 계측 (순수 ASGI 미들웨어: BaseHTTPMiddleware보다 훨씬 가볍다)
+# -------------------------
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "HTTP 요청 처리 시간 (스트리밍은 끝날 때까지)",
+                         ("method", "route", "status"))
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "처리 중인 HTTP 요청 수")
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status = ["500"]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = str(message["status"])
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # 경로 변수가 있어도 라벨 수가 늘지 않도록 라우트 템플릿을 쓴다 (없는 경로는 하나로 묶음)
+            route = scope.get("route")
+            HTTP_LATENCY.observe(time.perf_counter() - start,
+                                 (scope["method"], route.path if route is not None else "unmatched", status[0]))
+
+
+class timed:
+    # with timed(HISTOGRAM, labels): ... → 예외면 결과 라벨이 error
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: Histogram, labels: Labels = ()):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        outcome = "ok" if exc_type is None else exc_type.__name__
+        self.histogram.observe(time.perf_counter() - self.start, self.labels + (outcome,))
+        return False
@@ -0,0 +1,239 @@
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from prompts import prompt_kind
+
+# -------------------------
+# 1) 설정
+# -------------------------
+# 네트워크 없이 부하 테스트를 하기 위한 가짜 LLM/이미지 백엔드 (LLM_PROVIDER=mock)
+# 같은 프롬프트의 n번째 호출은 항상 같은 지연/응답/오류를 낸다 (MOCK_SEED 기준)
+MOCK_SEED = os.getenv("MOCK_SEED", "0")
+# 모든 지연 시간에 곱하는 배율 (0.01이면 100배 빠르게)
+MOCK_TIME_SCALE = float(os.getenv("MOCK_TIME_SCALE", "1.0"))
+# 고칠 수 있거나 없는 잘못된 JSON을 돌려줄 확률 / 예외를 낼 확률
+MOCK_MALFORMED_RATE = float(os.getenv("MOCK_MALFORMED_RATE", "0.0"))
+MOCK_ERROR_RATE = float(os.getenv("MOCK_ERROR_RATE", "0.0"))
+MOCK_IMAGE_ERROR_RATE = float(os.getenv("MOCK_IMAGE_ERROR_RATE", "0.0"))
+# 스트리밍: 전체 지연 중 첫 토큰까지의 비율 / 조각 크기(글자)
+MOCK_TTFT_RATIO = float(os.getenv("MOCK_TTFT_RATIO", "0.3"))
+MOCK_CHUNK_CHARS = int(os.getenv("MOCK_CHUNK_CHARS", "8"))
+MOCK_IMAGE_BASE_URL = os.getenv("MOCK_IMAGE_BASE_URL", "http://mock.invalid/images")
+
+# 호출 종류별 지연 분포 (초). MOCK_LATENCY_<종류>로 바꿀 수 있다
+#  fixed:x | uniform:a,b | lognormal:중앙값,sigma | exp:평균 | 숫자만 쓰면 fixed
+DEFAULT_LATENCY = {
+    "story": "lognormal:6,0.4",
+    "quizset": "lognormal:5,0.4",
+    "question": "lognormal:2,0.4",
+    "followup": "lognormal:1,0.4",
+    "ending": "lognormal:3,0.4",
+    "image": "lognormal:8,0.3",
+}
+
+
+class MockProviderError(Exception):
+    pass
+
+
+def parse_latency(spec: str):
+    name, _, args = spec.partition(":")
+    if not args:
+        name, args = "fixed", name
+    values = [float(v) for v in args.split(",")]
+    if name == "fixed":
+        return lambda rng: values[0]
+    if name == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if name == "lognormal":
+        mu = math.log(values[0])
+        return lambda rng: rng.lognormvariate(mu, values[1])
+    if name == "exp":
+        return lambda rng: rng.expovariate(1.0 / values[0])
+    raise ValueError(f"알 수 없는 지연 분포: {spec}")
+
+
+LATENCY = {kind: parse_latency(os.getenv(f"MOCK_LATENCY_{kind.upper()}", spec))
+           for kind, spec in DEFAULT_LATENCY.items()}
+
+_attempts: Dict[str, int] = {}
+# 한 번 본 시스템 메시지 → 다음부터 캐시된 입력 토큰으로 보고 (프롬프트 캐시 흉내)
+_seen_prefixes = set()
+
+
+def call_rng(kind: str, text: str) -> random.Random:
+    # 프롬프트별 호출 횟수까지 시드에 넣어 재시도는 다른 결과를 낸다
+    digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+    if len(_attempts) > 100_000:
+        _attempts.clear()
+    attempt = _attempts.get(digest, 0)
+    _attempts[digest] = attempt + 1
+    return random.Random(f"{MOCK_SEED}:{kind}:{digest}:{attempt}")
+
+
+def sample_latency(kind: str, rng: random.Random) -> float:
+    return max(0.0, LATENCY[kind](rng)) * MOCK_TIME_SCALE
+
+
+# -------------------------
+# 2) 응답 만들기
+# -------------------------
+WORDS = ["등불", "열쇠", "지도", "시계탑", "거울", "돌문", "나침반", "두루마리", "정원", "종소리"]
+ROLES = ["사서", "기사", "상인", "마법사", "요리사", "탐험가", "정원사", "시계공"]
+
+
+def _field(text: str, pattern: str, default: str) -> str:
+    found = re.search(pattern, text)
+    return found.group(1).strip() if found else default
+
+
+def _quiz(rng: random.Random, about: str) -> dict:
+    word = rng.choice(WORDS)
+    answer = rng.randint(1, 3)
+    options = rng.sample([w for w in WORDS if w != word], 2)
+    options.insert(answer - 1, word)
+    return {
+        "quiz": f"{about[:80]} 이야기에서 가장 중요한 물건은 무엇일까요? 틀리면 패널티가 있어요!",
+        "option1": options[0], "option2": options[1], "option3": options[2],
+        "answer": answer,
+        "correct_reaction": f"정답입니다! {word}를 잘 기억하셨군요.",
+        "wrong_reaction": f"아쉽네요. 정답은 {word}였어요.",
+    }
+
+
+def build_response(kind: str, text: str, rng: random.Random) -> str:
+    if kind == "story":
+        count = int(_field(text, r"NPC 수:\s*(\d+)", "3"))
+        setting = _field(text, r"장소:\s*(.*)", "미로")
+        name = _field(text, r"플레이어 이름:\s*(.*)", "플레이어")
+        word = rng.choice(WORDS)
+        data = {
+            "objective": f"{name}님, {setting} 깊은 곳의 {word}를 찾아 미로를 빠져나가세요.",
+            "story_details": {part: f"{setting}의 {part} 이야기입니다. {rng.choice(WORDS)}가 단서예요."
+                              for part in ("background", "intro", "middle", "final", "result")},
+            "npcs": [{"name": f"{rng.choice(WORDS)}지기 {i + 1}", "role": rng.choice(ROLES),
+                      "personality": "차분한 존댓말"} for i in range(count)],
+            "world_description": f"{setting}에 숨겨진 {word}를 둘러싼 이야기입니다.",
+        }
+    elif kind == "question":
+        data = _quiz(rng, _field(text, r"들려줄 이야기:\s*(.*)", ""))
+    elif kind == "quizset":
+        count = int(_field(text, r"NPC (\d+)명", "3"))
+        data = {"quizzes": [_quiz(rng, f"{i + 1}번째") for i in range(count)]}
+    elif kind == "followup":
+        correct = rng.random() < 0.5
+        data = {"message": "정답입니다! 계속 가 보세요." if correct else "틀렸어요. 다음엔 맞혀 주세요.",
+                "answer": "0" if correct else "1"}
+    else:
+        result = _field(text, r"최종 결말:\s*(.*)", "미로를 빠져나왔습니다.")
+        return "미로의 마지막 장소에 도착했습니다. " + result + " " + "긴 여정이 끝났습니다. " * rng.randint(3, 8)
+    return json.dumps(data, ensure_ascii=False)
+
+
+def malform(content: str, rng: random.Random) -> str:
+    # 실제 모델이 내는 흔한 결함들 (일부는 json_extract가 고치고, 일부는 못 고친다)
+    choice = rng.randrange(4)
+    if choice == 0:
+        return "```json\n" + content + "\n```"
+    if choice == 1:
+        return content[: rng.randint(1, max(1, len(content) - 1))]
+    if choice == 2:
+        return "알겠습니다! " + content.replace('", "', '" "', 1)
+    return "죄송하지만 요청하신 형식으로 답변드릴 수 없습니다."
+
+
+def usage_for(messages: List[BaseMessage], content: str, cached: bool) -> dict:
+    text = "".join(str(m.content) for m in messages)
+    system = str(messages[0].content) if messages else ""
+    return {
+        "prompt_tokens": len(text) // 2,
+        "completion_tokens": len(content) // 2,
+        "total_tokens": len(text) // 2 + len(content) // 2,
+        "prompt_tokens_details": {"cached_tokens": len(system) // 2 if cached else 0},
+    }
+
+
+# -------------------------
+# 3) LangChain 채팅 모델
+# -------------------------
+class MockChatModel(BaseChatModel):
+    # bind(response_format=...) / 콜백 / astream은 BaseChatModel이 그대로 처리한다
+    @property
+    def _llm_type(self) -> str:
+        return "mock"
+
+    def _plan(self, messages: List[BaseMessage]):
+        kind = prompt_kind(messages)
+        text = "".join(str(m.content) for m in messages)
+        rng = call_rng(kind, text)
+        latency = sample_latency(kind, rng)
+        if rng.random() < MOCK_ERROR_RATE:
+            return kind, latency, None
+        content = build_response(kind, text, rng)
+        if kind != "ending" and rng.random() < MOCK_MALFORMED_RATE:
+            content = malform(content, rng)
+        return kind, latency, content
+
+    def _result(self, messages: List[BaseMessage], content: str) -> ChatResult:
+        system = str(messages[0].content) if messages else ""
+        cached = system in _seen_prefixes
+        _seen_prefixes.add(system)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))],
+                          llm_output={"token_usage": usage_for(messages, content, cached), "model_name": "mock"})
+
+    def _combine_llm_outputs(self, llm_outputs: List[Optional[dict]]) -> dict:
+        return next((output for output in llm_outputs if output), {})
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        kind, latency, content = self._plan(messages)
+        time.sleep(latency)
+        if content is None:
+            raise MockProviderError(f"mock {kind}: 500 Internal Server Error")
+        return self._result(messages, content)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        kind, latency, content = self._plan(messages)
+        await asyncio.sleep(latency)
+        if content is None:
+            raise MockProviderError(f"mock {kind}: 500 Internal Server Error")
+        return self._result(messages, content)
+
+    async def _astream(self, messages, stop=None, run_manager=None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        kind, latency, content = self._plan(messages)
+        await asyncio.sleep(latency * MOCK_TTFT_RATIO)
+        if content is None:
+            raise MockProviderError(f"mock {kind}: 500 Internal Server Error")
+        pieces = [content[i:i + MOCK_CHUNK_CHARS] for i in range(0, len(content), MOCK_CHUNK_CHARS)] or [""]
+        gap = latency * (1 - MOCK_TTFT_RATIO) / len(pieces)
+        for i, piece in enumerate(pieces):
+            if i:
+                await asyncio.sleep(gap)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece))
+            if run_manager is not None:
+                await run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+
+
+# -------------------------
+# 4) 이미지
+# -------------------------
+class MockImageProvider:
+    async def generate(self, prompt: str, n: int = 1, size: str = "1024x1024") -> str:
+        rng = call_rng("image", f"{prompt}:{size}")
+        await asyncio.sleep(sample_latency("image", rng))
+        if rng.random() < MOCK_IMAGE_ERROR_RATE:
+            raise MockProviderError("mock image: 500 Internal Server Error")
+        digest = hashlib.sha1(f"{prompt}:{size}".encode("utf-8")).hexdigest()[:16]
+        return f"{MOCK_IMAGE_BASE_URL}/{digest}.png"
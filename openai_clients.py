@@ -0,0 +1,35 @@
+import asyncio
+import os
+
+import httpx
+from openai import AsyncOpenAI
+
+# -------------------------
+# 공유 커넥션 풀
+# -------------------------
+# LLM 호출과 이미지 생성이 하나의 keep-alive 풀을 같이 사용한다.
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "200"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "50"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "120"))
+
+http_client = httpx.AsyncClient(
+    limits=httpx.Limits(
+        max_connections=OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+    ),
+    timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=10.0),
+)
+
+async_openai = AsyncOpenAI(http_client=http_client)
+
+
+async def open_connections(count: int) -> None:
+    # 가벼운 요청을 동시에 보내 keep-alive 풀에 커넥션을 count개 만들어 둔다 (모델 목록 조회는 과금 없음)
+    results = await asyncio.gather(*(async_openai.models.list() for _ in range(count)), return_exceptions=True)
+    errors = [r for r in results if isinstance(r, Exception)]
+    if errors:
+        raise errors[0]
+
+
+async def close_clients() -> None:
+    await http_client.aclose()
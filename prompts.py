@@ -0,0 +1,125 @@
+from typing import List, Sequence, Tuple
+
+from langchain.schema import HumanMessage, SystemMessage
+
+# -------------------------
+# 프롬프트 구성
+# -------------------------
+# [시스템: 공통 게임 개요 + 호출 종류별 고정 지시] + [사용자: 이번 호출에만 쓰는 내용]
+# 고정 부분을 항상 맨 앞에 같은 글자로 두어야 OpenAI 프롬프트 캐시(앞부분 일치)가 적용된다.
+# 고정 부분에는 플레이어 이름/설정 같은 값을 절대 넣지 않는다.
+
+GAME_OVERVIEW = """당신은 텍스트 미로 탈출 게임의 진행자입니다.
+게임 개요: 플레이어가 정한 장소와 분위기를 바탕으로 방탈출 게임 같은 세계관과 스토리를 만들고,
+플레이어는 미로 속에서 NPC를 차례로 만나 스토리에 기반한 3지선다 퀴즈를 풉니다.
+모든 대사는 한국어로, 플레이어에게 이야기하듯 존댓말로 씁니다.
+플레이어 이름은 주어진 표기({{ }} 같은 기호 포함)를 한 글자도 바꾸지 않고 그대로 씁니다."""
+
+JSON_RULES = """출력 규칙:
+- 아래 형식의 순수한 JSON 객체 하나만 출력합니다. 설명 문장은 붙이지 않습니다.
+- 삼중 백틱(```)이나 다른 코드 블록 문법은 절대 사용하지 않습니다.
+- 모든 키를 빠짐없이 넣습니다."""
+
+STORY_RULES = """작업: 세계관 생성
+사용자 메시지의 장소/분위기/NPC 수에 맞춰 세계관, 스토리, 목표, NPC를 만듭니다.
+형식: {"objective": "", "story_details": {"background": "", "intro": "", "middle": "", "final": "", "result": ""}, "npcs": [{"name": "", "role": "", "personality": ""}], "world_description": ""}
+- objective: 세계관 기반의 궁극적 목표
+- story_details: background(시작), intro(초반부), middle(중반부), final(후반부), result(최종 결말)
+- npcs: 요청한 수만큼. role은 직업, personality는 직업에 따른 특징 및 말투
+- world_description: 세계관과 스토리 전체 요약"""
+
+QUIZ_FIELDS = """- quiz: NPC가 자기 말투로 '들려줄 이야기'를 먼저 말한 뒤, 그 내용으로 정답이 객관적으로 확실한 퀴즈 질문. 틀리면 패널티가 있다는 말 포함
+- option1~3: 선택지
+- answer: 정답 선택지 번호(1, 2, 3 중 하나)를 숫자로
+- correct_reaction: 맞혔을 때 정답이라고 한 마디 + 자연스러운 대화 한 마디
+- wrong_reaction: 틀렸을 때 틀렸다고 한 마디 + 자연스러운 대화 한 마디"""
+
+QUESTION_RULES = """작업: NPC 퀴즈 1개
+당신은 사용자 메시지에 적힌 NPC입니다.
+형식: {"quiz": "", "option1": "", "option2": "", "option3": "", "answer": 1, "correct_reaction": "", "wrong_reaction": ""}
+""" + QUIZ_FIELDS
+
+QUIZ_SET_RULES = """작업: NPC 퀴즈 묶음
+사용자 메시지의 NPC마다 퀴즈를 1개씩, NPC 순서대로 정확히 요청한 수만큼 만듭니다.
+형식: {"quizzes": [{"quiz": "", "option1": "", "option2": "", "option3": "", "answer": 1, "correct_reaction": "", "wrong_reaction": ""}]}
+""" + QUIZ_FIELDS
+
+FOLLOWUP_RULES = """작업: 퀴즈 채점
+당신은 사용자 메시지에 적힌 NPC이고, 방금 낸 퀴즈에 대한 플레이어의 답을 채점합니다.
+형식: {"message": "", "answer": "0"}
+- message: 맞았다면 정답이라고, 틀렸다면 틀렸다고 한 마디 한 뒤 자연스러운 대화를 한 마디 더 하고 끝냅니다
+- answer: 맞으면 "0", 틀리면 "1" (문자열)"""
+
+ENDING_RULES = """작업: 결말
+플레이어가 미로의 마지막 장소에 도착했습니다. 사용자 메시지의 최종 결말을 플레이어에게 자세하게 들려줍니다.
+JSON이 아닌 일반 문장으로 씁니다."""
+
+
+def _system(*parts: str) -> SystemMessage:
+    return SystemMessage(content="\n\n".join((GAME_OVERVIEW,) + parts))
+
+
+# 호출 종류별 시스템 메시지는 모듈 로드 시 한 번만 만든다 (글자 그대로 재사용)
+STORY_SYSTEM = _system(JSON_RULES, STORY_RULES)
+QUESTION_SYSTEM = _system(JSON_RULES, QUESTION_RULES)
+QUIZ_SET_SYSTEM = _system(JSON_RULES, QUIZ_SET_RULES)
+FOLLOWUP_SYSTEM = _system(JSON_RULES, FOLLOWUP_RULES)
+ENDING_SYSTEM = _system(ENDING_RULES)
+
+# 시스템 메시지 → 호출 종류 (가짜/재생 백엔드가 어떤 응답을 돌려줄지 고를 때 사용)
+# 같은 객체인지로 먼저 비교하므로 지시 문구를 고쳐도 종류는 그대로 구분된다
+SYSTEM_KINDS = (
+    (STORY_SYSTEM, "story"),
+    (QUESTION_SYSTEM, "question"),
+    (QUIZ_SET_SYSTEM, "quizset"),
+    (FOLLOWUP_SYSTEM, "followup"),
+    (ENDING_SYSTEM, "ending"),
+)
+
+
+def prompt_kind(messages) -> str:
+    if isinstance(messages, (list, tuple)) and messages:
+        first = messages[0]
+        for system, kind in SYSTEM_KINDS:
+            if first is system or getattr(first, "content", None) == system.content:
+                return kind
+    return "ending"
+
+
+def npc_line(npc: dict) -> str:
+    return f"'{npc['name']}' (직업: {npc.get('role', '')}, 말투: {npc.get('personality', '')})"
+
+
+def story_messages(name: str, setting: str, atmosphere: str, npc_count: int) -> List:
+    return [STORY_SYSTEM, HumanMessage(content=(
+        f"장소: {setting}\n분위기: {atmosphere}\n플레이어 이름: {name}\nNPC 수: {npc_count}"
+    ))]
+
+
+def question_messages(npc: dict, story_part: str, ordinal: str) -> List:
+    return [QUESTION_SYSTEM, HumanMessage(content=(
+        f"NPC: {ordinal} NPC {npc_line(npc)}\n들려줄 이야기: {story_part}"
+    ))]
+
+
+def quiz_set_messages(world_description: str, entries: Sequence[Tuple[str, dict, str]]) -> List:
+    # entries: (호칭, NPC, 들려줄 이야기)
+    lines = "\n".join(
+        f"{i + 1}. {ordinal} NPC {npc_line(npc)}, 들려줄 이야기: {story_part}"
+        for i, (ordinal, npc, story_part) in enumerate(entries)
+    )
+    return [QUIZ_SET_SYSTEM, HumanMessage(content=(
+        f"세계관: {world_description}\nNPC {len(entries)}명:\n{lines}"
+    ))]
+
+
+def followup_messages(npc: dict, ordinal: str, quiz: str, options: Sequence[str], player_answer: str) -> List:
+    # 퀴즈 JSON 전체 대신 질문과 선택지만 보낸다
+    choices = " / ".join(f"{i}) {option}" for i, option in enumerate(options, start=1))
+    return [FOLLOWUP_SYSTEM, HumanMessage(content=(
+        f"NPC: {ordinal} NPC {npc_line(npc)}\n퀴즈: {quiz}\n선택지: {choices}\n플레이어의 답: {player_answer}"
+    ))]
+
+
+def ending_messages(result_story: str) -> List:
+    return [ENDING_SYSTEM, HumanMessage(content=f"최종 결말: {result_story}")]
@@ -0,0 +1,122 @@
+import asyncio
+import os
+import sys
+import time
+
+# -------------------------
+# LLM / 이미지 제공자 선택
+# -------------------------
+# openai: 실제 OpenAI API (공유 커넥션 풀 사용)
+# mock:   네트워크 없이 동작하는 결정적 가짜 백엔드 (mock_provider.py, 부하 테스트용)
+# replay: LLM_RECORD_PATH로 기록해 둔 실제 응답을 원래 지연 시간대로 재생 (llm_trace.py)
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
+IMAGE_PROVIDER = os.getenv("IMAGE_PROVIDER", LLM_PROVIDER)
+# 설정하면 실제 호출(openai/mock)의 응답과 지연 시간을 이 트레이스 파일에 기록
+LLM_RECORD_PATH = os.getenv("LLM_RECORD_PATH", "")
+# 워커 시작 시 미리 열어 둘 커넥션 수 (0이면 첫 요청에서 연다)
+PROVIDER_WARMUP_CONNECTIONS = int(os.getenv("PROVIDER_WARMUP_CONNECTIONS", "2"))
+PROVIDER_WARMUP_TIMEOUT = float(os.getenv("PROVIDER_WARMUP_TIMEOUT", "10"))
+
+
+class Lazy:
+    # 처음 사용할 때 프로세스마다 한 번 만든다
+    # (모듈을 불러올 때는 무거운 SDK를 import하지 않고, gunicorn --preload로 fork된 워커끼리 커넥션을 공유하지 않게)
+    def __init__(self, factory):
+        self._factory = factory
+        self._target = None
+        self._pid = 0
+
+    def get(self):
+        if self._target is None or self._pid != os.getpid():
+            self._target = self._factory()
+            self._pid = os.getpid()
+        return self._target
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+def create_chat_model():
+    model = _base_chat_model()
+    if LLM_RECORD_PATH and LLM_PROVIDER != "replay":
+        from llm_trace import RecordingChatModel
+        return RecordingChatModel(inner=model)
+    return model
+
+
+def _base_chat_model():
+    # mock/replay일 때는 OpenAI 클라이언트를 만들지 않는다 (API 키 없이 실행 가능)
+    if LLM_PROVIDER == "mock":
+        from mock_provider import MockChatModel
+        return MockChatModel()
+    if LLM_PROVIDER == "replay":
+        from llm_trace import ReplayChatModel
+        return ReplayChatModel()
+    # (Deprecation 경고를 없애려면):
+    # from langchain_community.chat_models import ChatOpenAI
+    from langchain.chat_models import ChatOpenAI
+    from openai_clients import async_openai
+    return ChatOpenAI(
+        model="gpt-4o",
+        temperature=0.7,
+        # 비동기 호출은 공유 커넥션 풀을 사용
+        async_client=async_openai.chat.completions
+    )
+
+
+chat_model = Lazy(create_chat_model)
+
+
+class OpenAIImageProvider:
+    async def generate(self, prompt: str, n: int = 1, size: str = "1024x1024") -> str:
+        from openai_clients import async_openai
+        response = await async_openai.images.generate(
+            model = "dall-e-3",
+            prompt = prompt,
+            n=n,
+            size=size
+        )
+        # 응답에서 첫 번째 이미지의 URL 추출
+        return response.data[0].url
+
+
+def create_image_provider():
+    if IMAGE_PROVIDER == "mock":
+        from mock_provider import MockImageProvider
+        provider = MockImageProvider()
+    elif IMAGE_PROVIDER == "replay":
+        from llm_trace import ReplayImageProvider
+        return ReplayImageProvider()
+    else:
+        provider = OpenAIImageProvider()
+    if LLM_RECORD_PATH:
+        from llm_trace import RecordingImageProvider
+        return RecordingImageProvider(provider)
+    return provider
+
+
+image_provider = Lazy(create_image_provider)
+
+
+async def warm_up_providers() -> float:
+    # 워커 시작 직후 제공자를 만들고 커넥션을 미리 열어 첫 요청이 TLS 연결 비용을 내지 않게 한다
+    start = time.perf_counter()
+    chat_model.get()
+    image_provider.get()
+    if "replay" in (LLM_PROVIDER, IMAGE_PROVIDER):
+        from llm_trace import replay_trace
+        await asyncio.to_thread(replay_trace)
+    clients = sys.modules.get("openai_clients")
+    if clients is not None and PROVIDER_WARMUP_CONNECTIONS > 0:
+        try:
+            await asyncio.wait_for(clients.open_connections(PROVIDER_WARMUP_CONNECTIONS), PROVIDER_WARMUP_TIMEOUT)
+        except Exception as e:
+            print("제공자 커넥션 예열 중 오류 발생:", e)
+    return time.perf_counter() - start
+
+
+async def close_providers() -> None:
+    # OpenAI 커넥션 풀은 실제로 만들어졌을 때만 닫는다
+    clients = sys.modules.get("openai_clients")
+    if clients is not None:
+        await clients.close_clients()
@@ -0,0 +1,130 @@
+import asyncio
+import json
+import os
+import time
+from typing import Dict, Optional
+
+from llm_governor import PRIORITY_PREFETCH, run_with_priority
+from llm_langchain import generate_npc_quiz, generate_quiz_set, quiz_count
+from session_store import SESSION_TTL, SessionStore
+from token_budget import use_ledger
+
+# -------------------------
+# 설정
+# -------------------------
+# "batch"    : /world 직후 모든 NPC 퀴즈를 한 번의 호출로 생성 (빠진 퀴즈는 prefetch처럼 하나씩)
+# "prefetch" : 다음 NPC의 퀴즈만 백그라운드에서 미리 생성
+# 다음 NPC 퀴즈는 현재 퀴즈를 만드는 동안 함께 생성된다 (main.npc_quiz_step)
+# "off"      : 기존처럼 NPC를 만날 때 생성
+QUIZ_MODE = os.getenv("QUIZ_MODE", "batch")
+# 다른 워커가 생성 중인 퀴즈를 기다리는 최대 시간 (초)
+QUIZ_PREFETCH_WAIT = float(os.getenv("QUIZ_PREFETCH_WAIT", "20"))
+
+_PENDING = b"pending"
+
+# 이 워커에서 실행 중인 생성 작업: "세션ID:NPC번호" -> Task
+_tasks: Dict[str, asyncio.Task] = {}
+
+
+def _quiz_key(session_id: str, index: int) -> str:
+    return f"quiz:{session_id}:{index}"
+
+
+def _track(session_id: str, indexes, coro) -> None:
+    # 사전 생성은 가장 낮은 우선순위로 실행
+    task = run_with_priority(PRIORITY_PREFETCH, coro)
+    keys = [f"{session_id}:{i}" for i in indexes]
+    for key in keys:
+        _tasks[key] = task
+
+    def _done(_):
+        for key in keys:
+            if _tasks.get(key) is task:
+                del _tasks[key]
+    task.add_done_callback(_done)
+
+
+def _with_tokens(quiz: dict, ledger: dict) -> dict:
+    # 사전 생성에 쓴 토큰은 퀴즈와 함께 저장했다가 NPC를 만날 때 게임 상태에 합산
+    return {**quiz, "_tokens": ledger} if ledger else quiz
+
+
+async def _run_batch(store: SessionStore, session_id: str, story_data: dict, name: str, count: int) -> None:
+    ledger = {}
+    use_ledger(ledger)
+    try:
+        quizzes = await generate_quiz_set(story_data, name, count)
+    except Exception as e:
+        print("퀴즈 일괄 생성 중 오류 발생:", e)
+        quizzes = []
+    for i in range(count):
+        if i < len(quizzes) and isinstance(quizzes[i], dict):
+            quiz = _with_tokens(quizzes[i], ledger) if i == 0 else quizzes[i]
+            store.save_raw(_quiz_key(session_id, i), json.dumps(quiz).encode("utf-8"), ttl=SESSION_TTL)
+        else:
+            # 실패한 퀴즈는 NPC를 만날 때 다시 생성
+            store.delete(_quiz_key(session_id, i))
+
+
+async def _run_single(store: SessionStore, session_id: str, story_data: dict, index: int, name: str,
+                      count: int) -> None:
+    ledger = {}
+    use_ledger(ledger)
+    try:
+        quiz = _with_tokens(await generate_npc_quiz(story_data, index, name, count), ledger)
+        store.save_raw(_quiz_key(session_id, index), json.dumps(quiz).encode("utf-8"), ttl=SESSION_TTL)
+    except Exception as e:
+        print("퀴즈 사전 생성 중 오류 발생:", e)
+        store.delete(_quiz_key(session_id, index))
+
+
+def store_quizzes(store: SessionStore, session_id: str, quizzes: list) -> None:
+    # 풀에서 꺼낸 세계관처럼 이미 만들어진 퀴즈를 그대로 등록
+    for i, quiz in enumerate(quizzes):
+        if isinstance(quiz, dict):
+            store.save_raw(_quiz_key(session_id, i), json.dumps(quiz).encode("utf-8"), ttl=SESSION_TTL)
+
+
+def start_quiz_prefetch(store: SessionStore, session_id: str, story_data: Optional[dict],
+                        index: int = 0, name: str = "", count: Optional[int] = None) -> None:
+    # count: 미로의 NPC 수 (없으면 스토리의 NPC 수)
+    if QUIZ_MODE == "off" or not story_data:
+        return
+    count = quiz_count(story_data, count)
+    if index >= count:
+        return
+
+    if QUIZ_MODE == "batch" and index == 0:
+        # 일괄 모드는 게임 시작 시 한 번만 실행
+        indexes = range(count)
+        coro = _run_batch(store, session_id, story_data, name, count)
+    else:
+        # 이미 만들었거나 (다른 워커에서) 만드는 중인 퀴즈는 다시 생성하지 않는다
+        if store.load_raw(_quiz_key(session_id, index)) is not None:
+            return
+        indexes = [index]
+        coro = _run_single(store, session_id, story_data, index, name, count)
+
+    for i in indexes:
+        store.save_raw(_quiz_key(session_id, i), _PENDING, ttl=SESSION_TTL)
+    _track(session_id, indexes, coro)
+
+
+async def take_quiz(store: SessionStore, session_id: str, index: int) -> Optional[dict]:
+    # 이 워커에서 생성 중이면 완료까지 대기
+    task = _tasks.get(f"{session_id}:{index}")
+    if task is not None:
+        await asyncio.shield(task)
+
+    key = _quiz_key(session_id, index)
+    deadline = time.time() + QUIZ_PREFETCH_WAIT
+    data = store.load_raw(key)
+    # 다른 워커에서 생성 중이면 잠깐 폴링
+    while data == _PENDING and time.time() < deadline:
+        await asyncio.sleep(0.1)
+        data = store.load_raw(key)
+
+    if not data or data == _PENDING:
+        return None
+    store.delete(key)
+    return json.loads(data)
@@ -0,0 +1,200 @@
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# -------------------------
+# 1) 설정
+# -------------------------
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "sqlite")  # "memory" | "sqlite" | "off"
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", "response_cache.db")
+CACHE_TTL = float(os.getenv("CACHE_TTL", str(7 * 24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "20000"))
+# 키 하나당 보관할 변형 개수 (1이면 항상 같은 결과)
+CACHE_VARIANTS = int(os.getenv("CACHE_VARIANTS", "1"))
+
+PLAYER_PLACEHOLDER = "{{player_name}}"
+
+
+# -------------------------
+# 2) 키 생성
+# -------------------------
+def normalize_prompt(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text)
+    return " ".join(text.lower().split())
+
+
+def cache_key(kind: str, *parts: str) -> str:
+    raw = "\x1f".join(normalize_prompt(str(p)) for p in parts)
+    return kind + ":" + hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _replace_strings(value: Any, old: str, new: str) -> Any:
+    if isinstance(value, str):
+        return value.replace(old, new)
+    if isinstance(value, list):
+        return [_replace_strings(v, old, new) for v in value]
+    if isinstance(value, dict):
+        return {k: _replace_strings(v, old, new) for k, v in value.items()}
+    return value
+
+
+# 플레이어 이름은 캐시에 남기지 않는다: 자리표시자를 이름 삼아 생성하고, 보여줄 때 채워 넣는다
+# (생성된 문장에서 이름을 찾아 바꾸면 "하늘" 같은 이름이 본문의 같은 단어까지 바꿔 버린다)
+def personalize(value: Any, name: str) -> Any:
+    return _replace_strings(value, PLAYER_PLACEHOLDER, name.strip())
+
+
+# -------------------------
+# 3) 백엔드
+# -------------------------
+class MemoryCacheBackend:
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._guard = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._guard:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            if item[0] < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return item[1]
+
+    def set(self, key: str, data: bytes, ttl: float) -> None:
+        with self._guard:
+            self._data[key] = (time.time() + ttl, data)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SqliteCacheBackend:
+    def __init__(self, path: str = CACHE_DB_PATH, max_entries: int = CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        # gunicorn --preload: 마스터가 import 때 연 커넥션을 fork된 워커가 같이 쓰지 않게 한다
+        os.register_at_fork(after_in_child=self._reset_connections)
+        self._writes = 0
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS response_cache ("
+            " key TEXT PRIMARY KEY, data BLOB NOT NULL, expires REAL NOT NULL, used REAL NOT NULL)"
+        )
+
+    def _reset_connections(self) -> None:
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[bytes]:
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT data FROM response_cache WHERE key = ? AND expires >= ?", (key, now)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE response_cache SET used = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def set(self, key: str, data: bytes, ttl: float) -> None:
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO response_cache (key, data, expires, used) VALUES (?, ?, ?, ?)",
+            (key, data, now + ttl, now),
+        )
+        # 만료 항목과 용량 초과분(오래 안 쓴 순)은 가끔씩 정리
+        self._writes += 1
+        if self._writes % 128 == 0:
+            conn.execute("DELETE FROM response_cache WHERE expires < ?", (now,))
+            conn.execute(
+                "DELETE FROM response_cache WHERE key IN ("
+                " SELECT key FROM response_cache ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+
+
+# -------------------------
+# 4) 캐시
+# -------------------------
+class ResponseCache:
+    def __init__(self, backend, ttl: float = CACHE_TTL, variants: int = CACHE_VARIANTS):
+        self.backend = backend
+        self.ttl = ttl
+        self.variants = max(1, variants)
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+
+    def _count(self, counter: Dict[str, int], key: str) -> None:
+        kind = key.split(":", 1)[0]
+        counter[kind] = counter.get(kind, 0) + 1
+
+    def get(self, key: str) -> Optional[Any]:
+        if self.backend is None:
+            return None
+        data = self.backend.get(key)
+        stored = json.loads(data) if data else []
+        # 변형이 아직 K개가 안 되면 새로 생성하도록 miss 처리
+        if len(stored) < self.variants:
+            self._count(self.misses, key)
+            return None
+        self._count(self.hits, key)
+        return random.choice(stored)
+
+    def put(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        if self.backend is None:
+            return
+        data = self.backend.get(key)
+        stored = json.loads(data) if data else []
+        stored.append(value)
+        stored = stored[-self.variants:]
+        self.backend.set(key, json.dumps(stored, ensure_ascii=False).encode("utf-8"),
+                         self.ttl if ttl is None else ttl)
+
+    def stats(self) -> dict:
+        kinds = set(self.hits) | set(self.misses)
+        return {
+            kind: {
+                "hits": self.hits.get(kind, 0),
+                "misses": self.misses.get(kind, 0),
+                "hit_rate": self.hits.get(kind, 0) / max(1, self.hits.get(kind, 0) + self.misses.get(kind, 0)),
+            }
+            for kind in sorted(kinds)
+        }
+
+
+def create_cache() -> ResponseCache:
+    if CACHE_BACKEND == "off":
+        return ResponseCache(None)
+    if CACHE_BACKEND == "memory":
+        return ResponseCache(MemoryCacheBackend())
+    return ResponseCache(SqliteCacheBackend())
+
+
+response_cache = create_cache()
@@ -13,10 +13,18 @@ set +o allexport
 
 source venv/bin/activate
 
+# WebSocket 연결마다 소켓이 하나씩 필요하므로 파일 디스크립터 한도를 올린다 (워커당 5천 연결 이상)
+ulimit -n 65536
+
 # 기존 Gunicorn 프로세스 종료
 pkill -f "gunicorn"
 
 # Gunicorn을 사용해 애플리케이션 실행
-nohup gunicorn -w 4 -b 0.0.0.0:8000 --chdir /home/ubuntu/maze-game -k uvicorn.workers.UvicornWorker main:app > server.log 2>&1 &
+# 워커 수 (LLM 분당 한도를 워커끼리 나눠 쓰도록 거버너에도 알려 준다)
+WORKERS=4
+export GOVERNOR_WORKERS=$WORKERS
+# --preload: 마스터가 앱을 한 번만 import하고 워커는 fork로 바로 뜬다 (재시작/증설이 빠름)
+#            LLM/이미지 클라이언트와 커넥션은 fork 뒤 워커마다 예열 단계에서 만든다 (providers.py)
+nohup gunicorn -w $WORKERS -b 0.0.0.0:8000 --preload --chdir /home/ubuntu/maze-game -k uvicorn.workers.UvicornWorker main:app > server.log 2>&1 &
 
 echo "🚀 Maze Game Server started successfully!"
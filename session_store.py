@@ -0,0 +1,441 @@
+import asyncio
+import json
+import math
+import os
+import sqlite3
+import struct
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from typing import Optional
+
+from llm_langchain import MazeState, new_history, story_digest
+
+# -------------------------
+# 1) 설정
+# -------------------------
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "sqlite")  # "memory" | "sqlite"
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "sessions.db")
+SESSION_TTL = float(os.getenv("SESSION_TTL", "3600"))          # 초
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+SESSION_LOCK_TIMEOUT = float(os.getenv("SESSION_LOCK_TIMEOUT", "60"))
+# LLM 호출 도중 워커가 죽어도 락이 영원히 남지 않도록 하는 임대 시간
+SESSION_LOCK_LEASE = float(os.getenv("SESSION_LOCK_LEASE", "120"))
+
+
+class SessionBusy(Exception):
+    pass
+
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+
+# -------------------------
+# 2) MazeState 직렬화
+# -------------------------
+# 한 세션 = [헤더 13바이트] + [본문: 줄/종류 수 + 토큰 수 + NUL로 이은 UTF-8 문자열], 본문이 크면 zlib
+# 세계관(story_data)은 게임 중 바뀌지 않으므로 세션에는 내용 해시(story_key)만 넣고
+# 본문은 "story:<해시>" 키로 한 번만 저장한다 (같은 세계관을 쓰는 세션끼리 공유)
+STATE_MAGIC = 0xA7
+STATE_VERSION = 2
+STATE_COMPRESS_MIN = int(os.getenv("STATE_COMPRESS_MIN", "512"))
+# 워커마다 최근에 쓴 세계관을 파싱된 채로 보관 (NPC 정보 등을 세션끼리 같은 객체로 공유)
+STORY_CACHE_SIZE = int(os.getenv("STORY_CACHE_SIZE", "512"))
+
+FLAG_ZLIB = 1
+FLAG_MESSAGE_IS_QUIZ = 2   # 퀴즈 단계의 message는 quiz와 같아서 한 번만 저장
+
+_HEADER = struct.Struct("<BBBiHHH")   # magic, version, flags, num, npc_index, npc_count, quiz_answer
+_COUNTS = struct.Struct("<HH")        # 대화 기록 줄 수, 토큰 기록 종류 수
+# 버전 1 (모든 수가 1바이트): 배포 중에 남아 있는 세션을 읽기 위해서만 사용
+_HEADER_V1 = struct.Struct("<BBBBBBB")
+_COUNTS_V1 = struct.Struct("<BB")
+# 헤더의 정수 필드와 허용 범위 (범위를 넘으면 struct.error 대신 어느 필드인지 알려 준다)
+_INT_FIELDS = (("num", -2 ** 31, 2 ** 31 - 1), ("npc_index", 0, 0xFFFF), ("npc_count", 0, 0xFFFF),
+               ("quiz_answer", 0, 0xFFFF))
+_TEXT_FIELDS = ("name", "setting", "atmosphere", "step", "quiz", "option1", "option2", "option3",
+                "message", "player_answer", "correct_reaction", "wrong_reaction", "story_key")
+_MESSAGE = _TEXT_FIELDS.index("message")
+
+
+def dump_state(state: MazeState) -> bytes:
+    for name, low, high in _INT_FIELDS:
+        value = getattr(state, name)
+        if not low <= value <= high:
+            raise ValueError(f"세션 필드 {name}={value}가 저장 범위({low}~{high})를 벗어났습니다")
+    if len(state.token_usage) > 0xFFFF or len(state.history) > 0xFFFF:
+        raise ValueError("세션의 대화 기록/토큰 기록이 너무 많습니다")
+    flags = 0
+    texts = [getattr(state, name) for name in _TEXT_FIELDS]
+    if state.message and state.message == state.quiz:
+        flags |= FLAG_MESSAGE_IS_QUIZ
+        texts[_MESSAGE] = ""
+    history = state.history
+    usage = state.token_usage
+    texts += history
+    texts += usage
+    # 문자열은 NUL로 이어 한 번에 인코딩/디코딩 (게임 텍스트의 NUL 문자는 버린다)
+    joined = "\0".join(texts)
+    if joined.count("\0") != len(texts) - 1:
+        joined = "\0".join(text.replace("\0", "") for text in texts)
+    counts = [n for row in usage.values() for n in row]
+    body = _COUNTS.pack(len(history), len(usage)) + struct.pack(f"<{len(counts)}I", *counts) + joined.encode("utf-8")
+    if len(body) >= STATE_COMPRESS_MIN:
+        packed = zlib.compress(body, 1)
+        if len(packed) < len(body):
+            body = packed
+            flags |= FLAG_ZLIB
+    return _HEADER.pack(STATE_MAGIC, STATE_VERSION, flags, state.num, state.npc_index, state.npc_count,
+                        state.quiz_answer) + body
+
+
+def load_state(data: bytes) -> MazeState:
+    if data[0] != STATE_MAGIC:
+        return _load_legacy_state(data)
+    version = data[1]
+    if version == STATE_VERSION:
+        header, counts_struct = _HEADER, _COUNTS
+    elif version == 1:
+        header, counts_struct = _HEADER_V1, _COUNTS_V1
+    else:
+        raise ValueError(f"지원하지 않는 세션 형식 버전: {version}")
+    _, _, flags, num, npc_index, npc_count, quiz_answer = header.unpack_from(data)
+    body = data[header.size:]
+    if flags & FLAG_ZLIB:
+        body = zlib.decompress(body)
+    n_history, n_usage = counts_struct.unpack_from(body)
+    counts = struct.unpack_from(f"<{n_usage * 4}I", body, counts_struct.size)
+    texts = body[counts_struct.size + 16 * n_usage:].decode("utf-8").split("\0")
+    n_fields = len(_TEXT_FIELDS)
+    if len(texts) != n_fields + n_history + n_usage:
+        raise ValueError("세션 데이터가 손상되었습니다")
+    state = MazeState(*texts[:3], num=num, npc_index=npc_index, npc_count=npc_count, quiz_answer=quiz_answer,
+                      history=new_history(texts[n_fields:n_fields + n_history]),
+                      token_usage={kind: list(counts[i * 4:i * 4 + 4])
+                                   for i, kind in enumerate(texts[n_fields + n_history:])})
+    (state.step, state.quiz, state.option1, state.option2, state.option3, state.message,
+     state.player_answer, state.correct_reaction, state.wrong_reaction, state.story_key) = texts[3:n_fields]
+    if flags & FLAG_MESSAGE_IS_QUIZ:
+        state.message = state.quiz
+    return state
+
+
+def _load_legacy_state(data: bytes) -> MazeState:
+    # 이전 형식 (Pydantic JSON → zlib, story_data 포함): 배포 중에 남아 있는 세션용
+    raw = json.loads(zlib.decompress(data))
+    raw.pop("inventory", None)
+    state = MazeState(**{k: v for k, v in raw.items() if k not in ("history", "num")},
+                      num=int(raw.get("num") or 0), history=new_history(raw.get("history", ())))
+    if state.story_data is not None:
+        state.story_key = story_digest(state.story_data)
+    return state
+
+
+def story_record_key(story_key: str) -> str:
+    return f"story:{story_key}"
+
+
+class StoryCache:
+    # story_key → [세계관 dict, 저장소의 세계관 기록이 만료되는 시각 (모르면 0)]
+    def __init__(self, size: int = STORY_CACHE_SIZE):
+        self.size = size
+        self._items: "OrderedDict[str, list]" = OrderedDict()
+        self._guard = threading.Lock()
+
+    def get(self, key: str) -> Optional[list]:
+        with self._guard:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+            return item
+
+    def put(self, key: str, story: dict, expires: float) -> None:
+        with self._guard:
+            self._items[key] = [story, expires]
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+
+
+# -------------------------
+# 3) 저장소 공통 인터페이스
+# -------------------------
+class SessionStore:
+    ttl: float
+    # 워커마다 따로 두는 세계관 캐시 (하위 클래스 __init__에서 만든다)
+    stories: StoryCache
+    # 세계관 기록의 남은 시간이 이보다 짧아지면 세션을 저장할 때 만료를 늘린다
+    story_refresh_margin: float
+
+    def load_raw(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def save_raw(self, key: str, data: bytes, ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    def touch(self, key: str, ttl: float) -> bool:
+        # 내용은 그대로 두고 만료만 늘린다 (기록이 없거나 이미 만료됐으면 False)
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def try_acquire(self, key: str, owner: str) -> bool:
+        raise NotImplementedError
+
+    def renew(self, key: str, owner: str) -> bool:
+        # 아직 owner가 쥐고 있는 락의 임대를 다시 늘린다 (이미 잃었으면 False)
+        raise NotImplementedError
+
+    def release(self, key: str, owner: str) -> None:
+        raise NotImplementedError
+
+    @contextmanager
+    def lock(self, key: str, timeout: float = SESSION_LOCK_TIMEOUT):
+        owner = uuid.uuid4().hex
+        deadline = time.time() + timeout
+        delay = 0.005
+        while not self.try_acquire(key, owner):
+            if time.time() >= deadline:
+                raise SessionBusy(key)
+            time.sleep(delay)
+            delay = min(delay * 2, 0.1)
+        try:
+            yield
+        finally:
+            self.release(key, owner)
+
+    # 이벤트 루프를 막지 않는 비동기 버전
+    @asynccontextmanager
+    async def alock(self, key: str, timeout: float = SESSION_LOCK_TIMEOUT):
+        owner = uuid.uuid4().hex
+        deadline = time.time() + timeout
+        delay = 0.005
+        while not self.try_acquire(key, owner):
+            if time.time() >= deadline:
+                raise SessionBusy(key)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.1)
+        try:
+            yield
+        finally:
+            self.release(key, owner)
+
+    def load(self, session_id: str) -> Optional[MazeState]:
+        data = self.load_raw(session_id)
+        if data is None:
+            return None
+        state = load_state(data)
+        if state.story_key and state.story_data is None:
+            state.story_data = self.load_story(state.story_key)
+            if state.story_data is None:
+                # 세계관 기록이 먼저 만료됐으면 세션도 끝난 것으로 본다
+                return None
+            if self.story_refresh_margin == math.inf:
+                # 읽기만 해도 세션이 LRU 뒤로 가므로 세계관 기록도 함께 옮긴다
+                self.touch(story_record_key(state.story_key), 2 * self.ttl)
+        return state
+
+    def save(self, session_id: str, state: MazeState) -> None:
+        if state.story_data is not None and not state.story_key:
+            state.story_key = story_digest(state.story_data)
+        self.save_raw(session_id, dump_state(state))
+        # 세션 다음에 쓰거나 갱신해서 LRU에서도 세션보다 늦게 밀려나게 한다
+        if state.story_data is not None:
+            self.save_story(state.story_key, state.story_data)
+
+    def load_story(self, story_key: str) -> Optional[dict]:
+        item = self.stories.get(story_key)
+        if item is not None:
+            return item[0]
+        data = self.load_raw(story_record_key(story_key))
+        if data is None:
+            return None
+        story = json.loads(zlib.decompress(data))
+        # 다른 워커가 언제 쓴 기록인지 모르므로 만료 시각은 모름(0) → 다음 저장 때 만료를 늘린다
+        self.stories.put(story_key, story, 0.0)
+        return story
+
+    def save_story(self, story_key: str, story: dict) -> None:
+        # 세계관 기록은 세션 TTL의 두 배로 쓰고 남은 시간이 세션 TTL보다 짧아지기 전에 늘린다
+        # → 세션 기록(저장할 때마다 TTL)보다 항상 늦게 만료된다
+        item = self.stories.get(story_key)
+        now = time.time()
+        ttl = 2 * self.ttl
+        if item is not None:
+            if item[1] - now > self.story_refresh_margin:
+                return
+            if self.touch(story_record_key(story_key), ttl):
+                item[1] = now + ttl
+                return
+        data = zlib.compress(json.dumps(story, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 6)
+        self.save_raw(story_record_key(story_key), data, ttl=ttl)
+        self.stories.put(story_key, story, now + ttl)
+
+
+# ---------- [ 프로세스 내부 LRU + TTL ] ----------
+
+class MemorySessionStore(SessionStore):
+    def __init__(self, ttl: float = SESSION_TTL, max_entries: int = SESSION_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._guard = threading.Lock()
+        self._owners = {}
+        self.stories = StoryCache()
+        # LRU에서 세계관 기록이 세션보다 먼저 밀려나지 않도록 세션을 저장할 때마다 같이 갱신 (dict 연산뿐)
+        self.story_refresh_margin = math.inf
+
+    def load_raw(self, key: str) -> Optional[bytes]:
+        with self._guard:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, data = item
+            if expires < time.time():
+                self._evict(key)
+                return None
+            self._data.move_to_end(key)
+            return data
+
+    def save_raw(self, key: str, data: bytes, ttl: Optional[float] = None) -> None:
+        expires = time.time() + (self.ttl if ttl is None else ttl)
+        with self._guard:
+            self._data[key] = (expires, data)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                oldest = next(iter(self._data))
+                self._evict(oldest)
+
+    def touch(self, key: str, ttl: float) -> bool:
+        with self._guard:
+            item = self._data.get(key)
+            if item is None or item[0] < time.time():
+                return False
+            self._data[key] = (time.time() + ttl, item[1])
+            self._data.move_to_end(key)
+            return True
+
+    def delete(self, key: str) -> None:
+        with self._guard:
+            self._evict(key)
+
+    def _evict(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def try_acquire(self, key: str, owner: str) -> bool:
+        with self._guard:
+            if key in self._owners:
+                return False
+            self._owners[key] = owner
+            return True
+
+    def renew(self, key: str, owner: str) -> bool:
+        with self._guard:
+            return self._owners.get(key) == owner
+
+    def release(self, key: str, owner: str) -> None:
+        with self._guard:
+            if self._owners.get(key) == owner:
+                del self._owners[key]
+
+
+# ---------- [ 워커 간 공유: SQLite ] ----------
+
+class SqliteSessionStore(SessionStore):
+    def __init__(self, path: str = SESSION_DB_PATH, ttl: float = SESSION_TTL,
+                 lease: float = SESSION_LOCK_LEASE):
+        self.path = path
+        self.ttl = ttl
+        self.lease = lease
+        self.stories = StoryCache()
+        self.story_refresh_margin = ttl
+        self._local = threading.local()
+        # gunicorn --preload: 마스터가 import 때 연 커넥션을 fork된 워커가 같이 쓰지 않게 한다
+        os.register_at_fork(after_in_child=self._reset_connections)
+        self._writes = 0
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " key TEXT PRIMARY KEY, data BLOB NOT NULL, expires REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS session_locks ("
+            " key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)"
+        )
+
+    def _reset_connections(self) -> None:
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def load_raw(self, key: str) -> Optional[bytes]:
+        row = self._conn().execute(
+            "SELECT data FROM sessions WHERE key = ? AND expires >= ?",
+            (key, time.time()),
+        ).fetchone()
+        return row[0] if row else None
+
+    def save_raw(self, key: str, data: bytes, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions (key, data, expires) VALUES (?, ?, ?)",
+            (key, data, now + (self.ttl if ttl is None else ttl)),
+        )
+        # 만료된 세션은 가끔씩 한꺼번에 정리
+        self._writes += 1
+        if self._writes % 256 == 0:
+            conn.execute("DELETE FROM sessions WHERE expires < ?", (now,))
+            conn.execute("DELETE FROM session_locks WHERE expires < ?", (now,))
+
+    def touch(self, key: str, ttl: float) -> bool:
+        now = time.time()
+        cur = self._conn().execute(
+            "UPDATE sessions SET expires = ? WHERE key = ? AND expires >= ?", (now + ttl, key, now)
+        )
+        return cur.rowcount == 1
+
+    def delete(self, key: str) -> None:
+        self._conn().execute("DELETE FROM sessions WHERE key = ?", (key,))
+
+    def try_acquire(self, key: str, owner: str) -> bool:
+        now = time.time()
+        cur = self._conn().execute(
+            "INSERT INTO session_locks (key, owner, expires) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET owner = excluded.owner, expires = excluded.expires "
+            "WHERE session_locks.expires < ?",
+            (key, owner, now + self.lease, now),
+        )
+        return cur.rowcount == 1
+
+    def renew(self, key: str, owner: str) -> bool:
+        cur = self._conn().execute(
+            "UPDATE session_locks SET expires = ? WHERE key = ? AND owner = ?",
+            (time.time() + self.lease, key, owner),
+        )
+        return cur.rowcount == 1
+
+    def release(self, key: str, owner: str) -> None:
+        self._conn().execute(
+            "DELETE FROM session_locks WHERE key = ? AND owner = ?", (key, owner)
+        )
+
+
+def create_store() -> SessionStore:
+    if SESSION_BACKEND == "memory":
+        return MemorySessionStore()
+    return SqliteSessionStore()
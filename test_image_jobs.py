@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+import image_generate
+import image_jobs
+from llm_governor import GovernorOverloaded
+from response_cache import ResponseCache
+from session_store import MemorySessionStore
+
+
+@pytest.fixture(autouse=True)
+def no_cache(monkeypatch):
+    monkeypatch.setattr(image_generate, "response_cache", ResponseCache(None))
+
+
+def overloaded(monkeypatch):
+    async def acquire(amount=0.0):
+        raise GovernorOverloaded(7)
+
+    monkeypatch.setattr(image_generate.image_governor, "acquire", acquire)
+
+
+def test_overload_is_not_swallowed(monkeypatch):
+    overloaded(monkeypatch)
+    with pytest.raises(GovernorOverloaded):
+        asyncio.run(image_generate.generate_image("x"))
+
+
+def test_provider_errors_still_fall_back_to_empty_image(monkeypatch):
+    class Broken:
+        async def generate(self, prompt, n=1, size="1024x1024"):
+            raise RuntimeError("boom")
+
+    monkeypatch.setattr(image_generate, "image_provider", Broken())
+    assert asyncio.run(image_generate.generate_image("x")) == ""
+
+
+def test_overloaded_job_keeps_retry_after(monkeypatch):
+    overloaded(monkeypatch)
+    store = MemorySessionStore()
+
+    async def main():
+        job_id = image_jobs.start_image_job(store, "x")
+        await asyncio.gather(*image_jobs._running.values())
+        return job_id
+
+    job = image_jobs.get_image_job(store, asyncio.run(main()))
+    assert job["status"] == "overloaded" and job["retryAfter"] == 7
+
+
+def test_cancelled_job_stops_generation_and_is_forgotten(monkeypatch):
+    started = []
+
+    class Slow:
+        async def generate(self, prompt, n=1, size="1024x1024"):
+            started.append(prompt)
+            await asyncio.sleep(5)
+            return "https://cdn.example.com/a.png"
+
+    monkeypatch.setattr(image_generate, "image_provider", Slow())
+    store = MemorySessionStore()
+
+    async def main():
+        job_id = image_jobs.start_image_job(store, "x")
+        task = image_jobs._running[job_id]
+        await asyncio.sleep(0.05)
+        image_jobs.cancel_image_job(store, job_id)
+        await asyncio.gather(task, return_exceptions=True)
+        return job_id, task
+
+    job_id, task = asyncio.run(main())
+    assert started and task.cancelled()
+    assert image_jobs.get_image_job(store, job_id) is None and not image_jobs._running
@@ -0,0 +1,44 @@
+import os
+
+import image_store
+from image_store import public_image_url, public_image_variants, storable, stored_image_path
+
+DIGEST = "ab" * 32
+
+
+def test_relative_image_urls_use_request_base():
+    assert public_image_url(f"/images/{DIGEST}/full", "http://api.example.com/") == \
+        f"http://api.example.com/images/{DIGEST}/full"
+    assert public_image_url(f"/images/{DIGEST}/thumb", "wss://api.example.com/game/") == \
+        f"https://api.example.com/game/images/{DIGEST}/thumb"
+
+
+def test_provider_urls_are_unchanged():
+    url = "https://cdn.example.com/a.png"
+    assert public_image_url(url, "http://api.example.com/") == url
+    assert public_image_url("", "http://api.example.com/") == ""
+
+
+def test_only_remote_http_urls_are_stored():
+    assert storable("https://oaidalleapiprodscus.blob.core.windows.net/x.png")
+    assert not storable("https://mock-images.invalid/x.png")
+    assert not storable("data:image/png;base64,AAAA")
+
+
+def test_stored_image_path_rejects_bad_names():
+    assert stored_image_path("../../etc/passwd", "full") is None
+    assert stored_image_path(DIGEST, "huge") is None
+
+
+def test_stored_variants_are_exposed(monkeypatch, tmp_path):
+    monkeypatch.setattr(image_store, "IMAGE_STORE_DIR", str(tmp_path))
+    # full과 thumb만 만들어진 이미지: 실제로 있는 변형만 주소를 돌려준다
+    for variant in ("full", "thumb"):
+        path = image_store.image_file(DIGEST, variant)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, "wb").close()
+    assert public_image_variants(f"/images/{DIGEST}/full", "http://api.example.com/") == {
+        "full": f"http://api.example.com/images/{DIGEST}/full",
+        "thumb": f"http://api.example.com/images/{DIGEST}/thumb",
+    }
+    assert public_image_variants("https://cdn.example.com/a.png", "http://api.example.com/") == {}
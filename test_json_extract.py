@@ -0,0 +1,54 @@
+import json
+
+import pytest
+from pydantic import BaseModel
+
+import json_extract
+from json_extract import extract_json, parse_model, repair_json
+
+
+@pytest.mark.parametrize("text, expected", [
+    # 같은 줄에서 쉼표가 빠진 키/값 쌍과 배열 항목
+    ('{"a": "x" "b": "y"}', {"a": "x", "b": "y"}),
+    ('{"a": "x"   "b": 1, "c": [1 2]}', {"a": "x", "b": 1, "c": [1, 2]}),
+    ('["a" "b", "c"]', ["a", "b", "c"]),
+    ('{"a": {"b": "x"} "c": "y"}', {"a": {"b": "x"}, "c": "y"}),
+    # 줄바꿈 뒤에서 빠진 쉼표
+    ('{"a": "x"\n"b": "y"}', {"a": "x", "b": "y"}),
+    # 끝에 남은 쉼표, 주석
+    ('{"a": 1, // 설명\n"b": [1, 2,],}', {"a": 1, "b": [1, 2]}),
+    # 문자열 안의 이스케이프 안 된 따옴표는 본문으로 남긴다
+    ('{"q": "그는 "안녕"이라고 했다", "b": 2}', {"q": '그는 "안녕"이라고 했다', "b": 2}),
+    ('{"q": "말했다: "네" "아니오" 중 하나"}', {"q": '말했다: "네" "아니오" 중 하나'}),
+    # 문자열 안의 줄바꿈/탭
+    ('{"a": "첫 줄\n둘째\t줄"}', {"a": "첫 줄\n둘째\t줄"}),
+    # 따옴표 없는 키, 여는 따옴표가 빠진 값, 파이썬 리터럴
+    ('{answer: 2, "ok": True, "x": None}', {"answer": 2, "ok": True, "x": None}),
+    ('{"background": 스토리의 시작", "n": 1}', {"background": "스토리의 시작", "n": 1}),
+    # 잘린 응답
+    ('{"a": "끝나지 않은', {"a": "끝나지 않은"}),
+    ('{"a": [1, 2', {"a": [1, 2]}),
+    ('{"a": 1, "b":', {"a": 1, "b": None}),
+])
+def test_repair(text, expected):
+    assert json.loads(repair_json(text)) == expected
+
+
+def test_extract_counts_ok_and_repaired(monkeypatch):
+    monkeypatch.setattr(json_extract, "_counters", json_extract.defaultdict(
+        lambda: {"ok": 0, "repaired": 0, "failed": 0, "invalid": 0}))
+    # 앞뒤 설명문/코드 블록은 잘라내기만 하면 된다
+    assert extract_json('결과:\n```json\n{"a": 1}\n```', "t") == {"a": 1}
+    assert extract_json('{"a": "x" "b": "y"}', "t") == {"a": "x", "b": "y"}
+    with pytest.raises(json.JSONDecodeError):
+        extract_json("JSON이 아닙니다", "t")
+    assert json_extract.parse_stats()["t"] == {"ok": 1, "repaired": 1, "failed": 1, "invalid": 0}
+
+
+def test_parse_model_schema_mismatch_is_decode_error():
+    class Model(BaseModel):
+        a: int
+
+    assert parse_model('{"a": 1 "b": 2}', Model, "t").a == 1
+    with pytest.raises(json.JSONDecodeError):
+        parse_model('{"a": "숫자 아님"}', Model, "t")
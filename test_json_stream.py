@@ -0,0 +1,36 @@
+import json
+
+from json_stream import IncrementalFieldParser
+
+DOC = json.dumps({
+    "world_description": "어두운 숲",
+    "story": {"background": "옛날 \"숲\"에는\n등불이", "objective": "출구 찾기"},
+    "npcs": [{"name": "background", "role": "objective"}],
+}, ensure_ascii=False)
+
+
+def test_fields_are_emitted_as_soon_as_they_complete():
+    parser = IncrementalFieldParser(["background", "objective"])
+    seen = []
+    for i, ch in enumerate(DOC):
+        for field, value in parser.feed(ch):
+            seen.append((field, value, i))
+    # 값의 닫는 따옴표를 받은 순간 나오고, 이스케이프/줄바꿈은 풀어서 돌려준다
+    assert [(f, v) for f, v, _ in seen] == [("background", "옛날 \"숲\"에는\n등불이"), ("objective", "출구 찾기")]
+    assert seen[0][2] < DOC.index('"objective"') and seen[1][2] < DOC.index('"npcs"')
+    assert parser.text == DOC
+
+
+def test_values_that_look_like_keys_are_not_fields():
+    parser = IncrementalFieldParser(["background", "objective"])
+    # "name"/"role"의 값이 필드 이름과 같아도 키로 보지 않고, 같은 필드는 한 번만 낸다
+    doc = '{"npcs": [{"name": "background", "role": "objective"}], "background": "a", "background": "b"}'
+    assert parser.feed(doc) == [("background", "a")]
+
+
+def test_chunk_boundaries_do_not_matter():
+    whole = IncrementalFieldParser(["background", "objective"]).feed(DOC)
+    for size in (1, 3, 7, 64):
+        parser = IncrementalFieldParser(["background", "objective"])
+        chunks = [DOC[i:i + size] for i in range(0, len(DOC), size)]
+        assert [item for chunk in chunks for item in parser.feed(chunk)] == whole
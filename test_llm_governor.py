@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+from llm_governor import (
+    PRIORITY_ENDING, PRIORITY_PREFETCH, PRIORITY_QUIZ, Governor, GovernorOverloaded, run_with_priority
+)
+
+
+def drained(rpm: float, **kwargs) -> Governor:
+    # 요청 버킷을 비워 두어 모든 호출이 대기열을 거치게 한다
+    governor = Governor("test", rpm, **kwargs)
+    governor.requests.tokens = 0
+    return governor
+
+
+def test_queued_calls_are_granted_by_priority():
+    governor = drained(600)
+    order = []
+
+    async def call(name):
+        await governor.acquire()
+        order.append(name)
+
+    async def main():
+        tasks = [run_with_priority(priority, call(name)) for priority, name in
+                 ((PRIORITY_PREFETCH, "prefetch"), (PRIORITY_ENDING, "ending"), (PRIORITY_QUIZ, "quiz"))]
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    # 늦게 왔어도 플레이어가 기다리는 퀴즈가 먼저, 사전 생성은 마지막
+    assert order == ["quiz", "ending", "prefetch"]
+    assert governor.stats()["queues"]["quiz"]["granted"] == 1
+
+
+def test_full_queue_rejects_only_that_priority():
+    governor = drained(60, queue_limit=1)
+
+    async def main():
+        waiting = run_with_priority(PRIORITY_PREFETCH, governor.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(GovernorOverloaded) as rejected:
+            await run_with_priority(PRIORITY_PREFETCH, governor.acquire())
+        # 다른 우선순위의 대기열은 따로 센다
+        quiz = run_with_priority(PRIORITY_QUIZ, governor.acquire())
+        await asyncio.sleep(0)
+        assert governor.depth[PRIORITY_QUIZ] == 1
+        for task in (waiting, quiz):
+            task.cancel()
+        await asyncio.gather(waiting, quiz, return_exceptions=True)
+        return rejected.value
+
+    error = asyncio.run(main())
+    assert error.retry_after >= 1
+    assert governor.rejected[PRIORITY_PREFETCH] == 1
+
+
+def test_queue_timeout_is_reported_as_overload():
+    governor = drained(1, queue_timeout=0.05)
+
+    async def main():
+        await run_with_priority(PRIORITY_QUIZ, governor.acquire())
+
+    with pytest.raises(GovernorOverloaded):
+        asyncio.run(main())
+    assert governor.depth == [0, 0, 0, 0] and governor.rejected[PRIORITY_QUIZ] == 1
@@ -0,0 +1,132 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import llm_hedge
+from llm_governor import GovernedLLM, GovernorOverloaded
+from llm_hedge import DeadlineExceeded, clear_deadline, hedged_invoke, remaining, set_deadline
+
+
+class FakeLLM:
+    def __init__(self, *replies):
+        # (지연 초, 응답) 목록을 호출 순서대로 돌려준다
+        self.replies = list(replies)
+        self.calls = 0
+
+    async def ainvoke(self, prompt, kind="", **kwargs):
+        delay, content = self.replies[min(self.calls, len(self.replies) - 1)]
+        self.calls += 1
+        await asyncio.sleep(delay)
+        return SimpleNamespace(content=content)
+
+
+@pytest.fixture(autouse=True)
+def short_budget(monkeypatch):
+    monkeypatch.setitem(llm_hedge.LLM_BUDGETS, "quiz", 0.3)
+    monkeypatch.setattr(llm_hedge, "HEDGE_DEFAULT_DELAY", 0.05)
+    monkeypatch.setattr(llm_hedge, "_trackers", {})
+
+
+def test_deadline_is_per_request_context():
+    async def request():
+        set_deadline("quiz")
+        inherited = await asyncio.create_task(child(False))
+        cleared = await asyncio.create_task(child(True))
+        return remaining(), inherited, cleared
+
+    async def child(clear):
+        if clear:
+            clear_deadline()
+        return remaining()
+
+    async def main():
+        # 다른 요청(태스크)의 마감은 보이지 않는다
+        other = asyncio.create_task(child(False))
+        return await request(), await other
+
+    (left, inherited, cleared), other = asyncio.run(main())
+    assert 0 < left <= 0.3 and 0 < inherited <= 0.3
+    assert cleared is None and other is None
+
+
+def test_slow_llm_raises_deadline_exceeded():
+    llm = FakeLLM((1.0, "늦음"))
+
+    async def main():
+        set_deadline("quiz")
+        return await hedged_invoke(llm, [], "quiz")
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(main())
+    assert llm.calls == 2
+
+
+def test_hedge_wins_when_first_call_stalls():
+    llm = FakeLLM((1.0, "늦음"), (0.01, "빠름"))
+
+    async def main():
+        set_deadline("quiz")
+        return await hedged_invoke(llm, [], "quiz")
+
+    assert asyncio.run(main()) == "빠름"
+
+
+def test_invalid_reply_is_retried_within_budget():
+    llm = FakeLLM((0.0, "깨짐"), (0.0, "정상"))
+
+    async def main():
+        set_deadline("quiz")
+        return await hedged_invoke(llm, [], "quiz", validate=lambda text: text == "정상")
+
+    assert asyncio.run(main()) == "정상"
+
+
+def test_background_calls_have_no_deadline():
+    llm = FakeLLM((0.5, "완료"))
+    assert asyncio.run(hedged_invoke(llm, [], "quiz")) == "완료"
+    assert llm.calls == 1
+
+
+class SlowGovernor:
+    # 대기열에서 wait초 기다린 뒤 통과시키거나, overloaded면 거절하는 거버너
+    def __init__(self, wait=0.0, overloaded=False):
+        self.wait = wait
+        self.overloaded = overloaded
+        self.in_flight = 0
+
+    async def acquire(self, amount=0.0):
+        if self.overloaded:
+            raise GovernorOverloaded(3)
+        await asyncio.sleep(self.wait)
+
+    def settle(self, estimated, actual):
+        pass
+
+
+def test_governor_wait_is_not_latency_and_not_hedged(monkeypatch):
+    monkeypatch.setitem(llm_hedge.LLM_BUDGETS, "quiz", 1.0)
+    llm = FakeLLM((0.05, "완료"))
+
+    async def main():
+        set_deadline("quiz")
+        return await hedged_invoke(GovernedLLM(llm, SlowGovernor(wait=0.3)), [], "quiz")
+
+    assert asyncio.run(main()) == "완료"
+    # 대기열에 있는 동안에는 헤지 요청을 더 보내지 않고, 표본에는 모델 응답 시간만 남는다
+    assert llm.calls == 1
+    (sample,) = llm_hedge.tracker_for("quiz").samples
+    assert sample < 0.2
+
+
+def test_overload_is_raised_without_retry():
+    llm = FakeLLM((0.0, "완료"))
+    governor = SlowGovernor(overloaded=True)
+
+    async def main():
+        set_deadline("quiz")
+        return await hedged_invoke(GovernedLLM(llm, governor), [], "quiz")
+
+    with pytest.raises(GovernorOverloaded):
+        asyncio.run(main())
+    assert llm.calls == 0
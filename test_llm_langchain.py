@@ -0,0 +1,196 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import llm_hedge
+import llm_langchain
+from llm_governor import GovernorOverloaded
+from llm_hedge import set_deadline
+from llm_langchain import MazeState, advance_game
+
+
+def test_common_word_name_does_not_corrupt_cached_story(monkeypatch):
+    from response_cache import MemoryCacheBackend, ResponseCache
+
+    cache = ResponseCache(MemoryCacheBackend())
+    prompts = []
+
+    async def fake_invoke(llm, prompt, kind, validate=None):
+        text = prompt[-1].content
+        prompts.append(text)
+        if kind == "world":
+            name = text.split("플레이어 이름: ")[1].split("\n")[0]
+            return json.dumps({
+                "objective": f"{name}님, 하늘 정원의 문을 여세요.",
+                "story_details": {"background": f"{name}님 머리 위로 하늘이 붉게 물듭니다.",
+                                  "intro": f"{name}님, 하늘을 보세요.", "middle": "", "final": "", "result": ""},
+                "npcs": [{"name": "하늘지기", "role": "정원사", "personality": "차분함"}],
+                "world_description": "하늘 정원",
+            }, ensure_ascii=False)
+        story_part = text.split("들려줄 이야기: ")[1]
+        return json.dumps({"quiz": story_part + " 무엇이 붉나요?", "option1": "하늘", "option2": "땅",
+                           "option3": "물", "answer": 1, "correct_reaction": "정답!", "wrong_reaction": "땡!"},
+                          ensure_ascii=False)
+
+    monkeypatch.setattr(llm_langchain, "response_cache", cache)
+    monkeypatch.setattr(llm_langchain, "hedged_invoke", fake_invoke)
+    monkeypatch.setattr(llm_langchain, "structured_llm", lambda model: None)
+
+    async def play(name):
+        state = MazeState(name=name, setting="정원", atmosphere="고요함", npc_count=1)
+        state = await llm_langchain.generate_story(state, name, "정원", "고요함")
+        quiz = await llm_langchain.generate_npc_quiz(state.story_data, 0, name, 1)
+        return state, quiz
+
+    first, first_quiz = asyncio.run(play("하늘"))
+    second, second_quiz = asyncio.run(play("미로"))
+    # LLM은 한 번씩만 호출되고, 두 번째 플레이어는 캐시를 쓴다
+    assert len(prompts) == 2 and "{{player_name}}" in prompts[0]
+    assert first.message.startswith("하늘님 머리 위로 하늘이 붉게 물듭니다.\n하늘님, 하늘 정원의 문을 여세요.")
+    # 이름과 같은 단어("하늘")는 다른 플레이어에게도 그대로 남는다
+    assert second.message.startswith("미로님 머리 위로 하늘이 붉게 물듭니다.\n미로님, 하늘 정원의 문을 여세요.")
+    assert second.story_data == first.story_data and second.story_key == first.story_key
+    assert first_quiz["quiz"] == "하늘님, 하늘을 보세요. 무엇이 붉나요?"
+    assert second_quiz["quiz"] == "미로님, 하늘을 보세요. 무엇이 붉나요?"
+    assert second_quiz["option1"] == "하늘"
+
+
+class StreamingLLM:
+    # 청크를 (지연 초, 내용 또는 예외)로 차례로 내보내고, 닫혔는지 기록한다
+    def __init__(self, *steps):
+        self.steps = steps
+        self.closed = False
+
+    async def astream(self, prompt, kind=""):
+        try:
+            for delay, item in self.steps:
+                await asyncio.sleep(delay)
+                if isinstance(item, Exception):
+                    raise item
+                yield SimpleNamespace(content=item)
+        finally:
+            self.closed = True
+
+
+def ending_state():
+    story = {"story_details": {"result": "{{player_name}}님이 탈출했습니다."}, "npcs": [{"name": "여우"}]}
+    return MazeState(name="하늘", setting="숲", atmosphere="밝음", step="end_game", story_data=story)
+
+
+def run_ending(monkeypatch, fake, budget=1.0):
+    monkeypatch.setattr(llm_langchain, "llm", fake)
+    monkeypatch.setitem(llm_hedge.LLM_BUDGETS, "ending", budget)
+    state = ending_state()
+
+    async def main():
+        set_deadline("ending")
+        return [token async for token in llm_langchain.stream_end_game(state)]
+
+    return asyncio.run(main()), state
+
+
+def test_stream_ending_success_sets_message(monkeypatch):
+    fake = StreamingLLM((0, "하늘님, "), (0, "축하합니다."))
+    tokens, state = run_ending(monkeypatch, fake)
+    assert tokens == ["하늘님, ", "축하합니다."]
+    assert state.message == "하늘님, 축하합니다." and fake.closed
+
+
+def test_stream_ending_mid_stream_error_keeps_partial_text(monkeypatch):
+    fake = StreamingLLM((0, "하늘님은 마침내"), (0, RuntimeError("connection reset")))
+    tokens, state = run_ending(monkeypatch, fake)
+    assert tokens[0] == "하늘님은 마침내" and len(tokens) == 2
+    assert state.message == "".join(tokens) and state.message.endswith("축하합니다!")
+    assert fake.closed
+
+
+def test_stream_ending_stalled_chunk_hits_deadline(monkeypatch):
+    fake = StreamingLLM((0, "하늘님은"), (5, "늦은 토큰"))
+    start = time.perf_counter()
+    tokens, state = run_ending(monkeypatch, fake, budget=0.2)
+    # 첫 토큰 뒤에 멈춰도 예산 안에서 끝내고 제공자 스트림을 닫는다
+    assert time.perf_counter() - start < 1
+    assert "늦은 토큰" not in state.message and state.message.startswith("하늘님은")
+    assert fake.closed
+
+
+def test_stream_ending_without_tokens_uses_template(monkeypatch):
+    fake = StreamingLLM((0, GovernorOverloaded(2)))
+    tokens, state = run_ending(monkeypatch, fake)
+    assert tokens == [state.message] and "하늘님이 탈출했습니다." in state.message
+
+
+def quiz_state(**fields) -> MazeState:
+    state = MazeState(name="n", setting="s", atmosphere="a", step="encounter_followup",
+                      story_data={"npcs": [{"name": "상인", "role": "상인"}]},
+                      npc_count=3, quiz="Q", option1="사과", option2="배", option3="포도",
+                      quiz_answer=2, correct_reaction="맞았어요", wrong_reaction="틀렸어요")
+    for key, value in fields.items():
+        setattr(state, key, value)
+    return state
+
+
+def test_known_answer_is_graded_without_llm(monkeypatch):
+    async def no_llm(*args, **kwargs):
+        raise AssertionError("정답을 알면 LLM을 부르지 않는다")
+
+    monkeypatch.setattr(llm_langchain, "hedged_invoke", no_llm)
+    # 번호, "n번", 선택지 문장 그대로 모두 채점된다
+    for answer, num, message in (("2", 0, "맞았어요"), ("2번", 0, "맞았어요"), (" 포도 ", 1, "틀렸어요")):
+        state = asyncio.run(advance_game(quiz_state(), player_answer=answer))
+        assert (state.num, state.message) == (num, message)
+        assert state.step == "encounter_question" and state.npc_index == 1
+
+
+def test_unknown_answer_or_key_asks_the_llm(monkeypatch):
+    calls = []
+
+    async def followup_llm(llm, prompt, kind, validate=None):
+        calls.append(kind)
+        return json.dumps({"message": "LLM 채점", "answer": "1"}, ensure_ascii=False)
+
+    monkeypatch.setattr(llm_langchain, "hedged_invoke", followup_llm)
+    monkeypatch.setattr(llm_langchain, "structured_llm", lambda schema: None)
+    # 선택지와 맞지 않는 답, 정답 정보가 없는 퀴즈 (이전 버전 캐시 등)
+    for state in (quiz_state(), quiz_state(quiz_answer=0)):
+        answer = "잘 모르겠어요" if state.quiz_answer else "2"
+        state = asyncio.run(advance_game(state, player_answer=answer))
+        assert (state.num, state.message) == (1, "LLM 채점")
+    assert calls == ["followup", "followup"]
+
+
+def test_graph_walks_any_number_of_npcs_to_the_ending(monkeypatch):
+    async def quiz(story_data, index, name="", npc_count=3):
+        return {"quiz": f"Q{index}", "option1": "a", "option2": "b", "option3": "c", "answer": 1,
+                "correct_reaction": "정답", "wrong_reaction": "오답"}
+
+    async def ending_llm(llm, prompt, kind, validate=None):
+        return "끝"
+
+    monkeypatch.setattr(llm_langchain, "generate_npc_quiz", quiz)
+    monkeypatch.setattr(llm_langchain, "hedged_invoke", ending_llm)
+    state = MazeState(name="n", setting="s", atmosphere="a", step="encounter_question", npc_count=5,
+                      story_data={"npcs": [{"name": "상인"}, {"name": "기사"}]})
+
+    async def main():
+        nonlocal state
+        quizzes = []
+        while state.step != "end_game":
+            state = await advance_game(state)
+            quizzes.append(state.quiz)
+            state = await advance_game(state, player_answer="1")
+        return quizzes, await advance_game(state)
+
+    quizzes, state = asyncio.run(main())
+    # 스토리의 NPC가 미로의 NPC보다 적어도 미로의 NPC 수만큼 만난다
+    assert quizzes == ["Q0", "Q1", "Q2", "Q3", "Q4"]
+    assert state.message == "끝" and state.npc_index == 5
+
+
+def test_legacy_and_finished_steps():
+    state = MazeState(name="n", setting="s", atmosphere="a", step="second_encounter_followup")
+    # 이전 버전 세션의 단계 이름은 (단계, NPC 번호)로 바뀐다
+    assert llm_langchain.normalize_step(state).step == "encounter_followup" and state.npc_index == 1
+    state = asyncio.run(advance_game(MazeState(name="n", setting="s", atmosphere="a", step="game_finished")))
+    assert state.message == "게임이 이미 종료되었습니다."
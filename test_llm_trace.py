@@ -0,0 +1,35 @@
+import asyncio
+import time
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+import llm_trace
+from llm_trace import RecordingChatModel, ReplayChatModel, Trace, TraceWriter
+from prompts import story_messages
+
+
+def test_sync_and_async_calls_record_and_replay(monkeypatch, tmp_path):
+    path = str(tmp_path / "trace.db")
+    writer = TraceWriter(path)
+    monkeypatch.setattr(llm_trace, "_writer", writer)
+    prompt = story_messages("{{player_name}}", "숲", "밝음", 3)
+    recording = RecordingChatModel(inner=FakeListChatModel(responses=["첫 응답", "둘째 응답"]))
+
+    # 동기 invoke도 비동기 호출과 똑같이 기록된다
+    assert recording.invoke(prompt).content == "첫 응답"
+    assert asyncio.run(recording.ainvoke(prompt)).content == "둘째 응답"
+    writer.flush()
+    # 큐가 비어도 마지막 묶음은 쓰는 중일 수 있으므로 두 기록이 보일 때까지 기다린다
+    for _ in range(100):
+        trace = Trace(path)
+        if trace.stats()["calls"] == 2:
+            break
+        time.sleep(0.01)
+
+    monkeypatch.setattr(llm_trace, "_trace", trace)
+    monkeypatch.setattr(llm_trace, "REPLAY_TIME_SCALE", 0)
+    replay = ReplayChatModel()
+    # 같은 입력의 n번째 호출은 n번째 기록 (동기/비동기 상관없이)
+    assert replay.invoke(prompt).content == "첫 응답"
+    assert asyncio.run(replay.ainvoke(prompt)).content == "둘째 응답"
+    assert llm_trace._trace.stats()["by_kind"] == {"story": 2}
@@ -0,0 +1,221 @@
+import asyncio
+import json
+import os
+import time
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import image_generate
+import llm_langchain
+import main
+import mock_provider
+import providers
+import quiz_prefetch
+from mock_provider import MockChatModel, MockImageProvider, parse_latency
+from response_cache import ResponseCache
+from session_store import MemorySessionStore
+
+WORLD = {"name": "용사", "location": "숲", "mood": "신비", "quiz": "q", "option1": "a", "option2": "b",
+         "option3": "c"}
+
+
+@pytest.fixture(autouse=True)
+def mock_backend(monkeypatch):
+    # 네트워크 없이 가짜 백엔드로, 세션은 메모리에, 캐시/세계관 풀/퀴즈 사전 생성 없이
+    monkeypatch.setattr(providers.chat_model, "_target", MockChatModel())
+    monkeypatch.setattr(providers.chat_model, "_pid", os.getpid())
+    monkeypatch.setattr(providers.image_provider, "_target", MockImageProvider())
+    monkeypatch.setattr(providers.image_provider, "_pid", os.getpid())
+    monkeypatch.setattr(llm_langchain, "_structured_llms", {})
+    monkeypatch.setattr(mock_provider, "MOCK_TIME_SCALE", 0.0)
+    for module in (llm_langchain, image_generate):
+        monkeypatch.setattr(module, "response_cache", ResponseCache(None))
+    monkeypatch.setattr(main, "session_store", MemorySessionStore())
+    monkeypatch.setattr(main.world_pool, "take", lambda *args: None)
+    monkeypatch.setattr(quiz_prefetch, "QUIZ_MODE", "off")
+
+
+def latency(monkeypatch, **seconds):
+    monkeypatch.setattr(mock_provider, "MOCK_TIME_SCALE", 1.0)
+    for kind, value in seconds.items():
+        monkeypatch.setitem(mock_provider.LATENCY, kind, parse_latency(str(value)))
+
+
+async def post_world(client: httpx.AsyncClient, **extra):
+    response = await client.post("/world", json={**WORLD, **extra})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def run(scenario):
+    async def main_():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await scenario(client)
+    return asyncio.run(main_())
+
+
+def test_concurrent_requests_do_not_block_each_other(monkeypatch):
+    latency(monkeypatch, story=0.3, image=0.0)
+
+    async def scenario(client):
+        start = time.perf_counter()
+        worlds = await asyncio.gather(*(post_world(client) for _ in range(4)))
+        return worlds, time.perf_counter() - start
+
+    worlds, elapsed = run(scenario)
+    # 요청 경로가 비동기라 LLM을 기다리는 동안 다른 요청이 진행된다 (직렬이면 1.2초)
+    assert elapsed < 0.6
+    assert len({world["sessionId"] for world in worlds}) == 4
+
+
+def test_world_story_and_image_are_generated_together(monkeypatch):
+    latency(monkeypatch, story=0.3, image=0.3)
+
+    async def scenario(client):
+        start = time.perf_counter()
+        world = await post_world(client)
+        return world, time.perf_counter() - start
+
+    world, elapsed = run(scenario)
+    # 스토리와 이미지를 동시에 만들므로 두 지연의 합(0.6초)보다 빨리 끝난다
+    assert elapsed < 0.5
+    assert world["worldDescription"] and world["image"].startswith(mock_provider.MOCK_IMAGE_BASE_URL)
+    assert world["imageJobId"] is None
+
+
+def test_async_image_is_delivered_as_a_job(monkeypatch):
+    latency(monkeypatch, story=0.0, image=0.2)
+
+    async def scenario(client):
+        world = await post_world(client, asyncImage=True)
+        first = (await client.get(f"/world/image/{world['imageJobId']}")).json()
+        await asyncio.sleep(0.3)
+        done = (await client.get(f"/world/image/{world['imageJobId']}")).json()
+        return world, first, done
+
+    world, first, done = run(scenario)
+    # 세계관은 이미지를 기다리지 않고 먼저 돌아온다
+    assert world["image"] == "" and first["status"] == "pending"
+    assert done["status"] == "done" and done["image"].startswith(mock_provider.MOCK_IMAGE_BASE_URL)
+
+
+def sse_events(text: str) -> list:
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_world_and_ending_stream_as_sse():
+    async def scenario(client):
+        world = (await client.post("/world/stream", json=WORLD)).text
+        session_id = sse_events(world)[-1][1]["sessionId"]
+        # 결말 단계로 건너뛰어 결말 스트림을 받는다
+        state = main.session_store.load(session_id)
+        state.step = "end_game"
+        main.session_store.save(session_id, state)
+        ending = (await client.get("/end_game/stream", headers={"X-Session-Id": session_id})).text
+        return sse_events(world), sse_events(ending)
+
+    world, ending = run(scenario)
+    # 필드는 완성되는 순서대로, 세션 정보는 마지막에
+    assert sorted(event for event, _ in world[:2]) == ["background", "objective"] and world[2][0] == "done"
+    assert len(world) == 3
+    assert world[-1][1]["worldDescription"] and world[-1][1]["imageJobId"]
+    tokens = [data for event, data in ending if event == "token"]
+    # 토큰을 이어 붙인 것이 최종 결말
+    assert len(tokens) > 1 and ending[-1] == ("done", {"finishDescription": "".join(tokens)})
+
+
+def test_maze_moves_are_validated_on_the_server():
+    async def scenario(client):
+        headers = {"X-Session-Id": "maze-session"}
+        maze = (await client.post("/maze", headers=headers)).json()
+        r, c = maze["userPos"]
+        step = next([r + dr, c + dc] for dr, dc in ((-1, 0), (1, 0), (0, -1), (0, 1))
+                    if maze["maze"][r + dr][c + dc] != 1)
+        jump = await client.post("/maze", json={"loc": [r + 2 * (step[0] - r), c + 2 * (step[1] - c)]},
+                                 headers=headers)
+        moved = await client.post("/maze", json={"loc": step}, headers=headers)
+        return step, jump, moved
+
+    step, jump, moved = run(scenario)
+    # 두 칸 점프는 거절되고, 한 칸 이동은 저장된 위치에 반영된다
+    assert jump.status_code == 400
+    assert moved.status_code == 200 and moved.json()["userPos"] == step
+
+
+def test_maze_delta_sends_changes_and_resyncs_stale_clients():
+    async def scenario(client):
+        headers = {"X-Session-Id": "delta-session"}
+        full = (await client.post("/maze/delta", json={"encoding": "rows"}, headers=headers)).json()
+        r, c = full["userPos"]
+        step = next([r + dr, c + dc] for dr, dc in ((-1, 0), (1, 0), (0, -1), (0, 1))
+                    if full["grid"][r + dr][c + dc] == 0)
+        delta = (await client.post("/maze/delta", json={"loc": step, "version": 0}, headers=headers)).json()
+        # 이미 지난 버전으로 보낸 이동은 적용하지 않고 전체 상태로 다시 맞춘다
+        stale = (await client.post("/maze/delta", json={"loc": [r, c], "version": 0}, headers=headers)).json()
+        return full, step, delta, stale
+
+    full, step, delta, stale = run(scenario)
+    assert full["type"] == "full" and full["version"] == 0
+    assert delta["type"] == "delta" and delta["version"] == 1 and delta["userPos"] == step
+    assert delta["cells"][:2] == [[*full["userPos"], 0], [*step, 3]]
+    assert stale["type"] == "full" and stale["version"] == 1 and stale["userPos"] == step
+
+
+def test_websocket_channel_plays_a_round():
+    def receive(ws, wanted):
+        # 다른 메시지(이미지 작업 등)가 섞여 와도 원하는 종류가 올 때까지 읽는다
+        while True:
+            msg = ws.receive_json()
+            if msg["type"] in (wanted, "error"):
+                return msg
+
+    with TestClient(main.app).websocket_connect("/ws/game") as ws:
+        ws.send_text("not json")
+        assert receive(ws, "error")["data"]["status"] == 400
+        ws.send_json({"type": "ping", "data": 1})
+        assert receive(ws, "pong")["data"] == 1
+
+        ws.send_json({"type": "world", **WORLD})
+        world = receive(ws, "world")["data"]
+        assert world["sessionId"] and world["worldDescription"]
+
+        ws.send_json({"type": "quiz"})
+        quiz = receive(ws, "quiz")["data"]
+        assert quiz["quiz"] and quiz["option1"]
+        ws.send_json({"type": "answer", "answer": "1"})
+        result = receive(ws, "result")["data"]
+        assert result["answerDescription"] and result["result"] in (0, 1)
+
+        # 같은 NPC에게 다시 답하면 단계 오류
+        ws.send_json({"type": "answer", "answer": "1"})
+        error = receive(ws, "result")
+        assert error["type"] == "error" and error["data"]["request"] == "answer" and error["data"]["status"] == 400
+
+
+def test_each_player_has_their_own_game():
+    async def scenario(client):
+        first = await post_world(client, name="하나")
+        second = await post_world(client, name="둘")
+        quiz = await client.get("/npc_quiz", headers={"X-Session-Id": first["sessionId"]})
+        # 첫 번째 플레이어가 퀴즈를 받아도 두 번째 플레이어의 단계는 그대로
+        answer = await client.post("/npc_quiz_result", json={"answer": "1"},
+                                   headers={"X-Session-Id": second["sessionId"]})
+        # 세션 없이 (쿠키도 없이) 들어온 요청
+        client.cookies.clear()
+        missing = await client.get("/npc_quiz")
+        return first, second, quiz, answer, missing
+
+    first, second, quiz, answer, missing = run(scenario)
+    assert first["sessionId"] != second["sessionId"]
+    assert quiz.status_code == 200 and quiz.json()["quiz"]
+    assert answer.status_code == 400 and "encounter_question" in answer.json()["detail"]
+    assert missing.status_code == 400
+    assert main.session_store.load(first["sessionId"]).step == "encounter_followup"
+    assert main.session_store.load(second["sessionId"]).name == "둘"
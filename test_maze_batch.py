@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+import maze_batch
+from maze_batch import (RECORD_DTYPE, TIERS, CatalogWriter, MazeCatalog, accept_mask, assign_tiers,
+                        generate_batch, iter_specs, maze_stats, open_catalog)
+from maze_generator import WALL, bfs_distances, generate_maze
+
+
+def batch(size: int, count: int, seed: int = 0) -> np.ndarray:
+    specs = iter_specs(count, size, size, 3, ["backtracker", "prim", "wilson"], seed)
+    return np.array(list(generate_batch(specs, workers=1)), dtype=RECORD_DTYPE)
+
+
+def test_maze_stats_match_bfs():
+    maze = generate_maze(21, 21, 3, 5, "prim")
+    stats = maze_stats(maze)
+    open_mask = maze.grid != WALL
+    assert stats["path_length"] == bfs_distances(open_mask, maze.user_pos)[maze.exit_pos] == maze.path_length
+    assert stats["dead_ends"] > 0 and stats["junctions"] > 0
+    assert stats["difficulty"] == pytest.approx((stats["path_length"] + stats["path_branches"]) / open_mask.sum())
+
+
+def test_tiers_are_quantiles_within_each_size():
+    records = np.concatenate([batch(11, 300), batch(31, 150, seed=1)])
+    assign_tiers(records)
+    for size in (11, 31):
+        rows = records[records["width"] == size]
+        counts = np.bincount(rows["tier"], minlength=len(TIERS))
+        # 점수가 같은 미로가 있어도 구간마다 상당수가 들어가야 한다
+        assert (counts > len(rows) // 6).all(), counts
+        means = [rows["path_length"][rows["tier"] == i].mean() for i in range(len(TIERS))]
+        assert means == sorted(means)
+
+
+def test_catalog_round_trip_and_filter(tmp_path):
+    records = batch(11, 200)
+    assign_tiers(records)
+    path = str(tmp_path / "mazes.cat")
+    mask = accept_mask(records, {TIERS.index("hard")}, 0, 2 ** 31, 0.0, float("inf"))
+    with CatalogWriter(path, flush_every=7) as writer:
+        for row in records[mask][:5].tolist():
+            writer.write(row)
+        writer.write_array(records[mask][5:])
+    loaded = open_catalog(path)
+    assert isinstance(loaded, np.memmap)
+    assert (loaded == records[mask]).all()
+
+    catalog = MazeCatalog(path)
+    config = catalog.pick("hard")
+    maze = generate_maze(config["width"], config["height"], config["npc"], config["seed"], config["algorithm"])
+    row = loaded[loaded["seed"] == config["seed"]][0]
+    assert maze_stats(maze)["path_length"] == row["path_length"]
+
+
+def test_pick_reports_tier_fallback(tmp_path):
+    records = batch(11, 30)
+    records["tier"] = TIERS.index("easy")
+    path = str(tmp_path / "easy.cat")
+    with CatalogWriter(path) as writer:
+        writer.write_array(records)
+    catalog = MazeCatalog(path)
+    assert catalog.pick("hard") is not None
+    assert catalog.pick("easy") is not None
+    assert catalog.stats()["fallbacks"] == {"hard": 1}
+
+
+def test_rejects_other_catalog_versions(tmp_path):
+    path = tmp_path / "old.cat"
+    path.write_bytes(maze_batch._HEADER.pack(maze_batch.CATALOG_MAGIC, 1, RECORD_DTYPE.itemsize, 0, 0))
+    with pytest.raises(ValueError):
+        open_catalog(str(path))
+    assert maze_batch.load_maze_catalog(str(path)) is None
@@ -0,0 +1,194 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import maze_engine
+from maze_engine import UNKNOWN, MazeSession, rle_encode, rle_encode_array, view_rays
+from maze_generator import USER, WALL
+
+CONFIG = {"width": 41, "height": 41, "npc": 3, "seed": 7, "algorithm": "backtracker"}
+
+
+@pytest.fixture
+def fog(monkeypatch):
+    monkeypatch.setattr(maze_engine, "MAZE_VIEW_RADIUS", 5)
+
+
+def decode_rle(values):
+    flat = []
+    for value, count in zip(values[::2], values[1::2]):
+        flat += [value] * count
+    return flat
+
+
+def walk(session: MazeSession, steps: int):
+    # 왔던 길로 바로 돌아가지 않는 결정적인 산책 (이동마다 (이전 위치, 만난 NPC, 델타))
+    engine = session.engine
+    prev = None
+    for _ in range(steps):
+        options = [(session.pos[0] + dr, session.pos[1] + dc) for dr, dc in maze_engine.DIRECTIONS]
+        options = [p for p in options if engine.is_open(p)]
+        target = next((p for p in options if p != prev), options[0])
+        prev = session.pos
+        met = session.move(target)
+        yield prev, met, session.delta(prev, met)
+
+
+def test_rle_array_matches_rle():
+    import numpy as np
+    values = [1, 1, 0, 0, 0, 1, -1, -1, 4]
+    assert rle_encode_array(np.array(values)) == rle_encode(values)
+
+
+def test_view_rays_parents_come_first():
+    for i, (_, _, parent, _) in enumerate(view_rays(6)):
+        assert parent < i
+
+
+def test_delta_versions_follow_moves():
+    session = MazeSession.start(CONFIG)
+    assert session.snapshot()["version"] == 0
+    for n, (prev, _, delta) in enumerate(walk(session, 5), 1):
+        assert delta["version"] == n
+        assert delta["cells"][:2] == [[prev[0], prev[1], session.engine.base_flat[session.engine.index(prev)]],
+                                      [session.pos[0], session.pos[1], USER]]
+    # 제자리 이동은 버전을 올리지 않는다
+    assert session.move(session.pos) == -1 and session.version == 5
+    assert session.move((0, 0)) is None
+
+
+def test_fog_snapshot_only_contains_seen_cells(fog):
+    session = MazeSession.start(CONFIG)
+    engine = session.engine
+    snap = session.snapshot("rle")
+    flat = decode_rle(snap["grid"])
+    assert snap["fog"] and len(flat) == engine.width * engine.height
+    assert 0 < sum(session.seen) < len(flat) // 4
+    for i, value in enumerate(flat):
+        assert value == (engine.base_flat[i] if session.seen[i] else UNKNOWN)
+    assert session.to_response()["maze"][session.pos[0]][session.pos[1]] == USER
+
+
+def test_fog_deltas_rebuild_the_seen_grid(fog):
+    session = MazeSession.start(CONFIG)
+    engine = session.engine
+    client = decode_rle(session.snapshot("rle")["grid"])
+    for _, _, delta in walk(session, 60):
+        for r, c, value in delta["cells"]:
+            client[r * engine.width + c] = value
+    # 클라이언트가 델타만으로 맞춘 격자 == 서버가 본 칸 (NPC/플레이어 표시는 바탕 값으로 비교)
+    for i, value in enumerate(client):
+        if value == UNKNOWN:
+            assert not session.seen[i]
+        elif value not in (USER, maze_engine.NPC):
+            assert value == engine.base_flat[i]
+    assert sum(v != UNKNOWN for v in client) == sum(session.seen)
+
+
+def test_walls_block_the_view(fog):
+    session = MazeSession.start(CONFIG)
+    engine = session.engine
+    # 보이는 칸은 모두 본 통로와 맞닿아 있다 (벽 너머 칸이 보이지 않음)
+    for i in range(len(session.seen)):
+        if not session.seen[i] or i == engine.index(session.pos):
+            continue
+        r, c = divmod(i, engine.width)
+        around = [(r + dr) * engine.width + c + dc for dr in (-1, 0, 1) for dc in (-1, 0, 1)
+                  if (dr or dc) and 0 <= r + dr < engine.height and 0 <= c + dc < engine.width]
+        assert any(session.seen[j] and not engine.walls[j] for j in around)
+
+
+def test_fog_round_trips_through_dump(fog):
+    session = MazeSession.start(CONFIG)
+    list(walk(session, 20))
+    loaded = MazeSession.load(session.dump())
+    assert loaded.seen == session.seen and loaded.pos == session.pos and loaded.version == session.version
+
+
+def test_query_does_not_leak_hidden_targets(fog):
+    session = MazeSession.start(CONFIG)
+    engine = session.engine
+    answer = session.query()
+    assert not session.seen[engine.index(engine.exit_pos)]
+    assert answer["distanceToExit"] is None
+    hidden = [list(p) for p in engine.maze.npc_pos if not session.seen[engine.index(p)]]
+    assert hidden and answer["nearestNpcPos"] not in hidden
+
+    # 모든 칸을 본 것으로 하면 전체 미로와 같은 답
+    session.seen = bytearray([1]) * len(session.seen)
+    assert session.query()["distanceToExit"] == engine.distance_to_exit(session.pos)
+
+
+def test_query_without_fog_uses_full_maze():
+    session = MazeSession.start(CONFIG)
+    engine = session.engine
+    assert session.seen is None
+    assert session.query()["distanceToExit"] == engine.distance_to_exit(session.pos) > 0
+    assert engine.walls[0] == 1 and engine.base_flat[0] == WALL
+
+
+@pytest.fixture
+def engines(monkeypatch):
+    monkeypatch.setattr(maze_engine, "_engines", maze_engine.OrderedDict())
+    monkeypatch.setattr(maze_engine, "_engine_cells", 0)
+
+
+def test_engine_cache_is_thread_safe(engines, monkeypatch):
+    # 11×11 엔진 네 개 분량만 담을 수 있게 해서 여러 스레드가 계속 넣고 비우게 한다
+    monkeypatch.setattr(maze_engine, "MAZE_ENGINE_CACHE_CELLS", 4 * 121)
+    configs = [dict(CONFIG, width=11, height=11, seed=seed) for seed in range(12)]
+
+    def worker(offset):
+        for i in range(300):
+            config = configs[(i + offset) % len(configs)]
+            assert maze_engine.engine_for(config).maze.width == 11
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(worker, range(8)))
+    assert len(maze_engine._engines) <= 4
+    assert maze_engine._engine_cells == 121 * len(maze_engine._engines)
+
+
+def test_engine_cache_keeps_live_sessions_and_drops_idle_ones(engines, monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(maze_engine.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(maze_engine, "MAZE_ENGINE_IDLE", 100)
+    live = MazeSession.start(CONFIG)
+    engine = live.engine
+    for seed in range(300):
+        # 다른 세션이 수백 개 생겨도 칸 수 상한 안이면 계속 쓰는 세션의 엔진은 다시 만들지 않는다
+        now[0] += 1
+        MazeSession.start(dict(CONFIG, width=11, height=11, seed=seed))
+        assert maze_engine.engine_for(CONFIG) is engine
+    now[0] += 101
+    MazeSession.start(dict(CONFIG, seed=999))
+    assert list(maze_engine._engines) == [(41, 41, 3, 999, "backtracker")]
+
+
+def test_illegal_moves_are_rejected():
+    session = MazeSession.start(CONFIG)
+    engine = session.engine
+    r, c = start = session.pos
+    wall = next(p for p in ((r - 1, c), (r + 1, c), (r, c - 1), (r, c + 1)) if not engine.is_open(p))
+    # 두 칸 점프, 대각선, 벽, 미로 밖은 모두 거절하고 위치/이동 수를 바꾸지 않는다
+    for target in ((r + 2, c), (r + 1, c + 1), wall, (-1, c), (r, CONFIG["width"])):
+        assert session.move(target) is None
+    assert session.pos == start and session.moves == 0 and session.version == 0
+
+
+def test_following_the_distance_field_meets_every_npc_and_exits():
+    session = MazeSession.start(CONFIG)
+    engine = session.engine
+    met = []
+    while not session.finished:
+        # 출구 거리 지도를 따라 내려가면 최단 경로 (NPC는 모두 그 위에 있다)
+        nearest = engine.nearest_npc(session.pos, session.remaining)
+        r, c = session.pos
+        step = min((p for p in ((r - 1, c), (r + 1, c), (r, c - 1), (r, c + 1)) if engine.is_open(p)),
+                   key=engine.distance_to_exit)
+        result = session.move(step)
+        if result >= 0:
+            assert nearest == (result, 1)
+            met.append(result)
+    assert met == [0, 1, 2] and session.remaining == 0
+    assert session.moves == engine.maze.path_length == engine.distance_to_exit(session.engine.maze.user_pos)
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from maze_generator import ALGORITHMS, EXIT, NPC, USER, WALL, bfs_distances, generate_maze
+
+
+@pytest.mark.parametrize("algorithm", sorted(ALGORITHMS))
+def test_every_algorithm_builds_a_perfect_maze(algorithm):
+    for seed in range(5):
+        maze = generate_maze(31, 21, 3, seed=seed, algorithm=algorithm)
+        grid = maze.grid
+        open_mask = grid != WALL
+        # 모든 통로가 이어져 있고 고리가 없다 (간선 수 = 칸 수 - 1)
+        dist = bfs_distances(open_mask, maze.user_pos)
+        assert (dist[open_mask] >= 0).all()
+        edges = (open_mask[1:, :] & open_mask[:-1, :]).sum() + (open_mask[:, 1:] & open_mask[:, :-1]).sum()
+        assert edges == open_mask.sum() - 1
+
+        r, c = maze.exit_pos
+        assert grid[r, c] == EXIT and (r in (0, 20) or c in (0, 30))
+        assert grid[maze.user_pos] == USER
+        assert maze.path_length == dist[maze.exit_pos]
+
+
+def test_npcs_sit_on_the_exit_path_in_order():
+    maze = generate_maze(41, 41, 4, seed=3)
+    dist = bfs_distances(maze.grid != WALL, maze.user_pos)
+    assert [int(dist[p]) for p in maze.npc_pos] == maze.npc_distances
+    assert maze.npc_distances == sorted(maze.npc_distances) and len(maze.npc_pos) == 4
+    assert all(maze.grid[p] == NPC for p in maze.npc_pos)
+    # 출구까지의 최단 경로 위에 있다
+    to_exit = bfs_distances(maze.grid != WALL, maze.exit_pos)
+    assert all(dist[p] + to_exit[p] == maze.path_length for p in maze.npc_pos)
+
+
+def test_same_seed_same_maze_and_odd_sizes():
+    a = generate_maze(20, 12, 3, seed=42)
+    b = generate_maze(20, 12, 3, seed=42)
+    assert np.array_equal(a.grid, b.grid) and a.exit_pos == b.exit_pos
+    # 벽으로 둘러싸이도록 홀수 크기로 맞춘다
+    assert (a.height, a.width) == (13, 21)
+    with pytest.raises(ValueError):
+        generate_maze(algorithm="maze-o-matic")
@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+import metrics
+
+
+def test_flush_loop_survives_any_flush_error(monkeypatch):
+    calls = []
+
+    def flush():
+        calls.append(1)
+        if len(calls) == 1:
+            # sqlite3.Error가 아닌 예외(직렬화 실패 등)도 루프를 멈추지 않는다
+            raise TypeError("직렬화 실패")
+        if len(calls) == 3:
+            raise asyncio.CancelledError
+
+    monkeypatch.setattr(metrics, "METRICS_FLUSH_INTERVAL", 0)
+    monkeypatch.setattr(metrics, "flush", flush)
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(metrics.flush_loop())
+    assert len(calls) == 3
+
+
+def worker(monkeypatch, requests: int, in_flight: int, latencies) -> dict:
+    monkeypatch.setattr(metrics, "_registry", [])
+    monkeypatch.setattr(metrics, "_collectors", [])
+    counter = metrics.Counter("requests_total", "요청 수", ("route",))
+    gauge = metrics.Gauge("in_flight", "진행 중")
+    histogram = metrics.Histogram("latency_seconds", "지연", buckets=(0.1, 1.0))
+    counter.inc(("/world",), requests)
+    gauge.set(in_flight)
+    for value in latencies:
+        histogram.observe(value)
+    return metrics.snapshot()
+
+
+def test_worker_snapshots_merge_into_prometheus_text(monkeypatch):
+    live = worker(monkeypatch, 2, 3, [0.05, 0.5])
+    stale = worker(monkeypatch, 5, 7, [2.0])
+    # 갱신이 끊긴 워커의 게이지는 빼고, 카운터/히스토그램은 더한다
+    text = metrics.render(metrics.merge([(live, True), (stale, False)]))
+    assert 'requests_total{route="/world"} 7' in text
+    assert "in_flight 3" in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1.0"} 2' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+    assert "latency_seconds_sum 2.55" in text and "latency_seconds_count 3" in text
+
+
+def test_timed_labels_the_outcome(monkeypatch):
+    monkeypatch.setattr(metrics, "_registry", [])
+    histogram = metrics.Histogram("step_seconds", "단계", ("step", "outcome"))
+    with metrics.timed(histogram, ("quiz",)):
+        pass
+    with pytest.raises(KeyError):
+        with metrics.timed(histogram, ("quiz",)):
+            raise KeyError("x")
+    assert sorted(histogram.values) == [("quiz", "KeyError"), ("quiz", "ok")]
@@ -0,0 +1,66 @@
+import asyncio
+import random
+
+import pytest
+
+import mock_provider
+from json_extract import parse_model
+from llm_langchain import QuizSetSchema, StorySchema
+from mock_provider import MockChatModel, MockImageProvider, MockProviderError, parse_latency
+from prompts import quiz_set_messages, story_messages
+
+
+@pytest.fixture(autouse=True)
+def no_delay(monkeypatch):
+    monkeypatch.setattr(mock_provider, "MOCK_TIME_SCALE", 0.0)
+    monkeypatch.setattr(mock_provider, "_attempts", {})
+
+
+def test_responses_follow_the_prompt_and_parse():
+    model = MockChatModel()
+    story = parse_model(model.invoke(story_messages("하늘", "숲", "밝음", 4)).content, StorySchema, "story")
+    assert len(story.npcs) == 4 and "하늘" in story.objective
+    entries = [("첫 번째", {"name": "a"}, "x"), ("두 번째", {"name": "b"}, "y")]
+    quizzes = parse_model(model.invoke(quiz_set_messages("세계", entries)).content, QuizSetSchema, "quizset")
+    assert len(quizzes.quizzes) == 2
+
+
+def test_same_seed_replays_and_retries_differ(monkeypatch):
+    prompt = story_messages("하늘", "숲", "밝음", 3)
+    first = [MockChatModel().invoke(prompt).content for _ in range(3)]
+    monkeypatch.setattr(mock_provider, "_attempts", {})
+    again = [MockChatModel().invoke(prompt).content for _ in range(3)]
+    # 같은 시드면 같은 순서로 같은 응답, 같은 프롬프트의 재시도는 다른 응답
+    assert first == again and len(set(first)) == 3
+
+
+def test_stream_chunks_join_to_the_full_reply(monkeypatch):
+    prompt = story_messages("하늘", "숲", "밝음", 3)
+    whole = MockChatModel().invoke(prompt).content
+    monkeypatch.setattr(mock_provider, "_attempts", {})
+
+    async def main():
+        return [chunk.content async for chunk in MockChatModel().astream(prompt)]
+
+    chunks = asyncio.run(main())
+    assert len(chunks) > 1 and "".join(chunks) == whole
+
+
+def test_error_rates_and_usage(monkeypatch):
+    monkeypatch.setattr(mock_provider, "MOCK_ERROR_RATE", 1.0)
+    monkeypatch.setattr(mock_provider, "MOCK_IMAGE_ERROR_RATE", 1.0)
+    with pytest.raises(MockProviderError):
+        MockChatModel().invoke(story_messages("하늘", "숲", "밝음", 3))
+    with pytest.raises(MockProviderError):
+        asyncio.run(MockImageProvider().generate("숲"))
+
+    monkeypatch.setattr(mock_provider, "MOCK_ERROR_RATE", 0.0)
+    result = MockChatModel().generate([story_messages("하늘", "바다", "밝음", 3)])
+    assert result.llm_output["token_usage"]["completion_tokens"] > 0
+
+
+def test_latency_specs():
+    assert parse_latency("2.5")(None) == 2.5
+    assert 1 <= parse_latency("uniform:1,2")(random.Random(0)) <= 2
+    with pytest.raises(ValueError):
+        parse_latency("gamma:1")
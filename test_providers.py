@@ -0,0 +1,43 @@
+import asyncio
+import os
+import subprocess
+import sys
+
+import providers
+from providers import Lazy
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_lazy_creates_once_per_process(monkeypatch):
+    made = []
+    lazy = Lazy(lambda: made.append(1) or f"client{len(made)}")
+    assert made == []
+    assert lazy.get() == "client1" and lazy.upper() == "CLIENT1"
+    # gunicorn --preload로 fork된 워커는 마스터의 객체를 쓰지 않고 새로 만든다
+    monkeypatch.setattr(providers.os, "getpid", lambda: -1)
+    assert lazy.get() == "client2" and made == [1, 1]
+
+
+def test_importing_the_app_does_not_load_provider_sdks(tmp_path):
+    # 새 프로세스에서 확인 (이 테스트 프로세스는 다른 테스트가 이미 불러온 모듈이 있다)
+    env = {**os.environ, "PYTHONPATH": ROOT, "LLM_PROVIDER": "openai"}
+    code = "import sys, main; print(sorted(m for m in ('openai', 'openai_clients', 'langchain.chat_models') " \
+           "if m in sys.modules))"
+    out = subprocess.run([sys.executable, "-c", code], cwd=tmp_path, env=env, capture_output=True, text=True,
+                         check=True).stdout
+    assert out.strip().splitlines()[-1] == "[]"
+
+
+def test_mock_warm_up_skips_the_openai_pool(monkeypatch):
+    monkeypatch.setattr(providers, "LLM_PROVIDER", "mock")
+    monkeypatch.setattr(providers, "IMAGE_PROVIDER", "mock")
+    monkeypatch.setattr(providers, "chat_model", Lazy(providers.create_chat_model))
+    monkeypatch.setattr(providers, "image_provider", Lazy(providers.create_image_provider))
+    monkeypatch.delitem(sys.modules, "openai_clients", raising=False)
+
+    asyncio.run(providers.warm_up_providers())
+    assert type(providers.chat_model.get()).__name__ == "MockChatModel"
+    assert type(providers.image_provider.get()).__name__ == "MockImageProvider"
+    # mock 제공자는 OpenAI 클라이언트/커넥션 풀을 만들지 않는다
+    assert "openai_clients" not in sys.modules
@@ -0,0 +1,107 @@
+import asyncio
+from types import SimpleNamespace
+
+import quiz_prefetch
+from llm_hedge import LLM_BUDGETS, hedged_invoke, remaining, set_deadline
+from quiz_prefetch import start_quiz_prefetch, store_quizzes, take_quiz
+from session_store import MemorySessionStore
+
+
+class SlowLLM:
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    async def ainvoke(self, prompt, kind: str):
+        await asyncio.sleep(self.delay)
+        return SimpleNamespace(content="ok")
+
+
+def test_prefetch_outlives_request_deadline(monkeypatch):
+    monkeypatch.setitem(LLM_BUDGETS, "quiz", 0.05)
+    seen = {}
+
+    async def prefetch():
+        seen["remaining"] = remaining()
+        return await hedged_invoke(SlowLLM(0.2), "prompt", "quiz")
+
+    async def request():
+        # 요청 처리: 마감을 걸고 사전 생성을 띄운 뒤 바로 응답
+        set_deadline("quiz")
+        quiz_prefetch._track("session", [0], prefetch())
+        task = quiz_prefetch._tasks["session:0"]
+        assert remaining() is not None
+        return task
+
+    async def main():
+        task = await asyncio.create_task(request())
+        return await task
+
+    assert asyncio.run(main()) == "ok"
+    assert seen["remaining"] is None
+    assert "session:0" not in quiz_prefetch._tasks
+
+
+def test_next_quiz_is_generated_once_and_fills_batch_gaps(monkeypatch):
+    calls = []
+
+    async def next_quiz(story_data, index, name="", npc_count=3):
+        calls.append(index)
+        await asyncio.sleep(0.05)
+        return {"quiz": f"Q{index}"}
+
+    monkeypatch.setattr(quiz_prefetch, "generate_npc_quiz", next_quiz)
+    monkeypatch.setattr(quiz_prefetch, "QUIZ_MODE", "batch")
+    store = MemorySessionStore()
+    # 일괄 생성에서 1번 퀴즈만 빠진 상태
+    store_quizzes(store, "s", [{"quiz": "Q0"}, None, {"quiz": "Q2"}])
+
+    async def main():
+        for index in (1, 1, 2):
+            # 같은 NPC 차례가 다시 들어와도 (재시도) 한 번만 생성하고, 이미 있는 퀴즈는 건드리지 않는다
+            start_quiz_prefetch(store, "s", {"npcs": []}, index, "n", 3)
+        return await take_quiz(store, "s", 1), await take_quiz(store, "s", 2)
+
+    assert asyncio.run(main()) == ({"quiz": "Q1"}, {"quiz": "Q2"})
+    assert calls == [1]
+
+
+def test_batch_mode_generates_every_quiz_in_one_call(monkeypatch):
+    calls = []
+
+    async def quiz_set(story_data, name="", count=None):
+        calls.append(count)
+        await asyncio.sleep(0.05)
+        return [{"quiz": f"Q{i}"} for i in range(count)]
+
+    async def single(*args, **kwargs):
+        raise AssertionError("일괄 모드에서 개별 생성을 하면 안 된다")
+
+    monkeypatch.setattr(quiz_prefetch, "generate_quiz_set", quiz_set)
+    monkeypatch.setattr(quiz_prefetch, "generate_npc_quiz", single)
+    monkeypatch.setattr(quiz_prefetch, "QUIZ_MODE", "batch")
+    store = MemorySessionStore()
+
+    async def main():
+        start_quiz_prefetch(store, "s", {"npcs": []}, 0, "n", 3)
+        # 생성 중인 퀴즈를 받으면 완료까지 기다린다
+        return [await take_quiz(store, "s", i) for i in range(3)]
+
+    assert asyncio.run(main()) == [{"quiz": "Q0"}, {"quiz": "Q1"}, {"quiz": "Q2"}]
+    assert calls == [3]
+
+
+def test_failed_batch_leaves_no_pending_quizzes(monkeypatch):
+    async def broken(story_data, name="", count=None):
+        raise ValueError("깨진 응답")
+
+    monkeypatch.setattr(quiz_prefetch, "generate_quiz_set", broken)
+    monkeypatch.setattr(quiz_prefetch, "QUIZ_MODE", "batch")
+    store = MemorySessionStore()
+
+    async def main():
+        start_quiz_prefetch(store, "s", {"npcs": []}, 0, "n", 2)
+        return [await take_quiz(store, "s", i) for i in range(2)]
+
+    # NPC를 만날 때 그 자리에서 다시 생성하도록 None (다른 워커가 기다리지 않게 pending도 지운다)
+    assert asyncio.run(main()) == [None, None]
+    assert store.load_raw("quiz:s:0") is None and store.load_raw("quiz:s:1") is None
@@ -0,0 +1,52 @@
+from response_cache import MemoryCacheBackend, ResponseCache, SqliteCacheBackend, cache_key, personalize
+
+
+def test_key_ignores_case_spacing_and_width():
+    # 대소문자/공백/전각 문자만 다른 프롬프트는 같은 키
+    assert cache_key("world", "Forest  Maze", "밝음") == cache_key("world", " forest maze ", "밝음")
+    assert cache_key("world", "ＦＯＲＥＳＴ") == cache_key("world", "forest")
+    assert cache_key("world", "숲") != cache_key("quiz", "숲")
+    assert cache_key("world", "a", "b") != cache_key("world", "a b")
+
+
+def test_round_trip_and_stats(tmp_path):
+    for backend in (MemoryCacheBackend(), SqliteCacheBackend(str(tmp_path / "c.db"))):
+        cache = ResponseCache(backend)
+        key = cache_key("world", "숲")
+        assert cache.get(key) is None
+        cache.put(key, {"story": "이야기"})
+        assert cache.get(key) == {"story": "이야기"}
+        assert cache.stats()["world"] == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+def test_expired_and_least_recent_entries_are_dropped():
+    backend = MemoryCacheBackend(max_entries=2)
+    cache = ResponseCache(backend)
+    cache.put("a:1", 1)
+    cache.put("a:2", 2)
+    cache.get("a:1")
+    cache.put("a:3", 3)
+    # 가장 오래 안 쓴 a:2가 밀려난다
+    assert [cache.get(k) for k in ("a:1", "a:2", "a:3")] == [1, None, 3]
+    cache.put("a:4", 4, ttl=-1)
+    assert cache.get("a:4") is None
+
+
+def test_variants_fill_up_before_hits():
+    cache = ResponseCache(MemoryCacheBackend(), variants=2)
+    cache.put("world:k", "첫째")
+    # 변형이 다 모이기 전에는 새로 생성하도록 miss
+    assert cache.get("world:k") is None
+    cache.put("world:k", "둘째")
+    assert {cache.get("world:k") for _ in range(50)} == {"첫째", "둘째"}
+
+
+def test_disabled_cache_stores_nothing():
+    cache = ResponseCache(None)
+    cache.put("world:k", "값")
+    assert cache.get("world:k") is None and cache.stats() == {}
+
+
+def test_player_name_is_filled_in_on_read():
+    story = {"intro": "{{player_name}}님, 환영합니다", "npcs": [{"line": "{{player_name}}!"}], "n": 3}
+    assert personalize(story, " 하늘 ") == {"intro": "하늘님, 환영합니다", "npcs": [{"line": "하늘!"}], "n": 3}
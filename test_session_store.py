@@ -0,0 +1,162 @@
+import asyncio
+import json
+import struct
+import time
+import zlib
+
+import pytest
+
+import session_store
+from llm_langchain import MazeState, new_history
+from session_store import (
+    MemorySessionStore, SessionBusy, SqliteSessionStore, dump_state, load_state, new_session_id
+)
+
+STORY = {"world": "숲", "npcs": [{"name": "여우"}, {"name": "곰"}, {"name": "새"}]}
+
+
+def make_state(**kwargs) -> MazeState:
+    state = MazeState(name="하늘", setting="숲", atmosphere="밝음", story_data=STORY, **kwargs)
+    state.history = new_history(["첫 줄", "둘째 줄"])
+    state.token_usage = {"world": [1, 200, 100, 0], "quiz": [2, 300, 50, 10]}
+    return state
+
+
+class Clock:
+    def __init__(self, monkeypatch, now: float = 1_000_000.0):
+        self.now = now
+        monkeypatch.setattr(time, "time", lambda: self.now)
+
+
+def test_state_round_trip():
+    state = make_state(step="encounter_question", quiz="문제", option1="a", option2="b", option3="c",
+                       message="문제", num=2, npc_index=1, npc_count=3, quiz_answer=3, story_key="k")
+    loaded = load_state(dump_state(state))
+    for name in ("name", "setting", "atmosphere", "step", "quiz", "option1", "option2", "option3",
+                 "message", "num", "npc_index", "npc_count", "quiz_answer", "story_key", "token_usage"):
+        assert getattr(loaded, name) == getattr(state, name), name
+    assert list(loaded.history) == list(state.history)
+    assert loaded.story_data is None
+
+
+def test_large_state_is_compressed_and_round_trips():
+    state = make_state(message="긴 이야기 " * 200)
+    data = dump_state(state)
+    assert data[2] & session_store.FLAG_ZLIB
+    assert load_state(data).message == state.message
+
+
+def test_wide_header_fields_round_trip():
+    state = make_state(num=300, npc_index=299, npc_count=300, quiz_answer=0)
+    loaded = load_state(dump_state(state))
+    assert (loaded.num, loaded.npc_index, loaded.npc_count) == (300, 299, 300)
+
+
+def test_out_of_range_field_is_reported():
+    with pytest.raises(ValueError, match="npc_count"):
+        dump_state(make_state(npc_count=70000))
+
+
+def test_reads_version_1_records():
+    texts = ["하늘", "숲", "밝음", "start", "", "", "", "", "안녕", "", "", "", "k", "한 줄"]
+    body = struct.pack("<BB", 1, 0) + "\0".join(texts).encode("utf-8")
+    data = struct.pack("<BBBBBBB", session_store.STATE_MAGIC, 1, 0, 2, 1, 3, 0) + body
+    state = load_state(data)
+    assert (state.name, state.message, state.num, state.npc_index, state.story_key) == ("하늘", "안녕", 2, 1, "k")
+    assert list(state.history) == ["한 줄"]
+
+
+def test_reads_legacy_json_records():
+    raw = {"name": "하늘", "setting": "숲", "atmosphere": "밝음", "num": "2", "story_data": STORY,
+           "history": ["a"], "inventory": []}
+    state = load_state(zlib.compress(json.dumps(raw).encode("utf-8")))
+    assert state.num == 2 and state.story_data == STORY and state.story_key
+
+
+def test_story_outlives_session_across_workers(tmp_path, monkeypatch):
+    clock = Clock(monkeypatch)
+    path = str(tmp_path / "sessions.db")
+    ttl = 100.0
+    monkeypatch.setattr(session_store, "SESSION_TTL", ttl)
+    first, second = SqliteSessionStore(path, ttl=ttl), SqliteSessionStore(path, ttl=ttl)
+    first.save("s", make_state())
+    clock.now += 80
+    first.save("s", make_state())
+
+    # 다른 워커가 세계관 기록을 쓴 지 한참 뒤에 처음 읽고, 이후로는 그 워커만 저장한다
+    clock.now += 90
+    state = second.load("s")
+    assert state is not None
+    for _ in range(6):
+        second.save("s", state)
+        # 세션이 만료되기 직전까지 캐시가 없는 새 워커도 세계관까지 읽을 수 있어야 한다
+        clock.now += ttl - 1
+        assert SqliteSessionStore(path, ttl=ttl).load("s") is not None
+
+
+def test_memory_store_keeps_story_while_session_is_used(monkeypatch):
+    Clock(monkeypatch)
+    store = MemorySessionStore(ttl=100, max_entries=4)
+    store.save("s", make_state())
+    for i in range(10):
+        store.save_raw(f"other{i}", b"x")
+        # 다른 세션이 쌓여도 계속 쓰는 세션과 그 세계관은 밀려나지 않는다
+        store.stories = session_store.StoryCache()
+        assert store.load("s") is not None
+
+
+def test_workers_share_sessions_without_cross_talk(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    first, second = SqliteSessionStore(path), SqliteSessionStore(path)
+    a, b = new_session_id(), new_session_id()
+    first.save(a, make_state(npc_index=1))
+    second.save(b, make_state(npc_index=2, quiz="다른 문제"))
+    # 어느 워커에서 읽어도 같은 세션은 같은 상태, 다른 세션과는 섞이지 않는다
+    assert second.load(a).npc_index == 1 and second.load(a).quiz == ""
+    assert first.load(b).npc_index == 2 and first.load(b).quiz == "다른 문제"
+    assert first.load(new_session_id()) is None
+
+
+def test_memory_store_evicts_expired_and_least_recent(monkeypatch):
+    clock = Clock(monkeypatch)
+    store = MemorySessionStore(ttl=10, max_entries=2)
+    store.save_raw("a", b"1")
+    store.save_raw("b", b"2")
+    assert store.load_raw("a") == b"1"
+    # 가장 오래 안 쓴 b가 밀려난다
+    store.save_raw("c", b"3")
+    assert store.load_raw("b") is None and store.load_raw("a") == b"1"
+    clock.now += 11
+    assert store.load_raw("a") is None and store.load_raw("c") is None
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_session_lock_is_exclusive(backend, tmp_path):
+    store = MemorySessionStore() if backend == "memory" else SqliteSessionStore(str(tmp_path / "s.db"))
+    with store.lock("session:s"):
+        with pytest.raises(SessionBusy):
+            with store.lock("session:s", timeout=0.05):
+                pass
+        # 다른 세션의 락은 따로 잡힌다
+        with store.lock("session:t", timeout=0.05):
+            pass
+
+    async def main():
+        async with store.alock("session:s", timeout=0.05):
+            with pytest.raises(SessionBusy):
+                async with store.alock("session:s", timeout=0.05):
+                    pass
+
+    asyncio.run(main())
+    assert store.try_acquire("session:s", "x")
+
+
+def test_sqlite_lock_lease_expires(tmp_path, monkeypatch):
+    clock = Clock(monkeypatch)
+    store = SqliteSessionStore(str(tmp_path / "s.db"), lease=5)
+    assert store.try_acquire("session:s", "dead-worker")
+    assert not store.try_acquire("session:s", "other")
+    # 락을 쥔 워커가 죽어도 임대가 끝나면 다른 워커가 이어받는다
+    clock.now += 6
+    assert store.try_acquire("session:s", "other")
+    assert not store.renew("session:s", "dead-worker")
@@ -0,0 +1,54 @@
+import asyncio
+
+import token_budget
+from prompts import ending_messages, followup_messages, prompt_kind, question_messages, story_messages
+from token_budget import merge, record_usage, report, use_ledger
+
+
+def test_system_prefix_is_shared_and_free_of_player_values():
+    npc = {"name": "상인", "role": "상인", "personality": "친절"}
+    first = question_messages(npc, "이야기 하나", "첫 번째")
+    second = question_messages({**npc, "name": "기사"}, "이야기 둘", "두 번째")
+    # 프롬프트 캐시가 맞도록 시스템 메시지는 같은 객체, 이번 호출의 값은 사용자 메시지에만
+    assert first[0] is second[0]
+    story = story_messages("하늘", "숲", "밝음", 3)
+    assert "하늘" not in story[0].content and "하늘" in story[1].content
+    assert [prompt_kind(m) for m in (story, first, followup_messages(npc, "첫 번째", "Q", "abc", "1"),
+                                     ending_messages("끝"))] == ["story", "question", "followup", "ending"]
+
+
+def test_each_game_counts_only_its_own_calls(monkeypatch):
+    monkeypatch.setattr(token_budget, "_totals", token_budget.defaultdict(lambda: [0, 0, 0, 0]))
+
+    async def game(tokens):
+        ledger = {}
+        use_ledger(ledger)
+        await asyncio.sleep(0)
+        record_usage("quiz", {"prompt_tokens": tokens, "completion_tokens": 10,
+                              "prompt_tokens_details": {"cached_tokens": tokens // 2}}, [], "")
+        return ledger
+
+    async def main():
+        return await asyncio.gather(game(100), game(200))
+
+    first, second = asyncio.run(main())
+    assert first == {"quiz": [1, 100, 10, 50]} and second == {"quiz": [1, 200, 10, 100]}
+    assert token_budget.totals()["quiz"]["calls"] == 2
+
+
+def test_missing_usage_is_estimated_and_reported_against_budget(monkeypatch):
+    monkeypatch.setattr(token_budget, "GAME_TOKEN_BUDGET", 100)
+
+    async def game():
+        ledger = {}
+        use_ledger(ledger)
+        # 스트리밍처럼 사용량이 없으면 글자 수로 추정 (2글자당 1토큰)
+        assert record_usage("ending", None, "가" * 100, "나" * 120) == 110
+        return ledger
+
+    ledger = asyncio.run(game())
+    # 백그라운드에서 미리 만든 퀴즈의 토큰도 합산
+    merge(ledger, {"quiz": [1, 30, 20, 0]})
+    summary = report(ledger)
+    assert summary["total_tokens"] == 160 and summary["over_budget"] and summary["remaining"] == -60
+    assert summary["by_kind"]["quiz"]["calls"] == 1
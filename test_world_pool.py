@@ -0,0 +1,114 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+import world_pool
+from session_store import SessionBusy, SqliteSessionStore
+from world_pool import WorldPool
+
+KEY = "world_pool_refill"
+
+
+def test_slow_build_keeps_lease(monkeypatch, tmp_path):
+    monkeypatch.setattr(world_pool, "SESSION_LOCK_LEASE", 0.3)
+    store = SqliteSessionStore(str(tmp_path / "s.db"), lease=0.3)
+    assert store.try_acquire(KEY, "a")
+
+    async def slow_build():
+        await asyncio.sleep(1.0)
+        return True
+
+    async def main():
+        build = asyncio.ensure_future(world_pool.run_with_lease(store, KEY, "a", slow_build()))
+        await asyncio.sleep(0.7)
+        # 처음 임대 시간은 지났지만 연장됐으므로 다른 워커는 락을 잡지 못한다
+        taken = store.try_acquire(KEY, "b")
+        return taken, await build
+
+    taken, built = asyncio.run(main())
+    assert not taken and built
+    store.release(KEY, "a")
+    assert store.try_acquire(KEY, "b")
+
+
+def test_lost_lease_abandons_build(monkeypatch, tmp_path):
+    monkeypatch.setattr(world_pool, "SESSION_LOCK_LEASE", 0.3)
+    store = SqliteSessionStore(str(tmp_path / "s.db"), lease=0.3)
+    assert store.try_acquire(KEY, "a")
+    finished = []
+
+    async def slow_build():
+        await asyncio.sleep(1.0)
+        finished.append(True)
+
+    async def main():
+        build = asyncio.ensure_future(world_pool.run_with_lease(store, KEY, "a", slow_build()))
+        await asyncio.sleep(0.05)
+        # 다른 워커가 락을 이어받은 상황
+        store.release(KEY, "a")
+        assert store.try_acquire(KEY, "b")
+        with pytest.raises(SessionBusy):
+            await build
+        await asyncio.sleep(1.0)
+
+    asyncio.run(main())
+    assert not finished
+
+
+def world(image="https://cdn.example.com/a.png"):
+    return {"story_data": {"intro": "{{player_name}}의 모험"}, "quizzes": [{"quiz": "{{player_name}}?"}],
+            "image": image}
+
+
+def test_take_is_fifo_per_setting_and_names_only_quizzes(tmp_path):
+    pool = WorldPool(str(tmp_path / "pool.db"))
+    pool.put("숲", "밝음", world("https://cdn.example.com/1.png"))
+    pool.put("숲", "밝음", world("https://cdn.example.com/2.png"))
+    pool.put("바다", "밝음", world())
+
+    taken = pool.take("숲", "밝음", "하늘")
+    assert taken["image"] == "https://cdn.example.com/1.png"
+    # 스토리는 익명 그대로 (세션에 공유 저장), 퀴즈에만 이름을 채운다
+    assert taken["story_data"] == {"intro": "{{player_name}}의 모험"}
+    assert taken["quizzes"] == [{"quiz": "하늘?"}]
+    assert pool.depth("숲", "밝음") == 1 and pool.depth("바다", "밝음") == 1
+    assert pool.take("산", "어둠", "하늘") is None
+    assert (pool.taken, pool.empty) == (1, 1)
+
+
+def test_expired_provider_image_is_dropped(monkeypatch, tmp_path):
+    monkeypatch.setattr(world_pool, "IMAGE_CACHE_TTL", -1)
+    pool = WorldPool(str(tmp_path / "pool.db"))
+    pool.put("숲", "밝음", world())
+    pool.put("숲", "밝음", world("/images/" + "ab" * 32 + "/full"))
+    # 만료됐을 제공자 URL은 버리고, 로컬에 저장한 이미지는 그대로 쓴다
+    assert pool.take("숲", "밝음", "n")["image"] == ""
+    assert pool.take("숲", "밝음", "n")["image"].startswith("/images/")
+
+
+def test_refill_fills_the_emptiest_setting_up_to_depth(monkeypatch, tmp_path):
+    monkeypatch.setattr(world_pool, "WORLD_POOL_DEPTH", 2)
+    built = []
+
+    async def build_world(location, mood):
+        built.append(location)
+        return world()
+
+    monkeypatch.setattr(world_pool, "build_world", build_world)
+    pool = WorldPool(str(tmp_path / "pool.db"))
+    pool.put("숲", "밝음", world())
+    settings = [("숲", "밝음"), ("바다", "밝음")]
+
+    async def main():
+        return [await world_pool.refill_step(pool, settings) for _ in range(4)]
+
+    assert asyncio.run(main()) == [True, True, True, False]
+    assert built == ["바다", "바다", "숲"]
+
+
+def test_refill_window_wraps_past_midnight(monkeypatch):
+    monkeypatch.setattr(world_pool, "WORLD_POOL_HOURS", "22-6")
+    assert world_pool.in_refill_window(datetime(2024, 1, 1, 23))
+    assert world_pool.in_refill_window(datetime(2024, 1, 1, 5))
+    assert not world_pool.in_refill_window(datetime(2024, 1, 1, 12))
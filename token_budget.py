@@ -0,0 +1,104 @@
+import os
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# -------------------------
+# 1) 설정
+# -------------------------
+# 게임 한 판(세계관 ~ 결말)에 쓰는 토큰 예산. 넘으면 보고서에 표시만 한다
+GAME_TOKEN_BUDGET = int(os.getenv("GAME_TOKEN_BUDGET", "20000"))
+
+# 호출 종류별 [호출 수, 입력 토큰, 출력 토큰, 캐시된 입력 토큰]
+Ledger = Dict[str, List[int]]
+
+_ledger: ContextVar[Optional[Ledger]] = ContextVar("token_ledger", default=None)
+_totals: Ledger = defaultdict(lambda: [0, 0, 0, 0])
+
+
+def use_ledger(ledger: Ledger) -> None:
+    # 이후 이 컨텍스트(요청/작업)에서 일어나는 LLM 호출을 ledger에 기록
+    _ledger.set(ledger)
+
+
+def _add(ledger: Ledger, kind: str, values) -> None:
+    row = ledger.get(kind)
+    if row is None:
+        row = ledger[kind] = [0, 0, 0, 0]
+    for i, value in enumerate(values):
+        row[i] += value
+
+
+def record(kind: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> None:
+    values = (1, prompt_tokens, completion_tokens, cached_tokens)
+    _add(_totals, kind, values)
+    ledger = _ledger.get()
+    if ledger is not None:
+        _add(ledger, kind, values)
+
+
+def merge(ledger: Ledger, other: Optional[Ledger]) -> None:
+    for kind, values in (other or {}).items():
+        _add(ledger, kind, values)
+
+
+def estimate(text: str) -> int:
+    # 한국어 위주 텍스트는 대략 2글자당 1토큰
+    return len(text) // 2
+
+
+def message_text(prompt) -> str:
+    if isinstance(prompt, (list, tuple)):
+        return "".join(str(getattr(m, "content", m)) for m in prompt)
+    return str(prompt)
+
+
+def report(ledger: Ledger) -> dict:
+    prompt = sum(row[1] for row in ledger.values())
+    completion = sum(row[2] for row in ledger.values())
+    total = prompt + completion
+    return {
+        "total_tokens": total,
+        "prompt_tokens": prompt,
+        "completion_tokens": completion,
+        "cached_prompt_tokens": sum(row[3] for row in ledger.values()),
+        "budget": GAME_TOKEN_BUDGET,
+        "remaining": GAME_TOKEN_BUDGET - total,
+        "over_budget": total > GAME_TOKEN_BUDGET,
+        "by_kind": {
+            kind: {"calls": row[0], "prompt_tokens": row[1], "completion_tokens": row[2], "cached_prompt_tokens": row[3]}
+            for kind, row in ledger.items()
+        },
+    }
+
+
+def totals() -> dict:
+    return report(_totals)["by_kind"]
+
+
+# -------------------------
+# 2) 실제 사용량 수집
+# -------------------------
+class UsageCallback(BaseCallbackHandler):
+    # ainvoke는 AIMessage만 돌려주므로 llm_output의 token_usage는 콜백으로 받는다
+    def __init__(self):
+        self.usage = None
+
+    def on_llm_end(self, response, **kwargs) -> None:
+        self.usage = (response.llm_output or {}).get("token_usage") or None
+
+
+def record_usage(kind: str, usage: Optional[dict], prompt, completion: str) -> int:
+    # 사용량 정보가 없으면(스트리밍 등) 글자 수로 추정. 기록한 총 토큰 수를 돌려준다
+    if usage:
+        prompt_tokens = int(usage.get("prompt_tokens") or 0)
+        completion_tokens = int(usage.get("completion_tokens") or 0)
+        cached = int((usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0)
+    else:
+        prompt_tokens = estimate(message_text(prompt))
+        completion_tokens = estimate(completion)
+        cached = 0
+    record(kind, prompt_tokens, completion_tokens, cached)
+    return prompt_tokens + completion_tokens
@@ -0,0 +1,210 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from image_generate import IMAGE_CACHE_TTL, build_image_prompt, generate_image
+from image_store import is_local_image
+from llm_governor import PRIORITY_PREFETCH, set_llm_priority
+from llm_langchain import MazeState, generate_quiz_set, generate_story
+from maze_generator import MAZE_NPC_COUNT
+from response_cache import PLAYER_PLACEHOLDER, cache_key, personalize
+from session_store import SESSION_LOCK_LEASE, SessionBusy, SessionStore
+
+# -------------------------
+# 1) 설정
+# -------------------------
+WORLD_POOL_DB_PATH = os.getenv("WORLD_POOL_DB_PATH", "world_pool.db")
+# 미리 만들어 둘 설정 목록: JSON 파일 경로 또는 [["장소", "분위기"], ...] JSON 문자열
+WORLD_POOL_SETTINGS = os.getenv("WORLD_POOL_SETTINGS", "")
+WORLD_POOL_DEPTH = int(os.getenv("WORLD_POOL_DEPTH", "5"))
+# 채우기를 허용하는 시간대 (예: "2-7" → 02시~06시59분), 비우면 항상
+WORLD_POOL_HOURS = os.getenv("WORLD_POOL_HOURS", "")
+WORLD_POOL_INTERVAL = float(os.getenv("WORLD_POOL_INTERVAL", "30"))
+
+
+def load_pool_settings() -> List[Tuple[str, str]]:
+    raw = WORLD_POOL_SETTINGS.strip()
+    if not raw:
+        return []
+    if os.path.exists(raw):
+        with open(raw, encoding="utf-8") as f:
+            raw = f.read()
+    return [(str(loc), str(mood)) for loc, mood in json.loads(raw)]
+
+
+def in_refill_window(now: Optional[datetime] = None) -> bool:
+    if not WORLD_POOL_HOURS:
+        return True
+    start, end = (int(h) for h in WORLD_POOL_HOURS.split("-"))
+    hour = (now or datetime.now()).hour
+    if start <= end:
+        return start <= hour < end
+    return hour >= start or hour < end   # 자정을 넘기는 구간
+
+
+def setting_key(location: str, mood: str) -> str:
+    return cache_key("pool", location, mood)
+
+
+# -------------------------
+# 2) 풀 저장소 (워커 간 공유)
+# -------------------------
+class WorldPool:
+    def __init__(self, path: str = WORLD_POOL_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        # gunicorn --preload: 마스터가 import 때 연 커넥션을 fork된 워커가 같이 쓰지 않게 한다
+        os.register_at_fork(after_in_child=self._reset_connections)
+        self.taken = 0
+        self.empty = 0
+        self._refills = deque(maxlen=1000)   # 채운 시각 (refill rate 계산용)
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS world_pool ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, setting_key TEXT NOT NULL,"
+            " location TEXT NOT NULL, mood TEXT NOT NULL, data BLOB NOT NULL, created REAL NOT NULL)"
+        )
+        self._conn().execute(
+            "CREATE INDEX IF NOT EXISTS world_pool_key ON world_pool (setting_key, id)"
+        )
+
+    def _reset_connections(self) -> None:
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def depth(self, location: str, mood: str) -> int:
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM world_pool WHERE setting_key = ?", (setting_key(location, mood),)
+        ).fetchone()[0]
+
+    def put(self, location: str, mood: str, world: dict) -> None:
+        self._conn().execute(
+            "INSERT INTO world_pool (setting_key, location, mood, data, created) VALUES (?, ?, ?, ?, ?)",
+            (setting_key(location, mood), location, mood,
+             json.dumps(world, ensure_ascii=False).encode("utf-8"), time.time()),
+        )
+        self._refills.append(time.time())
+
+    def take(self, location: str, mood: str, name: str) -> Optional[dict]:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id, data, created FROM world_pool WHERE setting_key = ? ORDER BY id LIMIT 1",
+                (setting_key(location, mood),),
+            ).fetchone()
+            if row is not None:
+                conn.execute("DELETE FROM world_pool WHERE id = ?", (row[0],))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        if row is None:
+            self.empty += 1
+            return None
+        self.taken += 1
+        # 스토리는 익명 그대로 두고 (화면에 낼 때 채움) 퀴즈에만 이름을 채운다
+        world = json.loads(row[1])
+        world["quizzes"] = personalize(world["quizzes"], name)
+        # 만료됐을 수 있는 제공자 이미지 URL은 버리고 새로 생성하게 한다 (로컬 저장 이미지는 그대로)
+        if time.time() - row[2] > IMAGE_CACHE_TTL and not is_local_image(world["image"]):
+            world["image"] = ""
+        return world
+
+    def stats(self) -> dict:
+        rows = self._conn().execute(
+            "SELECT location, mood, COUNT(*) FROM world_pool GROUP BY setting_key"
+        ).fetchall()
+        now = time.time()
+        recent = [t for t in self._refills if now - t <= 3600]
+        return {
+            "depth": {f"{loc} / {mood}": count for loc, mood, count in rows},
+            "target_depth": WORLD_POOL_DEPTH,
+            "taken": self.taken,
+            "empty": self.empty,
+            "refills_last_hour": len(recent),
+            "refill_rate_per_min": len([t for t in recent if now - t <= 600]) / 10,
+        }
+
+
+# -------------------------
+# 3) 세계관 생성 / 채우기
+# -------------------------
+async def build_world(location: str, mood: str) -> dict:
+    state = MazeState(
+        name=PLAYER_PLACEHOLDER, setting=location, atmosphere=mood, npc_count=MAZE_NPC_COUNT
+    )
+    state, image_url = await asyncio.gather(
+        generate_story(state, PLAYER_PLACEHOLDER, location, mood),
+        generate_image(build_image_prompt(location, mood), size="1024x1024"),
+    )
+    try:
+        quizzes = await generate_quiz_set(state.story_data, PLAYER_PLACEHOLDER, MAZE_NPC_COUNT)
+    except Exception as e:
+        print("풀 퀴즈 생성 중 오류 발생:", e)
+        quizzes = []
+    # 자리표시자 이름으로 생성했으므로 결과가 그대로 익명 세계관
+    world = {"story_data": state.story_data, "quizzes": quizzes}
+    world["image"] = image_url
+    return world
+
+
+async def refill_step(pool: WorldPool, settings: List[Tuple[str, str]]) -> bool:
+    # 가장 많이 비어 있는 설정 하나만 채운다 (임대 시간 안에 끝나도록)
+    depths = [(pool.depth(loc, mood), loc, mood) for loc, mood in settings]
+    depth, location, mood = min(depths)
+    if depth >= WORLD_POOL_DEPTH:
+        return False
+    world = await build_world(location, mood)
+    pool.put(location, mood, world)
+    return True
+
+
+async def run_with_lease(store: SessionStore, key: str, owner: str, coro):
+    # 세계관 생성이 임대 시간보다 길어져도 다른 워커가 같은 풀을 채우지 않도록 도중에 임대를 연장
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=SESSION_LOCK_LEASE / 3)
+            if done:
+                return task.result()
+            if not store.renew(key, owner):
+                # 임대를 잃었으면 (다른 워커가 이어받았을 수 있음) 이번 생성은 버린다
+                raise SessionBusy(key)
+    finally:
+        task.cancel()
+
+
+async def refill_loop(pool: WorldPool, store: SessionStore) -> None:
+    settings = load_pool_settings()
+    if not settings:
+        return
+    owner = uuid.uuid4().hex
+    # 풀 채우기는 플레이어 요청보다 항상 뒤로 밀린다
+    set_llm_priority(PRIORITY_PREFETCH)
+    while True:
+        built = False
+        # 여러 워커 중 한 곳에서만 채우도록 임대 락 사용
+        if in_refill_window() and store.try_acquire("world_pool_refill", owner):
+            try:
+                built = await run_with_lease(store, "world_pool_refill", owner, refill_step(pool, settings))
+            except Exception as e:
+                print("풀 세계관 생성 중 오류 발생:", e)
+            finally:
+                store.release("world_pool_refill", owner)
+        await asyncio.sleep(1 if built else WORLD_POOL_INTERVAL)